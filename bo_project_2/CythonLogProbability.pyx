@@ -3,8 +3,7 @@
 # ------------------------------
 
 import math
-
-eps = 1e200
+import logsumexp
 
 cdef double inf, neg_inf, nan
 
@@ -51,37 +50,7 @@ cdef class LogProbability(object):
     
         assert(self.is_valid())
         assert(other.is_valid())
-        
-        cdef double x, y
-        
-        x = self.logv
-        y = other.logv
-        
-        if x == neg_inf:
-            return other
-            
-        if y == neg_inf:
-            return self
-        
-        assert(is_finite(x))
-        assert(is_finite(y))
-        if x < (y - eps):
-            return other
-        if y < (x - eps):
-            return self
-        
-        diff = x - y
-        assert(is_finite(diff))
-        assert(is_finite(x))
-        assert(is_finite(y))
-        
-        if not is_finite(math.exp(diff)):
-            return x if x > y else y
-        
-        cdef double logv
-        
-        logv = y + math.log(1.0 + math.exp(diff))
-        return LogProbability(logv, logarithmic=True)        
+        return LogProbability(logsumexp.add(self.logv, other.logv), logarithmic=True)
         
     def __mul__(LogProbability self, obj):
         assert(self.is_valid())
@@ -1,9 +1,15 @@
-try:
-    import CythonLogProbability
-    from CythonLogProbability import LogProbability
-except:
-    print '*** WARNING *** Could not load cython module, this means that code might be much slower'
+import os
+
+# LOGPROBABILITY=python selects the python implementation even if the cython module can be built (e.g. for benchmark.py)
+if os.environ.get('LOGPROBABILITY') == 'python':
     from PythonLogProbability import LogProbability
+else:
+    try:
+        import CythonLogProbability
+        from CythonLogProbability import LogProbability
+    except:
+        print '*** WARNING *** Could not load cython module, this means that code might be much slower'
+        from PythonLogProbability import LogProbability
     
 lf = LogProbability(0.2)
 lf2 = LogProbability(0.2)
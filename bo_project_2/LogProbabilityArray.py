@@ -0,0 +1,173 @@
+# ------------------------------
+# LogProbVector, LogProbMatrix
+# ------------------------------
+
+import unittest
+import numpy
+
+import logsumexp
+from LogProbability import LogProbability
+
+neg_inf = float('-infinity')
+
+def convert_array(obj):
+    """returns the log values of a LogProbVector, a LogProbability or a (nested list or array of) LogProbability objects or plain probabilities"""
+    if isinstance(obj, LogProbVector):
+        return obj.logv
+    elif isinstance(obj, LogProbability):
+        return numpy.float64(obj.logv)
+    elif type(obj) in (list, tuple) and any(isinstance(item, (LogProbability, list, tuple)) for item in obj):
+        return numpy.array([convert_array(item) for item in obj])
+    elif type(obj) in (float, int, list, tuple, numpy.ndarray):
+        values = numpy.asarray(obj, dtype=numpy.float64)
+        result = numpy.empty(values.shape)
+        result.fill(neg_inf)
+        positive = values > 0.0
+        result[positive] = numpy.log(values[positive])
+        return result
+    else:
+        raise NotImplementedError("There's no conversion defined for this type")
+
+def wrap_array(logv):
+    """returns log values as LogProbability (scalar), LogProbVector (one dimension) or LogProbMatrix (two dimensions)"""
+    if numpy.ndim(logv) == 0:
+        return LogProbability(float(logv), logarithmic=True)
+    elif numpy.ndim(logv) == 1:
+        return LogProbVector(logv, logarithmic=True)
+    return LogProbMatrix(logv, logarithmic=True)
+
+class LogProbVector(object):
+    """A vector of floating point probabilities stored in log-format in one contiguous float64 array
+    the operators work element-wise like the ones of LogProbability, the operands are broadcast like numpy arrays
+    (a LogProbability or a vector is combined with every row of a matrix), sum, max and dot reduce whole arrays at once"""
+    def __init__(self, values, logarithmic=False):
+        if logarithmic:
+            self.logv = numpy.asarray(values, dtype=numpy.float64)
+        else:
+            self.logv = convert_array(values)
+
+    @classmethod
+    def zeros(cls, *shape):
+        """returns a vector (or matrix) of the given shape with all probabilities 0"""
+        logv = numpy.empty(shape)
+        logv.fill(neg_inf)
+        return cls(logv, logarithmic=True)
+
+    @property
+    def shape(self):
+        return self.logv.shape
+
+    def __len__(self):
+        return len(self.logv)
+
+    def __iter__(self):
+        for logv in self.logv:
+            yield wrap_array(logv)
+
+    def __getitem__(self, index):
+        return wrap_array(self.logv[index])
+
+    def __setitem__(self, index, obj):
+        self.logv[index] = convert_array(obj)
+
+    def __add__(self, obj):
+        return wrap_array(logsumexp.logaddexp(self.logv, convert_array(obj)))
+
+    __radd__ = __add__
+
+    def __mul__(self, obj):
+        return wrap_array(self.logv + convert_array(obj))
+
+    __rmul__ = __mul__
+
+    def __div__(self, obj):
+        return wrap_array(self.logv - convert_array(obj))
+
+    __truediv__ = __div__
+
+    def sum(self, axis=None):
+        """returns the sum of the probabilities (along an axis), computed as one log-sum-exp"""
+        return wrap_array(logsumexp.logsumexp(self.logv, axis=axis))
+
+    def max(self, axis=None):
+        return wrap_array(self.logv.max(axis=axis))
+
+    def argmax(self, axis=None):
+        return self.logv.argmax(axis=axis)
+
+    def dot(self, obj):
+        """returns the product of two vectors, a vector and a matrix or two matrices like numpy.dot, with probabilities:
+        the products of the pairs are added with log-sum-exp"""
+        return wrap_array(logsumexp.logsumexp(self._pairs(obj), axis=0))
+
+    def max_dot(self, obj):
+        """like dot, but the products of the pairs are maximized instead of added
+        returns the maximum and the index of the maximizing pair (the row of obj, or the column of self)"""
+        pairs = self._pairs(obj)
+        # the maximum is read at the maximizing index instead of reducing the pairs a second time
+        best = pairs.argmax(axis=0)
+        return (wrap_array(numpy.take_along_axis(pairs, best[numpy.newaxis], axis=0)[0]), best)
+
+    def _pairs(self, obj):
+        """returns the log products of the pairs of dot, the pairs of an entry of the result are along the first axis"""
+        other = convert_array(obj)
+        if self.logv.ndim == 1 and other.ndim == 2:
+            return self.logv[:, numpy.newaxis] + other
+        elif self.logv.ndim == 2 and other.ndim == 1:
+            return self.logv.T + other[:, numpy.newaxis]
+        elif self.logv.ndim == 2:
+            return self.logv.T[:, :, numpy.newaxis] + other[:, numpy.newaxis, :]
+        return self.logv + other
+
+    def probabilities(self):
+        """returns the probabilities as a numpy array"""
+        return numpy.exp(self.logv)
+
+    def __str__(self):
+        return '[%s]' % (', '.join(str(item) for item in self), )
+
+    def __repr__(self):
+        return self.__str__()
+
+class LogProbMatrix(LogProbVector):
+    """A matrix of floating point probabilities stored in log-format in one contiguous float64 array"""
+    @staticmethod
+    def outer(u, v):
+        """returns the matrix of the products u[i] * v[j]"""
+        return LogProbMatrix(convert_array(u)[:, numpy.newaxis] + convert_array(v), logarithmic=True)
+
+    @property
+    def T(self):
+        return LogProbMatrix(self.logv.T, logarithmic=True)
+
+class TestLogProbVector(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.RandomState(0)
+        # some probabilities are 0
+        self.u = random.rand(3) * (random.rand(3) > 0.2)
+        self.m = random.rand(3, 4) * (random.rand(3, 4) > 0.2)
+        self.n = random.rand(4, 2)
+        self.w = random.rand(4)
+
+    def assertProbabilities(self, expected, result):
+        self.assertTrue(numpy.allclose(expected, numpy.exp(convert_array(result))))
+
+    def test_dot(self):
+        u, m, n, w = self.u, self.m, self.n, self.w
+        self.assertAlmostEqual(u.dot(u), float(LogProbVector(u).dot(u)))
+        self.assertProbabilities(u.dot(m), LogProbVector(u).dot(LogProbMatrix(m)))
+        self.assertProbabilities(m.dot(w), LogProbMatrix(m).dot(w))
+        self.assertProbabilities(m.dot(n), LogProbMatrix(m).dot(LogProbMatrix(n)))
+
+    def test_max_dot(self):
+        u, m, n, w = self.u, self.m, self.n, self.w
+        for result, pairs in ((LogProbVector(u).max_dot(LogProbMatrix(m)), u[:, numpy.newaxis] * m),
+                              (LogProbMatrix(m).max_dot(w), (m * w).T),
+                              (LogProbMatrix(m).max_dot(LogProbMatrix(n)), m.T[:, :, numpy.newaxis] * n[:, numpy.newaxis, :])):
+            self.assertProbabilities(pairs.max(axis=0), result[0])
+            self.assertTrue((pairs.argmax(axis=0) == result[1]).all())
+
+    def test_convert_array(self):
+        logv = convert_array([[LogProbability(0.5), LogProbability(0.0)], [0.25, 1.0]])
+        self.assertTrue(numpy.allclose(numpy.log([[0.5, 0.0], [0.25, 1.0]]), logv))
+        self.assertEqual(neg_inf, logv[0, 1])
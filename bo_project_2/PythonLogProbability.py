@@ -3,8 +3,7 @@
 # ------------------------------
 
 import math
-
-eps = 1e200
+import logsumexp
 
 inf = float('infinity')
 neg_inf = float('-infinity')
@@ -44,32 +43,7 @@ class LogProbability(object):
     
         assert(self.is_valid())
         assert(other.is_valid())
-        x = self.logv
-        y = other.logv
-        
-        if x == neg_inf:
-            return other
-            
-        if y == neg_inf:
-            return self
-        
-        assert(is_finite(x))
-        assert(is_finite(y))
-        if x < (y - eps):
-            return other
-        if y < (x - eps):
-            return self
-        
-        diff = x - y
-        assert(is_finite(diff))
-        assert(is_finite(x))
-        assert(is_finite(y))
-        
-        if not is_finite(math.exp(diff)):
-            return x if x > y else y
-        
-        logv = y + math.log(1.0 + math.exp(diff))
-        return LogProbability(logv, logarithmic=True)        
+        return LogProbability(logsumexp.add(self.logv, other.logv), logarithmic=True)
         
     def __mul__(self, obj):
         assert(self.is_valid())
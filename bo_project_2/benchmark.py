@@ -0,0 +1,83 @@
+"""Runs the forward, backward and viterbi algorithms and the joint analysis of hmm.py, and the brute force algorithm on
+the short sentences, on every test sentence and prints one json line per algorithm with the sentence lengths, the latencies and the peak memory
+
+The benchmark of project_2 (project_2/hmm-pos-tagging/src/benchmark.py) starts this script once per LogProbability
+implementation (LOGPROBABILITY=python or cython, see LogProbability.py) and summarizes the lines.
+
+usage: python benchmark.py [resource_path] [brute_force_length]
+"""
+import pyximport
+pyximport.install()
+
+import os
+import sys
+import json
+import time
+import resource
+import multiprocessing
+
+import fileparser
+import hmm
+import main
+from LogProbability import LogProbability
+
+def resident_kb():
+    """Returns the current resident memory of the process in kB (None if /proc is not available)"""
+    try:
+        return int(open('/proc/self/statm').read().split()[1]) * resource.getpagesize() / 1024
+    except IOError:
+        return None
+
+def measure(function, sentence_list, queue):
+    """Runs function on every sentence and puts the latencies and the peak memory of the process on the queue"""
+    try:
+        start_kb = resident_kb()
+        latencies = []
+        for words in sentence_list:
+            start = time.time()
+            function(words)
+            latencies.append(time.time() - start)
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        queue.put((latencies, peak_kb, peak_kb - start_kb if start_kb is not None else None))
+    except Exception as error:
+        # the parent waits for a result, hence the error is put on the queue instead
+        queue.put(error)
+
+def run_isolated(function, sentence_list):
+    """Runs measure in a forked process, so that the peak memory belongs to this algorithm only"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(function, sentence_list, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def benchmark(brute_force_length=3):
+    """Trains the graph on the training files and prints the result line of every algorithm"""
+    aa = {}
+    bb = {}
+    file_list = os.listdir(fileparser.resource_path)
+    main.train(aa, bb, fileparser.iter_parse([fileparser.resource_path + file for file in file_list if file.startswith(fileparser.training_prefix)]), set([]))
+    main.graph = main.build_graph(aa, bb)
+    a, b, vocab, suffix_model = main.graph
+    # the observations (and the emissions of their unknown words) are prepared before any algorithm is timed
+    sentence_list = [main.observations(sentence) for sentence in fileparser.iter_parse([fileparser.resource_path + file for file in file_list if file.startswith(fileparser.test_prefix)])]
+    implementation = 'bo-%s' % ('cython' if LogProbability.__module__.startswith('Cython') else 'python', )
+    algorithms = [
+        ('forward', lambda words: hmm.forward_algorithm(words, a, b, forward={}), sentence_list),
+        ('backward', lambda words: hmm.backward_algorithm(words, a, b, backward={}), sentence_list),
+        ('viterbi', lambda words: hmm.viterbi(words, a, b), sentence_list),
+        ('analyze', lambda words: hmm.analyze(words, a, b), sentence_list),
+        ('brute_force', lambda words: hmm.brute_force_algorithm(words, a, b), [words for words in sentence_list if len(words) <= brute_force_length])]
+    for algorithm, function, sentences in algorithms:
+        latencies, peak_kb, increase_kb = run_isolated(function, sentences)
+        print json.dumps({'implementation': implementation, 'algorithm': algorithm, 'lengths': [len(words) for words in sentences],
+            'latencies': latencies, 'peak_rss_kb': peak_kb, 'rss_increase_kb': increase_kb})
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        fileparser.resource_path = sys.argv[1]
+    benchmark(*[int(arg) for arg in sys.argv[2:3]])
@@ -1,3 +1,5 @@
+import itertools
+
 resource_path = 'training/'
 test_prefix = ('test', )
 training_prefix = ('train', )
@@ -9,8 +11,15 @@ sentence_separator = ('.', '?', '!')
 START = '<s>'
 END = '</s>'
 
+# the normalized form of every distinct word, interned so that all occurrences of a word share one string
+_normalized = {}
+
 def normalize_word(word):
-    return word.strip().upper()
+    """returns the upper case form of a word, every distinct word is normalized only once"""
+    normalized = _normalized.get(word)
+    if normalized is None:
+        normalized = _normalized[word] = intern(word.strip().upper())
+    return normalized
 
 def filter_unused_lines(line):
     """ extracts all relevant lines """
@@ -29,20 +38,39 @@ def map_extract_word(term):
 def map_extract_tag(term):
     return term.split('/')[1].split('|')[0]
 
-def parse(file):
-    """ parses the file in the 'Penn Treebank annotation style for POS tags' into a list of sequences of word/tag constructs """
-    line_list = file.readlines()
-    line_list = filter(filter_unused_lines, line_list)
-    sentence_list = []
+def iter_sentences(lines):
+    """ lazily parses an iterable of lines in the 'Penn Treebank annotation style for POS tags' into sequences of word/tag constructs """
+    lines = itertools.ifilter(filter_unused_lines, lines)
     sentence = []
-    for line in line_list:
+    for line in lines:
         line = filter(filter_unused_strings, line)
         term_list = line.split()
         for term in term_list:
             sentence.append(term)
             if term.startswith(sentence_separator):
                 s = [tuple(x.split('/')) for x in sentence]
-                s = [(normalize_word(x[0]), x[1]) for x in s]
-                sentence_list.append(s)
+                s = [(normalize_word(x[0]), intern(x[1])) for x in s]
+                yield s
                 sentence = []
-    return sentence_list
\ No newline at end of file
+
+def iter_parse(source):
+    """ lazily parses a file handle, a path or an iterable of paths and yields one sentence at a time
+        the sentences are the same as the ones of parse, sentences never span two files
+    """
+    if hasattr(source, 'read'):
+        for sentence in iter_sentences(source):
+            yield sentence
+        return
+    if isinstance(source, basestring):
+        source = [source]
+    for path in source:
+        file = open(path, 'r')
+        try:
+            for sentence in iter_sentences(file):
+                yield sentence
+        finally:
+            file.close()
+
+def parse(file):
+    """ parses the file in the 'Penn Treebank annotation style for POS tags' into a list of sequences of word/tag constructs """
+    return list(iter_sentences(file))
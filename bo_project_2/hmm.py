@@ -5,7 +5,9 @@ import random
 import copy
 import sys
 
+import instrumentation
 from LogProbability import LogProbability
+from LogProbabilityArray import LogProbVector, LogProbMatrix
     
 START = '<s>'
 UNKNOWN = '<unk>'
@@ -38,6 +40,16 @@ def log_graph(a, b):
             b_[x][y] = LogProbability(b[x][y])
             
     return (a_, b_)
+
+def graph_arrays(seq, a, b):
+    """Returns the states of the graph (a, b) and its start, transition, end and emission probabilities
+    for the observations seq as log probability arrays, state i of the arrays is states(a, b)[i]"""
+    state_list = states(a, b)
+    start = LogProbVector([a[(START, s)] for s in state_list])
+    transitions = LogProbMatrix([[a[(s2, s)] for s in state_list] for s2 in state_list])
+    end = LogProbVector([a[(s, END)] for s in state_list])
+    emissions = LogProbMatrix([[b[s][o] for s in state_list] for o in seq])
+    return (state_list, start, transitions, end, emissions)
     
 # ------------------------------
 # Brute force algorithm
@@ -63,38 +75,56 @@ def brute_force_algorithm(seq, a, b, num=LogProbability):
 # Implementation of the forward algorithm, as described in [1]
 #
 # [1] Speech and language processing, Jurafsky, D. and Martin, J. H.
+def forward_table(start, transitions, emissions):
+    """Returns the forward probabilities alpha[t-1, i] of the arrays of graph_arrays"""
+    T = len(emissions)
+    alpha = LogProbMatrix.zeros(T, len(start))
+    alpha[0] = start*emissions[0]
+    	
+    # Recursion step
+    for t in xrange(2, T+1):
+        alpha[t-1] = alpha[t-2].dot(transitions)*emissions[t-1]
+    return alpha
+
 def forward_algorithm(seq, a, b, num=LogProbability, forward={}):
     # Initialization step
     T = len(seq)
     forward.clear()
-    for state in states(a, b):
-        forward[(state, 1)] = a[(START, state)]*b[state][seq[0]]
-    	
-    # Recursion step
-    for t in xrange(2, len(seq)+1):
-        for s in states(a, b):
-            forward[(s, t)] = sum([forward[s2, t-1]*a[(s2, s)]*b[s][seq[t-1]] for s2 in states(a, b)], num(0))
-         
-    forward[END, T] = sum([a[s, END]*forward[(s, T)] for s in states(a, b)], num(0))
+    state_list, start, transitions, end, emissions = graph_arrays(seq, a, b)
+    alpha = forward_table(start, transitions, emissions)
+    
+    for t in xrange(1, T+1):
+        for i, s in enumerate(state_list):
+            forward[(s, t)] = alpha[t-1, i]
+    forward[END, T] = alpha[T-1].dot(end)
     return forward[END, T]
 
 # ------------------------------
 # Backward algorithm
 # ------------------------------
+def backward_table(transitions, end, emissions):
+    """Returns the backward probabilities beta[t-1, j] of the arrays of graph_arrays"""
+    T = len(emissions)
+    beta = LogProbMatrix.zeros(T, len(end))
+    beta[T-1] = end
+        
+    # Recursion
+    for t in xrange(T-1, 0, -1):
+        beta[t-1] = transitions.dot(emissions[t]*beta[t])
+    return beta
+
 def backward_algorithm(seq, a, b, num=LogProbability, backward={}):
     # Initialization step
     backward.clear()
     T = len(seq)
-    for state in states(a, b):
-        backward[(T, state)] = a[(state, END)]
-        
-    # Recursion
-    for t in xrange(T-1, 0, -1):
-        for i in states(a, b):
-            backward[(t, i)] = sum([a[(i, j)]*b[j][seq[t]]*backward[(t+1, j)] for j in states(a, b)], num(0))
+    state_list, start, transitions, end, emissions = graph_arrays(seq, a, b)
+    beta = backward_table(transitions, end, emissions)
     
+    for t in xrange(1, T+1):
+        for j, s in enumerate(state_list):
+            backward[(t, s)] = beta[t-1, j]
     # Termination
-    backward[(T, END)] = sum([a[(START, j)]*b[j][seq[0]]*backward[(1, j)] for j in states(a, b)], num(0))
+    backward[(T, END)] = (start*emissions[0]).dot(beta[0])
     return backward[(T, END)]
 	
 class TestAlgorithm(object):
@@ -130,37 +160,80 @@ class TestBackwardAlgorithm(unittest.TestCase, TestAlgorithm):
 # ------------------------------
 # Viterbi algorithm
 # ------------------------------
-def viterbi(o, a, b, num=LogProbability):
+def viterbi_path(state_list, start, transitions, end, emissions):
+    """Returns the most likely state sequence of the arrays of graph_arrays"""
     # Initialization
-    T = len(o)
-    viterbi = {}
-    backpointer = {}
-    for s in states(a, b):
-        viterbi[(s, 1)] = a[(START, s)] * b[s][o[0]]
-        backpointer[(s, 1)] = None
+    T = len(emissions)
+    delta = start*emissions[0]
+    backpointers = []
     
-    # Recursion step
+    # Recursion step, the best predecessor of every state is kept per time step
     for t in xrange(2, T+1):
-        for s in states(a, b):
-            viterbi[(s, t)] = max([viterbi[(s2, t-1)]*a[(s2, s)]*b[s][o[t-1]] for s2 in states(a, b)])
-            backpointer[(s, t)] = max([(viterbi[(s2, t-1)]*a[(s2, s)], s2) for s2 in states(a, b)])[1]
+        best, best_s2 = delta.max_dot(transitions)
+        delta = best*emissions[t-1]
+        backpointers.append(best_s2)
     
     # Termination step
-    viterbi[(END, T)] = max([viterbi[(s, T)]*a[(s, END)] for s in states(a, b)])
-    backpointer[(END, T)] = max([([viterbi[(s, T)]*a[(s, END)]], s) for s in states(a, b)])[1]
-    
-    # Follow path back
-    result = []
-    token = END
-    t = T
+    best, best_s = delta.max_dot(end)
     
-    while backpointer.has_key((token, t)) and backpointer[(token, t)] is not None:
-        assert 0 < t <= T, (("should be 0 < t <= T, but t=%s" % t))
-        token = backpointer[(token, t)]
-        t -= 1
-        result = [token] + result
-        
-    return result
+    # Follow path back, backpointers[t-2] holds the best state at t-1 of every state at t
+    path = [best_s]
+    for best_s2 in reversed(backpointers):
+        path.append(best_s2[path[-1]])
+    return [state_list[i] for i in reversed(path)]
+
+def viterbi(o, a, b, num=LogProbability):
+    state_list, start, transitions, end, emissions = graph_arrays(o, a, b)
+    return viterbi_path(state_list, start, transitions, end, emissions)
+
+# ------------------------------
+# Joint analysis
+# ------------------------------
+def analyze(seq, a, b, instruments=None):
+    """Runs the forward, backward and viterbi recursions over one set of arrays of graph_arrays and returns the forward
+    and backward likelihoods, the viterbi state sequence and the posteriors, posteriors[t-1, i] = P(state i at t | seq)
+
+    The arrays, forward, backward and viterbi stages are recorded by instruments (see instrumentation.Instrumentation).
+    """
+    instruments = instruments or instrumentation.DISABLED
+    T = len(seq)
+    with instruments.stage('arrays', 1, T):
+        state_list, start, transitions, end, emissions = graph_arrays(seq, a, b)
+    with instruments.stage('forward', 1, T):
+        alpha = forward_table(start, transitions, emissions)
+        forward_p = alpha[T-1].dot(end)
+    with instruments.stage('backward', 1, T):
+        beta = backward_table(transitions, end, emissions)
+        backward_p = (start*emissions[0]).dot(beta[0])
+    with instruments.stage('viterbi', 1, T):
+        path = viterbi_path(state_list, start, transitions, end, emissions)
+    posteriors = LogProbMatrix(alpha.logv + beta.logv - forward_p.logv, logarithmic=True)
+    return (forward_p, backward_p, path, posteriors)
+
+class TestAnalyzeAlgorithm(unittest.TestCase, TestAlgorithm):
+    def setUp(self):
+        self.algorithm = lambda seq, a, b: analyze(seq, a, b)[0]
+
+class TestViterbiAlgorithm(unittest.TestCase):
+    def test_weather(self):
+        """Compares the path of the example of TestAlgorithm with the most likely one of all paths"""
+        a, b = log_graph({
+            (START, 'HOT'): 0.8, (START, 'COLD'): 0.2,
+            ('HOT', 'COLD'): 0.2, ('HOT', 'HOT'): 0.7, ('HOT', END): 0.1,
+            ('COLD', 'COLD'): 0.5, ('COLD', 'HOT'): 0.4, ('COLD', END): 0.1
+        }, {
+            'HOT': {'1': 0.2, '2': 0.4, '3': 0.4},
+            'COLD': {'1': 0.5, '2': 0.4, '3': 0.1}
+        })
+        for seq in (['3'], ['3', '1'], ['3', '1', '3'], ['1', '1', '2', '3', '1']):
+            def probability(path):
+                p = a[(START, path[0])]*b[path[0]][seq[0]]*a[(path[-1], END)]
+                for t in xrange(1, len(seq)):
+                    p *= a[(path[t-1], path[t])]*b[path[t]][seq[t]]
+                return float(p)
+            best = max(itertools.product(['HOT', 'COLD'], repeat=len(seq)), key=probability)
+            self.assertEqual(list(best), viterbi(seq, a, b))
+            self.assertEqual(list(best), analyze(seq, a, b)[2])
         
 # ------------------------------
 # Forward backward algorithm
@@ -205,38 +278,37 @@ def forward_backward(observations, vocabulary, state_set, num=LogProbability):
         print '---'
         changed = False
         
-        # E-step
-        alpha = {}
-        beta = {}
-        forward_algorithm(observations, a, b, forward=alpha, num=num)
-        backward_algorithm(observations, a, b, backward=beta, num=num)
+        # E-step, the graph is converted to arrays once for the forward and the backward tables (see analyze)
+        state_list, start, transitions, end, emissions = graph_arrays(observations, a, b)
+        forward = forward_table(start, transitions, emissions)
+        backward = backward_table(transitions, end, emissions)
+        likelihood = forward[T-1].dot(end)
         
-        impl_states = state_set + [END]
+        # The expected transition (N x N) and emission (N x V) counts are accumulated one
+        # time step at a time, the posteriors of the single time steps are not kept
+        word_index = dict((w, k) for k, w in enumerate(vocabulary))
+        expected_transitions = LogProbMatrix.zeros(len(state_list), len(state_list))
+        expected_emissions = LogProbMatrix.zeros(len(state_list), len(vocabulary))
         
-        y = {}
-        e = {}
-        
-        for t, j in itertools.product(xrange(1, T+1), state_set):
-            y[(t, j)] = alpha[(j, t)]*beta[(t, j)] / alpha[(END, T)]
-        
-        for t, i, j in itertools.product(xrange(1, T), state_set, state_set):
-            e[(t, i, j)] = (alpha[(i, t)]*a[(i, j)]*b[j][observations[t]]*beta[(t+1, j)]) / alpha[(END, T)]
+        for t in xrange(1, T):
+            expected_transitions += transitions*LogProbMatrix.outer(forward[t-1], emissions[t]*backward[t]) / likelihood
+        for t in xrange(1, T+1):
+            k = word_index[observations[t-1]]
+            expected_emissions[:, k] = expected_emissions[:, k] + forward[t-1]*backward[t-1] / likelihood
         
         # M-step
         a_ = copy.copy(a)
         b_ = copy.copy(b)
         
-        for i, j in itertools.product(state_set, state_set):
-            c = sum([e[(t, i, j)] for t in xrange(1, T)], num(0.0))
-            d = sum([e[(t, i, k)] for k in state_set for t in xrange(1, T)], num(0.0))
-            a_[(i, j)] = c / d
-            
-        for j in b.iterkeys():
-            b_[j] = {}
-            for vk in b[j].iterkeys():
-                c = sum([y[(t, j)] for t in xrange(1, T) if observations[t-1] == vk], num(0.0))
-                d = sum([y[(t, j)] for t in xrange(1, T)], num(0.0))
-                b_[j][vk] = c / d
+        transition_totals = expected_transitions.sum(axis=1)
+        for (i, s_i), (j, s_j) in itertools.product(enumerate(state_list), enumerate(state_list)):
+            a_[(s_i, s_j)] = expected_transitions[i, j] / transition_totals[i]
+        
+        emission_totals = expected_emissions.sum(axis=1)
+        for j, s in enumerate(state_list):
+            b_[s] = {}
+            for vk in b[s].iterkeys():
+                b_[s][vk] = expected_emissions[j, word_index[vk]] / emission_totals[j]
         
         print_graph(a, b)
         
@@ -263,6 +335,13 @@ class TestForwardBackward(unittest.TestCase):
     def setUp(self):
         pass
         
+    def test_emission_counts(self):
+        """The states of a uniform model stay identical, their emissions are the frequencies of all words including the last one"""
+        a, b = forward_backward(['a', 'b', 'c', 'c'], ['a', 'b', 'c'], ['X', 'Y'])
+        for s in ['X', 'Y']:
+            self.assertAlmostEqual(0.25, float(b[s]['a']))
+            self.assertAlmostEqual(0.5, float(b[s]['c']))
+        
     def test_icecream(self):
         states = ['HOT', 'COLD']
         a = {
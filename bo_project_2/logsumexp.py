@@ -0,0 +1,36 @@
+"""The log-sum-exp kernels of all algorithms: log(exp(x) + exp(y)) of two log probabilities (add for floats, logaddexp for arrays),
+log(sum(exp(values))) along an axis of an array (logsumexp)
+the sums are shifted by their largest term, hence they neither overflow nor underflow, and log probabilities of -infinity
+(probability 0) are neutral: a sum of nothing but -infinity is -infinity"""
+import math
+import numpy
+
+neg_inf = float('-infinity')
+
+logaddexp = numpy.logaddexp
+
+def add(x, y):
+    """Returns log(exp(x) + exp(y)) of two float log probabilities"""
+    if x == neg_inf:
+        return y
+    if y == neg_inf:
+        return x
+    if x < y:
+        (x, y) = (y, x)
+    return x + math.log1p(math.exp(y - x))
+
+def _shift(peak):
+    """The largest terms of sums, infinite ones (sums of -infinity only) are replaced by 0 in order not to compute -inf - -inf"""
+    return numpy.where(numpy.isfinite(peak), peak, 0.0)
+
+def logsumexp(values, axis=None):
+    """Returns log(sum(exp(values))) along an axis of an array, or of all values as a float if axis is None"""
+    values = numpy.asarray(values, dtype=float)
+    if values.size == 0:
+        return numpy.full(numpy.delete(values.shape, axis), neg_inf) if axis is not None else neg_inf
+    shift = _shift(values.max(axis=axis, keepdims=True))
+    with numpy.errstate(divide='ignore'): # log(0) is -infinity
+        result = numpy.log(numpy.exp(values - shift).sum(axis=axis, keepdims=True)) + shift
+    if axis is None:
+        return float(result.ravel()[0])
+    return numpy.squeeze(result, axis=axis)
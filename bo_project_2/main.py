@@ -4,6 +4,11 @@ pyximport.install()
 import fileparser
 import os
 import hmm
+import unknownwords
+import instrumentation
+import multiprocessing
+import collections
+import itertools
 
 from LogProbability import LogProbability
 
@@ -42,23 +47,104 @@ def train(transition_map, emission_map, sentence_list, vocabulary):
             previous = tag
         increment_transitions(transition_map, fileparser.END, previous)
 
-def main():
-    aa = {}
-    bb = {}
-    vocabulary = set([])
+def count_file(path):
+    """counts the transition and emission frequencies of a training file into mergeable count tables: lists of
+    (key, frequency) pairs in the order in which train encounters every key for the first time"""
+    transitions = collections.OrderedDict()
+    emissions = collections.OrderedDict()
+    words = collections.OrderedDict()
+    for sentence in fileparser.iter_parse(path):
+        previous = fileparser.START
+        for word, tags in sentence:
+            word = fileparser.normalize_word(word)
+            words[word] = None
+            tag = tags.split('|')[0]
+            transitions[(previous, tag)] = transitions.get((previous, tag), 0.0) + 1.0
+            emissions[(tag, word)] = emissions.get((tag, word), 0.0) + 1.0
+            previous = tag
+        transitions[(previous, fileparser.END)] = transitions.get((previous, fileparser.END), 0.0) + 1.0
+    return (transitions.items(), emissions.items(), words.keys())
 
-    file_list = os.listdir(fileparser.resource_path)
-    # training
-    print('Training...')
-    for file in file_list:
-        if file.startswith(fileparser.training_prefix):
-            training_file = open(fileparser.resource_path + file, 'r')
-            sentence_list = fileparser.parse(training_file)
-            train(aa, bb, sentence_list, vocabulary)
-    print('DONE')
-    
+def merge_counts(transition_map, emission_map, vocabulary, tables):
+    """adds the count tables of count_file to the transition and emission frequencies"""
+    transitions, emissions, words = tables
+    for (given, tag), frequency in transitions:
+        if not transition_map.has_key(given):
+            transition_map[given] = {}
+        transition_map[given][tag] = transition_map[given].get(tag, 0.0) + frequency
+    for (tag, word), frequency in emissions:
+        if not emission_map.has_key(tag):
+            emission_map[tag] = {}
+        emission_map[tag][word] = emission_map[tag].get(word, 0.0) + frequency
+    for word in words:
+        vocabulary.add(word)
+
+def train_files(transition_map, emission_map, path_list, vocabulary, workers):
+    """counts every training file in a separate worker process and merges the count tables in the order of the files,
+    which gives exactly the same frequencies (and key order) as training on the files one after another"""
+    pool = multiprocessing.Pool(workers)
+    try:
+        table_list = pool.map(count_file, path_list)
+    finally:
+        pool.close()
+        pool.join()
+    for tables in table_list:
+        merge_counts(transition_map, emission_map, vocabulary, tables)
+
+# the trained model (a, b, vocab, suffix_model), set before the worker processes are forked so that they share it read-only
+graph = None
+# the counters and timers of the stages of the running main (see instrumentation.Instrumentation), set before the worker
+# processes are forked like graph, the ones of the worker processes are not reported
+stage_instruments = instrumentation.DISABLED
+
+def unknown_observation(word):
+    """returns the observation of a word which is not part of the vocabulary: hmm.UNKNOWN followed by the key of its longest
+    known suffix (see unknownwords.SuffixModel), the emissions of the observation are added to b the first time"""
+    a, b, vocab, suffix_model = graph
+    key = suffix_model.key(word)
+    observation = hmm.UNKNOWN + (key or '')
+    if not b[suffix_model.states[0]].has_key(observation):
+        for state, ratio in suffix_model.ratios(key).iteritems():
+            b[state][observation] = b[state][hmm.UNKNOWN] * ratio
+    return observation
+
+def observations(sentence):
+    """returns the words of a parsed sentence, words which are not part of the vocabulary are replaced by their unknown word observation"""
+    a, b, vocab, suffix_model = graph
+    return [(word if word in vocab else unknown_observation(word)) for word, tag in sentence]
+
+def analyze_sentences(sentence_list):
+    """returns the words, the forward and backward log probabilities, the human and the most likely tag sequence of a list
+    of parsed sentences, the arrays of every sentence are built once for all three algorithms (see hmm.analyze)"""
+    a, b, vocab, suffix_model = graph
+    results = []
+    for sentence in sentence_list:
+        words = observations(sentence)
+        forward_p, backward_p, tagger_sequence, posteriors = hmm.analyze(words, a, b, stage_instruments)
+        results.append((words, forward_p.logv, backward_p.logv, [tag for word, tag in sentence], tagger_sequence))
+    return results
+
+def chunks(iterable, size):
+    """lazily splits an iterable into lists of at most size consecutive items"""
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+def map_chunks(function, pool, sentence_iter, chunksize):
+    """lazily applies function to chunks of the sentences, in the worker pool if there is one, and yields the results in order"""
+    if pool is None:
+        results = itertools.imap(function, chunks(sentence_iter, chunksize))
+    else:
+        results = pool.imap(function, chunks(sentence_iter, chunksize))
+    for chunk_results in results:
+        for result in chunk_results:
+            yield result
+
+def build_graph(aa, bb):
+    """returns the graph (a, b, vocab, suffix_model) of the transition and emission frequencies, b is laplace smoothed"""
     # transform into a and b
-    t_start = time.time()
     a = {}
     b = {}
     user_states = list(aa.iterkeys())
@@ -82,15 +168,41 @@ def main():
         b[state] = {}
         for output in vocab.iterkeys():
             b[state][output] = LogProbability(bb.get(state, {}).get(output, 0.0) + 1.0) / (sum_emmited + len(vocab))
+        # the smoothed probability of a word which was never seen, weighted by the suffix model for every unknown word
+        b[state][hmm.UNKNOWN] = LogProbability(1.0) / (sum_emmited + len(vocab))
 
-    # Calculate average of singleton words
+    # Train the unknown word model once, the emissions of an unknown word are looked up by its suffix (see unknown_observation)
+    suffix_model = unknownwords.SuffixModel.train(bb)
+    return (a, b, vocab, suffix_model)
+
+def main(workers=None, chunksize=16, instruments=None):
+    """trains the tagger and tags the test files, if workers is given the training files are counted in that many
+    worker processes and the test sentences are distributed in chunks of chunksize sentences over the workers
+    the stages are recorded by instruments (see instrumentation.Instrumentation) if it is given"""
+    global graph, stage_instruments
+    instruments = instruments or instrumentation.DISABLED
+    stage_instruments = instruments
+    aa = {}
+    bb = {}
+    vocabulary = set([])
+
+    file_list = os.listdir(fileparser.resource_path)
+    training_paths = [fileparser.resource_path + file for file in file_list if file.startswith(fileparser.training_prefix)]
+    test_paths = [fileparser.resource_path + file for file in file_list if file.startswith(fileparser.test_prefix)]
+    # training
+    print('Training...')
+    with instruments.stage('train'):
+        if workers is None:
+            train(aa, bb, instruments.timed('parse', fileparser.iter_parse(training_paths)), vocabulary)
+        else:
+            train_files(aa, bb, training_paths, vocabulary, workers)
+    print('DONE')
+    
+    t_start = time.time()
+    with instruments.stage('compile'):
+        graph = build_graph(aa, bb)
+    a, b, vocab, suffix_model = graph
     unknown_b = {}
-    singletons = [word for word, count in vocab.iteritems() if count == 1]
-    for s in bb.iterkeys():
-        sm = LogProbability(0.0)
-        for singleton in singletons:
-            sm += b[s].get(singleton, LogProbability(0.0))
-        b[s][hmm.UNKNOWN] = sm / len(singletons)
     
     print hmm.states(a, b)
     
@@ -101,54 +213,38 @@ def main():
         print '**UNKNOWN** %s' % word
         return unknown_b[s]
     
-    # computing likelihood
-    print('computing likelihood...')
-    forward_file = open('forward.txt', 'w')
-    for file in file_list:
-        if file.startswith(fileparser.test_prefix):
-            training_file = open(fileparser.resource_path + file, 'r')
-            sentence_list = fileparser.parse(training_file)
-            for sentence in sentence_list:
-                words = [word for word, tag in sentence]
-                words = [(word if word in vocab else hmm.UNKNOWN) for word in words]
-                
-                forward_table = {}
-                backward_table = {}
-                forward_p = hmm.forward_algorithm(words, a, b, forward=forward_table)
-                backward_p = hmm.backward_algorithm(words, a, b, backward=backward_table)
-                forward_file.write('%s\n %s\n %s\n\n' % (words, forward_p.logv, backward_p.logv))
-    forward_file.close()
-    print('likelihood computed.')
-    print 'Took %ds' % (time.time() - t_start)
+    pool = multiprocessing.Pool(workers) if workers is not None else None
     
-    # computing most likely tag sequencesanc accuracy
-    print('computing most likely tag sequence and tagger accuracy...')
+    # computing likelihood, most likely tag sequences and accuracy in one pass over the test files
+    print('computing likelihood, most likely tag sequence and tagger accuracy...')
+    forward_file = open('forward.txt', 'w')
     match_count = 0.0
     total_count = 0.0
-    for file in file_list:
-        if file.startswith(fileparser.test_prefix):
-            training_file = open(fileparser.resource_path + file, 'r')
-            sentence_list = fileparser.parse(training_file)
-            for sentence in sentence_list:
-                words = [word for word, tag in sentence]
-                words = [(word if word in vocab else hmm.UNKNOWN) for word in words]            
-                
-                tagger_sequence = hmm.viterbi(words, a, b)
-                human_sequence = [tag for word, tag in sentence]
-                
-                #print tagger_sequence
-                #print human_sequence
-                #print '----'
-                
-                # update tagger accuracy information
-                for i in range(min(len(human_sequence), len(tagger_sequence))): # because of underflow it is possible that the tag sequences are not equal in length...s
-                    if tagger_sequence[i] == human_sequence[i]:
-                        match_count = match_count + 1.0
-                total_count = total_count + max(len(human_sequence), len(tagger_sequence))
-                #print('%s\n%s\nProbability: %f\n' % (human_sequence, tagger_sequence, p))
-    print('most likely tag sequence computed.')
+    results = map_chunks(analyze_sentences, pool, instruments.timed('parse', fileparser.iter_parse(test_paths)), chunksize)
+    for words, forward_p, backward_p, human_sequence, tagger_sequence in instruments.timed('analysis', results, lambda result: len(result[0])):
+        forward_file.write('%s\n %s\n %s\n\n' % (words, forward_p, backward_p))
+        #print tagger_sequence
+        #print human_sequence
+        #print '----'
+        
+        # update tagger accuracy information
+        for i in range(min(len(human_sequence), len(tagger_sequence))): # because of underflow it is possible that the tag sequences are not equal in length...s
+            if tagger_sequence[i] == human_sequence[i]:
+                match_count = match_count + 1.0
+        total_count = total_count + max(len(human_sequence), len(tagger_sequence))
+        #print('%s\n%s\nProbability: %f\n' % (human_sequence, tagger_sequence, p))
+    forward_file.close()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    print('likelihood and most likely tag sequence computed.')
+    print 'Took %ds' % (time.time() - t_start)
     print('accuracy of tagger is: %f' % (match_count / total_count, ))
 
 if __name__ == '__main__':    
     print 'Starting program..'
-    main()
+    # TAGGER_INSTRUMENT=1 prints the time of every stage, TAGGER_PROFILE=viterbi profiles a stage
+    run_instruments = instrumentation.Instrumentation.from_environment()
+    if run_instruments is not None:
+        run_instruments.report_at_exit()
+    main(instruments=run_instruments)
@@ -0,0 +1,78 @@
+"""A suffix based model of the tags of unknown words (Brants, TnT 2000)
+
+The tags of the rare words of the training text are counted per word class (see word_class) and suffix of up to
+max_length characters. P(t | suffix) is smoothed by successive abstraction: the estimate of a suffix is interpolated
+with the one of the suffix which is one character shorter, weighted by the standard deviation of the tag probabilities.
+The ratios P(t | suffix) / P(t) of all suffixes are computed once when the model is trained, a word is mapped to the
+key of its longest known suffix once per signature (word class and last max_length characters).
+"""
+import numpy
+
+from LogProbability import LogProbability
+
+def word_class(word):
+    """Returns 'd' for words which contain a digit, 'h' for words with a hyphen and 'w' for all other words
+    (the words are upper case, see fileparser.normalize_word, hence there is no class for capitalized words)"""
+    if any(character.isdigit() for character in word):
+        return 'd'
+    if '-' in word:
+        return 'h'
+    return 'w'
+
+class SuffixModel(object):
+    """The ratios P(t | suffix) / P(t) of the keys (word class and suffix) of the rare training words"""
+    def __init__(self, states, keys, log_ratios, max_length):
+        self.states = list(states)
+        self.key_index = dict((key, k) for k, key in enumerate(keys))
+        self.log_ratios = log_ratios
+        self.max_length = max_length
+        self.signatures = {}
+
+    @classmethod
+    def train(cls, emission_map, max_frequency=10, max_length=10):
+        """Trains the suffix model on the emission frequencies (tag -> word -> frequency) of the words which occur
+        at most max_frequency times"""
+        states = list(emission_map.iterkeys())
+        totals = numpy.array([sum(emission_map[s].itervalues()) for s in states])
+        word_counts = {}
+        for s in states:
+            for word, count in emission_map[s].iteritems():
+                word_counts[word] = word_counts.get(word, 0.0) + count
+        counts = {}
+        for i, s in enumerate(states):
+            for word, count in emission_map[s].iteritems():
+                if word_counts[word] > max_frequency:
+                    continue
+                prefix = word_class(word)
+                for length in range(min(max_length, len(word)) + 1):
+                    key = prefix + word[len(word) - length:]
+                    if not counts.has_key(key):
+                        counts[key] = numpy.zeros(len(states))
+                    counts[key][i] += count
+        p = totals / totals.sum()
+        theta = p.std(ddof=1)
+        # Successive abstraction, the key of the shorter suffix (or of the word class) comes first
+        keys = sorted(counts.iterkeys(), key=len)
+        probabilities = {}
+        for key in keys:
+            shorter = probabilities[key[0] + key[2:]] if len(key) > 1 else p
+            probabilities[key] = (counts[key] / counts[key].sum() + theta * shorter) / (1.0 + theta)
+        log_ratios = numpy.log(numpy.array([probabilities[key] for key in keys]).reshape(len(keys), len(states))) - numpy.log(p)
+        return cls(states, keys, log_ratios, max_length)
+
+    def key(self, word):
+        """Returns the key of the longest known suffix of a word, or None if its word class has no rare words"""
+        signature = word_class(word) + word[-self.max_length:]
+        if not self.signatures.has_key(signature):
+            self.signatures[signature] = None
+            for length in range(len(signature) - 1, -1, -1):
+                if self.key_index.has_key(signature[0] + signature[len(signature) - length:]):
+                    self.signatures[signature] = signature[0] + signature[len(signature) - length:]
+                    break
+        return self.signatures[signature]
+
+    def ratios(self, key):
+        """Returns P(t | suffix) / P(t) of every state t for a key returned by key (1 for every state if the key is None)"""
+        if key is None:
+            return dict((s, LogProbability(1.0)) for s in self.states)
+        return dict((s, LogProbability(float(logv), logarithmic=True)) for s, logv in zip(self.states, self.log_ratios[self.key_index[key]]))
@@ -0,0 +1,173 @@
+import unittest
+import numpy
+import logsumexp
+import instrumentation
+
+neg_inf = float('-infinity')
+
+def buckets(sentences, batch_size):
+	""" groups the indices of the sentences into batches of at most batch_size sentences of similar length """
+	order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+	return [order[i:i+batch_size] for i in range(0, len(order), batch_size)]
+
+def lattice(model, sentences):
+	""" returns the B x T x N log emission lattice of a batch of sentences (lists of words) padded to the longest sentence, and the sentence lengths """
+	lengths = numpy.array([len(sentence) for sentence in sentences], dtype=int)
+	emissions = numpy.zeros((len(sentences), lengths.max(), len(model.states)))
+	for b, sentence in enumerate(sentences):
+		emissions[b, :len(sentence)] = model.emission_lattice(sentence)
+	return (emissions, lengths)
+
+def forward_batch(model, emissions, lengths):
+	""" runs the forward algorithm on all sentences of a padded lattice at once
+		returns the log likelihoods (B) and the forward tables (B x T x N), cells beyond the end of a sentence are -infinity
+	"""
+	(B, T, N) = emissions.shape
+	forward = numpy.empty((B, T, N))
+	forward.fill(neg_inf)
+	current = model.log_start + emissions[:, 0]
+	forward[:, 0] = current
+	for t in range(1, T):
+		active = t < lengths
+		step = logsumexp.logsumexp((current[:, :, numpy.newaxis] + model.log_transitions) + emissions[:, t, numpy.newaxis, :], axis=1)
+		current = numpy.where(active[:, numpy.newaxis], step, current)
+		forward[active, t] = step[active]
+	return (logsumexp.logsumexp(current + model.log_end, axis=1), forward)
+
+def backward_batch(model, emissions, lengths):
+	""" runs the backward algorithm on all sentences of a padded lattice at once
+		returns the log likelihoods (B) and the backward tables (B x T x N), cells beyond the end of a sentence are -infinity
+	"""
+	(B, T, N) = emissions.shape
+	backward = numpy.empty((B, T, N))
+	backward.fill(neg_inf)
+	current = numpy.tile(model.log_end, (B, 1))
+	backward[numpy.arange(B), lengths-1] = current
+	for t in reversed(range(0, T-1)):
+		active = t < lengths - 1
+		step = logsumexp.logsumexp(model.log_transitions + (current + emissions[:, t+1])[:, numpy.newaxis, :], axis=2)
+		current = numpy.where(active[:, numpy.newaxis], step, current)
+		backward[active, t] = step[active]
+	return (logsumexp.logsumexp(current + model.log_start + emissions[:, 0], axis=1), backward)
+
+def viterbi_batch(model, emissions, lengths):
+	""" runs the viterbi algorithm on all sentences of a padded lattice at once
+		returns the log probabilities of the best paths (B) and the best state sequences as lists of state ids,
+		the sequence is empty if the sentence has no path with a probability > 0
+	"""
+	(B, T, N) = emissions.shape
+	backpointer = numpy.zeros((B, T, N), dtype=int)
+	current = model.log_start + emissions[:, 0]
+	for t in range(1, T):
+		active = t < lengths
+		scores = (current[:, :, numpy.newaxis] + model.log_transitions) + emissions[:, t, numpy.newaxis, :]
+		backpointer[:, t] = scores.argmax(axis=1)
+		current = numpy.where(active[:, numpy.newaxis], scores.max(axis=1), current)
+	scores = current + model.log_end
+	best = scores.argmax(axis=1)
+	probabilities = scores[numpy.arange(B), best]
+	paths = []
+	for b in range(B):
+		path = []
+		if probabilities[b] > neg_inf:
+			path = [best[b]]
+			for t in reversed(range(1, lengths[b])):
+				path.append(backpointer[b, t, path[-1]])
+			path.reverse()
+		paths.append(path)
+	return (probabilities, paths)
+
+def posterior_batch(forward_p, forward, backward, lengths):
+	""" returns the state with the highest posterior probability P(state at t | sentence) at every time step of every sentence of the forward
+		and backward tables of a padded lattice (see forward_batch and backward_batch) as lists of state ids, and the posterior probabilities
+		of these states as lists of confidences. the lists are empty if the sentence has no path with a probability > 0
+	"""
+	with numpy.errstate(invalid='ignore'): # the posteriors of sentences without a path are nan
+		posteriors = (forward + backward) - forward_p[:, numpy.newaxis, numpy.newaxis]
+		best = posteriors.argmax(axis=2)
+		confidences = numpy.exp(posteriors.max(axis=2))
+	paths = []
+	confidence_lists = []
+	for b in range(len(lengths)):
+		if forward_p[b] > neg_inf:
+			paths.append(best[b, :lengths[b]].tolist())
+			confidence_lists.append(confidences[b, :lengths[b]].tolist())
+		else:
+			paths.append([])
+			confidence_lists.append([])
+	return (paths, confidence_lists)
+
+def decode_batch(model, sentences, batch_size=64, instruments=None, posterior=False):
+	""" decodes many sentences (lists of words) with the compiled model
+		the sentences are bucketed by length and every bucket is decoded as one padded B x T x N lattice
+		returns a list of (forward_p, backward_p, viterbi_p, tag_sequence) tuples in the order of the given sentences,
+		the values are the same as the ones of program_fast.forward_algorithm, backward_algorithm and viterbi_algorithm
+		the lattice, forward, backward and viterbi stages of every bucket are recorded by instruments (see instrumentation.Instrumentation)
+		if posterior is True the tags are decoded from the forward and backward tables instead of by the viterbi algorithm (see posterior_batch)
+		and the tuples are (forward_p, backward_p, None, tag_sequence, confidences) like the ones of program_fast.posterior_algorithm
+	"""
+	instruments = instruments or instrumentation.DISABLED
+	results = [None]*len(sentences)
+	for indices in buckets(sentences, batch_size):
+		for i in indices:
+			if len(sentences[i]) == 0 and posterior:
+				results[i] = (model.empty_probability, model.empty_probability, None, [], [])
+			elif len(sentences[i]) == 0:
+				results[i] = (model.empty_probability, model.empty_probability, model.empty_probability, [])
+		indices = [i for i in indices if len(sentences[i]) > 0]
+		if len(indices) == 0:
+			continue
+		token_count = sum(len(sentences[i]) for i in indices)
+		with instruments.stage('lattice', len(indices), token_count):
+			(emissions, lengths) = lattice(model, [sentences[i] for i in indices])
+		with instruments.stage('forward', len(indices), token_count):
+			(forward_p, forward) = forward_batch(model, emissions, lengths)
+		with instruments.stage('backward', len(indices), token_count):
+			(backward_p, backward) = backward_batch(model, emissions, lengths)
+		if posterior:
+			with instruments.stage('posterior', len(indices), token_count):
+				(paths, confidences) = posterior_batch(forward_p, forward, backward, lengths)
+			for b, i in enumerate(indices):
+				results[i] = (float(forward_p[b]), float(backward_p[b]), None, [model.states[s] for s in paths[b]], confidences[b])
+			continue
+		with instruments.stage('viterbi', len(indices), token_count):
+			(viterbi_p, paths) = viterbi_batch(model, emissions, lengths)
+		for b, i in enumerate(indices):
+			results[i] = (float(forward_p[b]), float(backward_p[b]), float(viterbi_p[b]), [model.states[s] for s in paths[b]])
+	return results
+
+class TestDecodeBatch(unittest.TestCase):
+	def test_per_sentence(self):
+		# local import, program_fast imports this module
+		import program_fast
+		import hmmmodel
+		(aa, bb, cc, vv) = ({}, {}, {}, set([]))
+		program_fast.merge_counts(aa, bb, cc, vv, program_fast.count_sentences([['the/DT', 'dog/NN', 'barks/VBZ', './.'], ['a/DT', 'old/JJ', 'cat/NN', 'sleeps/VBZ', './.'],
+			['the/DT', 'dog/NN', 'and/CC', 'the/DT', 'cat/NN', 'sleep/VBP', './.']]))
+		model = hmmmodel.HMMModel(aa, bb, cc, vv)
+		# uneven lengths in every bucket of 3, an empty sentence, unknown words and a sentence without any path
+		sentences = [['the', 'dog', 'barks', '.'], [], ['a', 'puppy', 'sleeps', '.'], ['the', 'old', 'cat', 'and', 'the', 'dog', 'sleep', '.'],
+			['dog'], ['the', 'zebra', 'and', 'a', 'gnu', 'sleep', '.'], ['cat', 'the']]
+		for posterior in (False, True):
+			decoded = decode_batch(model, sentences, 3, posterior=posterior)
+			for sentence, result in zip(sentences, decoded):
+				self.assertAlmostEqual(program_fast.forward_algorithm(None, None, None, None, sentence, model)[0], result[0])
+				self.assertAlmostEqual(program_fast.backward_algorithm(None, None, None, None, sentence, model)[0], result[1])
+				if posterior:
+					(forward_p, backward_p, posteriors, tags, confidences) = program_fast.posterior_algorithm(None, None, None, None, sentence, model)
+					self.assertEqual(tags, result[3])
+					self.assertTrue(numpy.allclose(confidences, result[4]))
+				else:
+					viterbi = program_fast.viterbi_algorithm(None, None, None, None, sentence, model)
+					self.assertAlmostEqual(viterbi[0], result[2])
+					# viterbi_algorithm returns no tag sequence for an empty sentence
+					self.assertEqual(viterbi[3] if len(sentence) > 0 else [], result[3])
+		# the rows of the padded tables beyond the end of a sentence are -infinity, the others are the ones of the single sentence
+		(emissions, lengths) = lattice(model, sentences[2:5])
+		(forward_p, forward) = forward_batch(model, emissions, lengths)
+		(backward_p, backward) = backward_batch(model, emissions, lengths)
+		for b, sentence in enumerate(sentences[2:5]):
+			single = model.emission_lattice(sentence)
+			self.assertTrue(numpy.allclose(program_fast.forward_lattice(model, single)[1], forward[b, :len(sentence)]))
+			self.assertTrue(numpy.allclose(program_fast.backward_lattice(model, single)[1], backward[b, :len(sentence)]))
+			self.assertTrue((forward[b, len(sentence):] == neg_inf).all() and (backward[b, len(sentence):] == neg_inf).all())
@@ -0,0 +1,189 @@
+""" unsupervised training of a compiled model (see hmmmodel.HMMModel) on a corpus of untagged sentences with the baum-welch (EM) algorithm
+	every iteration accumulates the expected start, transition, end and emission counts of all sentences under the current model
+	(E-step, vectorized over padded batches of sentences, see batch.py) and re-estimates the probabilities from them (M-step)
+	until the total log likelihood of the corpus does not improve anymore
+	the likelihood is not the tagging accuracy: the states drift away from the tags of the supervised model towards whatever clustering of the
+	words explains them best (Merialdo 1994), e.g. on the Penn test files the accuracy of the supervised model drops from 0.838 to 0.771 after
+	one iteration and to 0.624 after five, while the log likelihood rises from -68880 to -61070
+"""
+import os
+import unittest
+import numpy
+import fileparser
+import hmmmodel
+import program_fast
+import logsumexp
+import batch
+import parallel
+
+neg_inf = float('-infinity')
+# the largest log weight of a time step which is split between the two factors of the expected transition product (see expected_counts)
+MAX_LOG_WEIGHT = 200.0
+
+def with_words(model, sentences):
+	""" returns a model which is not smoothed and whose vocabulary contains the words of the sentences as well
+		a smoothed model is normalized with the words which are new counted as the unknown words of its laplace smoothing,
+		the new words of a model which is not smoothed get the probability of its unknown word, the emissions are then normalized again
+	"""
+	new_words = sorted(set(word for sentence in sentences for word in sentence if not model.word_index.has_key(word)))
+	unknown = numpy.tile(model.log_emissions[model.unknown_id], (len(new_words) + 1, 1))
+	log_emissions = numpy.vstack((model.log_emissions[:model.unknown_id], unknown))
+	if model.smoothed:
+		log_emissions = log_emissions - model.log_denominators(len(new_words))
+	with numpy.errstate(invalid='ignore'): # the columns of states which do not emit anything stay -infinity
+		log_emissions = numpy.where(numpy.isfinite(log_emissions), log_emissions - logsumexp.logsumexp(log_emissions, axis=0), neg_inf)
+	return hmmmodel.HMMModel.from_parameters(model.states, model.words + new_words, model.log_start, model.log_transitions, model.log_end, log_emissions)
+
+def expected_counts(model, sentences, batch_size=64):
+	""" returns the total log likelihood of the sentences (lists of words), the number of sentences with a probability > 0
+		and their expected start (N), transition (N x N), end (N) and emission counts (W + 1 x N, the rows are word ids)
+		the expected transition counts are summed up over the time steps without computing the T x N x N pair posteriors
+	"""
+	N = len(model.states)
+	(log_likelihood, sentence_count) = (0.0, 0)
+	start = numpy.zeros(N)
+	transitions = numpy.zeros((N, N))
+	end = numpy.zeros(N)
+	emissions = numpy.zeros((len(model.words) + 1, N))
+	transition_probabilities = numpy.exp(model.log_transitions)
+	sentences = [sentence for sentence in sentences if len(sentence) > 0]
+	for indices in batch.buckets(sentences, batch_size):
+		(lattice, lengths) = batch.lattice(model, [sentences[i] for i in indices])
+		(log_z, forward) = batch.forward_batch(model, lattice, lengths)
+		(backward_p, backward) = batch.backward_batch(model, lattice, lengths)
+		possible = log_z > neg_inf
+		if not possible.any():
+			continue
+		(lattice, lengths, log_z, forward, backward) = (lattice[possible], lengths[possible], log_z[possible], forward[possible], backward[possible])
+		ids = numpy.zeros(lattice.shape[:2], dtype=int)
+		for b, i in enumerate(numpy.array(indices)[possible]):
+			ids[b, :lengths[b]] = model.encode(sentences[i])
+		log_likelihood += log_z.sum()
+		sentence_count += len(log_z)
+		# gamma[b][t][i]: probability of state i at t in sentence b, the padding beyond the end of a sentence is 0
+		gamma = numpy.exp(forward + backward - log_z[:, numpy.newaxis, numpy.newaxis])
+		start += gamma[:, 0].sum(axis=0)
+		end += gamma[numpy.arange(len(lengths)), lengths - 1].sum(axis=0)
+		active = numpy.arange(lattice.shape[1]) < lengths[:, numpy.newaxis]
+		for j in range(N):
+			emissions[:, j] += numpy.bincount(ids[active], weights=gamma[:, :, j][active], minlength=len(emissions))
+		# sum_t P(i at t, j at t+1) = P(j | i) * sum_t exp(forward[t][i] + lattice[t+1][j] + backward[t+1][j] - log_z), every
+		# time step is scaled by the largest forward and backward values, hence the sum is one product of a (B T) x N and a (B T) x N matrix
+		left = forward[:, :-1]
+		right = lattice[:, 1:] + backward[:, 1:]
+		(left_shift, right_shift) = (left.max(axis=2), right.max(axis=2))
+		(left_shift, right_shift) = (numpy.where(numpy.isfinite(left_shift), left_shift, 0.0), numpy.where(numpy.isfinite(right_shift), right_shift, 0.0))
+		# the log weight of a time step is split between both factors. it exceeds log_z by up to -log P(j | i) of the most likely states i and j,
+		# the time steps whose weight would overflow (the transition between these states is almost impossible) are summed up from their
+		# N x N pair posteriors in log space instead
+		log_weights = numpy.where(active[:, 1:], left_shift + right_shift - log_z[:, numpy.newaxis], neg_inf)
+		exact = log_weights > MAX_LOG_WEIGHT
+		half = numpy.where(exact, neg_inf, log_weights / 2.0)[:, :, numpy.newaxis]
+		transitions += transition_probabilities * numpy.dot(numpy.exp((left - left_shift[:, :, numpy.newaxis]) + half).reshape(-1, N).T,
+			numpy.exp((right - right_shift[:, :, numpy.newaxis]) + half).reshape(-1, N))
+		for b, t in zip(*numpy.nonzero(exact)):
+			transitions += numpy.exp(((left[b, t][:, numpy.newaxis] + model.log_transitions) + right[b, t]) - log_z[b])
+	return (log_likelihood, sentence_count, start, transitions, end, emissions)
+
+class TestExpectedCounts(unittest.TestCase):
+	def test_almost_impossible_transition(self):
+		# the only path of the sentence has the log probability -1500, the weight of its time step is exp(1500)
+		model = hmmmodel.HMMModel.from_parameters(['X', 'Y'], ['a', 'b'], [0.0, neg_inf], [[0.0, -1500.0], [neg_inf, neg_inf]], [neg_inf, 0.0],
+			[[0.0, neg_inf], [neg_inf, 0.0], [neg_inf, neg_inf]])
+		(log_likelihood, sentence_count, start, transitions, end, emissions) = expected_counts(model, [['a', 'b']])
+		self.assertEqual(-1500.0, log_likelihood)
+		self.assertTrue(numpy.allclose([[0.0, 1.0], [0.0, 0.0]], transitions))
+
+def add_counts(counts, other):
+	""" returns the sum of two results of expected_counts """
+	return tuple(a + b for a, b in zip(counts, other))
+
+def expectation(model, sentences, batch_size=64, workers=None):
+	""" returns the expected counts of all sentences (see expected_counts)
+		if workers is given the sentences are split into chunks which are counted in that many worker processes
+		which share the model read-only (see parallel.WorkerPool), the counts of the chunks are added up
+	"""
+	if workers is None:
+		return expected_counts(model, sentences, batch_size)
+	pool = parallel.WorkerPool(lambda model, chunk: [expected_counts(model, chunk, batch_size)], model, workers)
+	try:
+		# a few large chunks per worker, because the counts of every chunk contain a W + 1 x N emission matrix
+		return reduce(add_counts, pool.map(sentences, len(sentences) / (4 * workers) + 1))
+	finally:
+		pool.close()
+
+def maximization(model, counts, pseudocount=0.1):
+	""" returns the model which is re-estimated from expected counts, pseudocount is added to every emission count so that
+		words which are not part of the corpus keep a probability > 0. states which were never visited keep their probabilities
+	"""
+	(log_likelihood, sentence_count, start, transitions, end, emissions) = counts
+	log_start = hmmmodel.log_array(start / start.sum())
+	totals = transitions.sum(axis=1) + end
+	visited = totals > 0
+	log_transitions = numpy.array(model.log_transitions)
+	log_end = numpy.array(model.log_end)
+	log_transitions[visited] = hmmmodel.log_array(transitions[visited] / totals[visited, numpy.newaxis])
+	log_end[visited] = hmmmodel.log_array(end[visited] / totals[visited])
+	emitting = numpy.isfinite(model.log_emissions).any(axis=0)
+	emissions = emissions + pseudocount
+	log_emissions = numpy.empty(emissions.shape)
+	log_emissions.fill(neg_inf)
+	log_emissions[:, emitting] = hmmmodel.log_array(emissions[:, emitting] / emissions[:, emitting].sum(axis=0))
+	return hmmmodel.HMMModel.from_parameters(model.states, model.words, log_start, log_transitions, log_end, log_emissions)
+
+def train(model, sentences, max_iterations=20, tolerance=1e-4, pseudocount=0.1, batch_size=64, workers=None):
+	""" trains a model on untagged sentences (lists of words) with the baum-welch algorithm and returns the trained model
+		and the total log likelihoods of the corpus under the model of every iteration. the initial model is usually trained on tagged text,
+		its vocabulary is extended by the words of the sentences first (see with_words). the training stops after max_iterations or as soon as the
+		log likelihood improves by less than tolerance times its absolute value. if workers is given the E-step is run in that many processes
+	"""
+	sentences = [sentence for sentence in sentences if len(sentence) > 0]
+	model = with_words(model, sentences)
+	likelihoods = []
+	for iteration in range(max_iterations):
+		counts = expectation(model, sentences, batch_size, workers)
+		likelihoods.append(counts[0])
+		print('iteration %d: log likelihood %f (%d sentences)' % (iteration, counts[0], counts[1]))
+		if len(likelihoods) > 1 and likelihoods[-1] - likelihoods[-2] < tolerance * abs(likelihoods[-2]):
+			break
+		model = maximization(model, counts, pseudocount)
+	return (model, likelihoods)
+
+class TestTrain(unittest.TestCase):
+	def test_likelihood_does_not_decrease(self):
+		(aa, bb, cc, vv) = ({}, {}, {}, set([]))
+		program_fast.merge_counts(aa, bb, cc, vv, program_fast.count_sentences([['the/DT', 'dog/NN', 'barks/VBZ', './.'],
+			['a/DT', 'cat/NN', 'sleeps/VBZ', './.'], ['the/DT', 'old/JJ', 'dog/NN', 'sleeps/VBZ', './.']]))
+		sentences = [['the', 'cat', 'barks', '.'], ['a', 'dog', 'runs', '.'], ['the', 'old', 'cat', 'sleeps', '.'], ['a', 'young', 'dog', 'barks', '.']]
+		(model, likelihoods) = train(hmmmodel.HMMModel(aa, bb, cc, vv), sentences, max_iterations=5, tolerance=0.0)
+		self.assertTrue(likelihoods[1] > likelihoods[0])
+		for previous, likelihood in zip(likelihoods, likelihoods[1:]):
+			self.assertTrue(likelihood >= previous - 1e-9 * abs(previous), (previous, likelihood))
+
+def accuracy(model, sentence_list):
+	""" returns the share of the tags of the tagged sentences (lists of word/tag terms) which are predicted by the viterbi algorithm """
+	decoded = batch.decode_batch(model, [map(fileparser.map_extract_word, sentence) for sentence in sentence_list])
+	match_count = 0.0
+	total_count = 0.0
+	for sentence, (forward_p, backward_p, viterbi_p, tagger_sequence) in zip(sentence_list, decoded):
+		human_sequence = map(fileparser.map_extract_tag, sentence)
+		match_count += sum(1.0 for human_tag, tag in zip(human_sequence, tagger_sequence) if human_tag == tag)
+		total_count += max(len(human_sequence), len(tagger_sequence))
+	return match_count / total_count
+
+def run_penn(max_iterations=10, workers=None, model_path=None):
+	""" trains a model on the tagged training files (or loads it from model_path), adapts it to the words of the test files
+		with baum-welch and prints the tagger accuracy on the test files before and after
+	"""
+	file_list = os.listdir(fileparser.resource_path)
+	if model_path is not None and os.path.exists(model_path):
+		model = hmmmodel.HMMModel.load(model_path)
+	else:
+		program_fast.train_files(program_fast.aa, program_fast.bb, program_fast.cc, program_fast.vv,
+			[fileparser.resource_path + file for file in file_list if file.startswith(fileparser.training_prefix)], workers)
+		model = hmmmodel.HMMModel(program_fast.aa, program_fast.bb, program_fast.cc, program_fast.vv)
+	sentence_list = list(fileparser.iter_parse([fileparser.resource_path + file for file in file_list if file.startswith(fileparser.test_prefix)]))
+	print('accuracy of tagger before baum-welch: %f' % (accuracy(model, sentence_list), ))
+	(model, likelihoods) = train(model, [map(fileparser.map_extract_word, sentence) for sentence in sentence_list], max_iterations, workers=workers)
+	print('accuracy of tagger after baum-welch: %f' % (accuracy(model, sentence_list), ))
+	return model
@@ -0,0 +1,148 @@
+""" a benchmark of all implementations of the decoding algorithms on the sentences of the test files
+	the implementations are program_fast (raw float arrays, exact and beam pruned viterbi), program_clean (LogProbability arrays) and
+	bo_project_2/hmm.py with the python and the cython LogProbability, including its brute force algorithm on the sentences of at most
+	brute_force_length words. bo_project_2 has modules with the same names as this project, hence it is benchmarked by its own
+	benchmark.py in a separate process, whose latencies are summarized here like the ones of this project
+	every implementation and algorithm runs in a forked process (peak memory is the peak resident memory of that process) and decodes
+	every sentence once. the results are summarized per bucket of sentence lengths (see BUCKETS) and over all sentences:
+	tokens/sec, the percentiles of the latency of a sentence in milliseconds and the peak memory. every summary is appended to
+	output as one json line, which also holds the time and the git revision of the run, so that the runs can be compared
+"""
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+import multiprocessing
+import numpy
+import fileparser
+import hmmmodel
+import program_fast
+import program_clean
+
+BUCKETS = ((1, 10), (11, 20), (21, 40), (41, None))
+PERCENTILES = (50, 90, 99)
+
+def resident_kb():
+	""" returns the current resident memory of the process in kB (None if /proc is not available) """
+	try:
+		return int(open('/proc/self/statm').read().split()[1]) * resource.getpagesize() / 1024
+	except IOError:
+		return None
+
+def measure(function, sentence_list, queue):
+	""" runs function on every sentence and puts the latencies and the peak memory of the process on the queue """
+	try:
+		start_kb = resident_kb()
+		latencies = []
+		for sentence in sentence_list:
+			start = time.time()
+			function(sentence)
+			latencies.append(time.time() - start)
+		peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		queue.put((latencies, peak_kb, peak_kb - start_kb if start_kb is not None else None))
+	except Exception as error:
+		# the parent waits for a result, hence the error is put on the queue instead
+		queue.put(error)
+
+def run_isolated(function, sentence_list):
+	""" runs measure in a forked process, so that the peak memory belongs to this algorithm only """
+	queue = multiprocessing.Queue()
+	process = multiprocessing.Process(target=measure, args=(function, sentence_list, queue))
+	process.start()
+	result = queue.get()
+	process.join()
+	if isinstance(result, Exception):
+		raise result
+	return result
+
+def summarize(implementation, algorithm, lengths, latencies, peak_kb, increase_kb):
+	""" returns the summaries of the latencies of the sentences of every length bucket and of all sentences """
+	lengths = numpy.asarray(lengths)
+	latencies = numpy.asarray(latencies)
+	summaries = []
+	for bucket in BUCKETS + ((1, None), ):
+		selected = (lengths >= bucket[0]) & ((lengths <= bucket[1]) if bucket[1] is not None else True)
+		if not selected.any():
+			continue
+		summary = {'implementation': implementation, 'algorithm': algorithm,
+			'bucket': '%d-%s' % (bucket[0], bucket[1] or '') if bucket != (1, None) else 'all',
+			'sentences': int(selected.sum()), 'tokens': int(lengths[selected].sum()),
+			'tokens_per_second': float(lengths[selected].sum() / max(latencies[selected].sum(), 1e-9)),
+			'peak_rss_kb': peak_kb, 'rss_increase_kb': increase_kb}
+		for percentile in PERCENTILES:
+			summary['latency_p%d_ms' % (percentile, )] = float(numpy.percentile(latencies[selected], percentile) * 1000.0)
+		summaries.append(summary)
+	return summaries
+
+def benchmark_project():
+	""" returns the summaries of the implementations of this project """
+	file_list = os.listdir(fileparser.resource_path)
+	program_fast.train_files(program_fast.aa, program_fast.bb, program_fast.cc, program_fast.vv,
+		[fileparser.resource_path + file for file in file_list if file.startswith(fileparser.training_prefix)])
+	model = hmmmodel.HMMModel(program_fast.aa, program_fast.bb, program_fast.cc, program_fast.vv)
+	sentence_list = list(fileparser.iter_parse([fileparser.resource_path + file for file in file_list if file.startswith(fileparser.test_prefix)]))
+	algorithms = [
+		('fast', 'forward', lambda sentence: program_fast.forward_algorithm(None, None, None, None, sentence, model)),
+		('fast', 'backward', lambda sentence: program_fast.backward_algorithm(None, None, None, None, sentence, model)),
+		('fast', 'viterbi', lambda sentence: program_fast.viterbi_algorithm(None, None, None, None, sentence, model)),
+		('fast', 'analyze', lambda sentence: program_fast.analyze(model, sentence)),
+		('fast-beam8', 'viterbi', lambda sentence: program_fast.viterbi_algorithm(None, None, None, None, sentence, model, beam=8)),
+		('clean', 'forward', lambda sentence: program_clean.forward_algorithm(None, None, program_fast.cc, None, sentence, model)),
+		('clean', 'backward', lambda sentence: program_clean.backward_algorithm(None, None, program_fast.cc, None, sentence, model)),
+		('clean', 'viterbi', lambda sentence: program_clean.viterbi_algorithm(None, None, program_fast.cc, None, sentence, model))]
+	summaries = []
+	for implementation, algorithm, function in algorithms:
+		(latencies, peak_kb, increase_kb) = run_isolated(function, sentence_list)
+		summaries += summarize(implementation, algorithm, [len(sentence) for sentence in sentence_list], latencies, peak_kb, increase_kb)
+	return summaries
+
+def benchmark_bo(bo_path, brute_force_length=3):
+	""" returns the summaries of bo_project_2/benchmark.py run with the python and with the cython LogProbability,
+		the cython implementation is skipped if its module cannot be built (bo_project_2 falls back to the python one)
+	"""
+	summaries = []
+	for requested in ('python', 'cython'):
+		environment = dict(os.environ, LOGPROBABILITY=requested)
+		process = subprocess.Popen([sys.executable, 'benchmark.py', os.path.abspath(fileparser.resource_path) + os.sep, str(brute_force_length)],
+			cwd=bo_path, env=environment, stdout=subprocess.PIPE)
+		lines = [json.loads(line) for line in process.communicate()[0].splitlines() if line.startswith('{')]
+		if process.returncode != 0:
+			print('bo_project_2 with the %s LogProbability failed (exit code %d)' % (requested, process.returncode))
+		for line in lines:
+			if line['implementation'] != 'bo-' + requested:
+				print('the %s LogProbability of bo_project_2 is not available, skipped' % (requested, ))
+				break
+			summaries += summarize(line['implementation'], line['algorithm'], line['lengths'], line['latencies'], line['peak_rss_kb'], line['rss_increase_kb'])
+	return summaries
+
+def revision():
+	""" returns the git revision of the working tree, None outside of a git repository """
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=open(os.devnull, 'w')).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def run(output='benchmark.jsonl', bo_path=os.path.join('..', '..', '..', 'bo_project_2'), brute_force_length=3):
+	""" benchmarks all implementations, prints the summaries as a table and appends them to output as json lines """
+	summaries = benchmark_project()
+	if bo_path is not None and os.path.exists(os.path.join(bo_path, 'benchmark.py')):
+		summaries += benchmark_bo(bo_path, brute_force_length)
+	run_info = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': revision(), 'python': sys.version.split()[0]}
+	file = open(output, 'a')
+	try:
+		for summary in summaries:
+			summary.update(run_info)
+			file.write(json.dumps(summary, sort_keys=True) + '\n')
+	finally:
+		file.close()
+	columns = ['latency_p%d_ms' % (percentile, ) for percentile in PERCENTILES]
+	print('implementation\talgorithm\tbucket\tsentences\ttokens/s\t%s\tpeak kB' % ('\t'.join(columns), ))
+	for summary in summaries:
+		print('%s\t%s\t%s\t%d\t%.0f\t%s\t%s' % (summary['implementation'], summary['algorithm'], summary['bucket'], summary['sentences'],
+			summary['tokens_per_second'], '\t'.join('%.2f' % (summary[column], ) for column in columns), summary['peak_rss_kb']))
+	return summaries
+
+if __name__ == '__main__':
+	run(*sys.argv[1:2])
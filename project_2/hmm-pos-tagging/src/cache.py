@@ -0,0 +1,95 @@
+""" a bounded least recently used cache of decoded sentences, for input with many duplicate sentences (headlines, boilerplate)
+	the results are keyed by the normalized words of a sentence (see DecodeCache.key) and belong to one version of one model (see hmmmodel.HMMModel.version).
+	the cache is emptied when it is used with another version, i.e. after the model has been retrained, updated or replaced
+"""
+import unittest
+import collections
+import fileparser
+
+class DecodeCache(object):
+	""" maps keys to decoded results, at most max_size of them. counts the hits, the misses, the evictions of the least recently
+		used results and the invalidations of all results by a new model version
+	"""
+	def __init__(self, max_size=10000):
+		if max_size < 1:
+			raise ValueError('the cache needs a max_size of at least 1, not %r' % (max_size, ))
+		self.max_size = max_size
+		self.entries = collections.OrderedDict()
+		self.version = None
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.invalidations = 0
+
+	def key(self, sentence):
+		""" returns the normalized word sequence of a sentence of word/tag terms (or words, or word ids), the tags do not change the decoding """
+		return tuple(fileparser.extract_words(sentence))
+
+	def validate(self, model):
+		""" empties the cache if its results were decoded with another model version than the one of model """
+		if self.version != model.version:
+			if len(self.entries) > 0:
+				self.invalidations += 1
+			self.entries.clear()
+			self.version = model.version
+
+	def get(self, model, key):
+		""" returns the result of a key decoded with model, None if it is not cached """
+		self.validate(model)
+		result = self.entries.pop(key, None)
+		if result is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self.entries[key] = result # most recently used
+		return result
+
+	def put(self, model, key, result):
+		""" caches the result of a key decoded with model, the least recently used result is evicted if the cache is full """
+		self.validate(model)
+		self.entries.pop(key, None)
+		self.entries[key] = result
+		if len(self.entries) > self.max_size:
+			self.entries.popitem(last=False)
+			self.evictions += 1
+
+	def clear(self):
+		self.entries.clear()
+		self.version = None
+
+	def statistics(self):
+		""" returns the counters and the size of the cache """
+		return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations,
+			'size': len(self.entries), 'max_size': self.max_size}
+
+	def __len__(self):
+		return len(self.entries)
+
+class TestDecodeCache(unittest.TestCase):
+	def test_hits_and_invalidation(self):
+		# local import, program_fast imports this module
+		import program_fast
+		import hmmmodel
+		(aa, bb, cc, vv) = ({}, {}, {}, set([]))
+		program_fast.merge_counts(aa, bb, cc, vv, program_fast.count_sentences([['the/DT', 'dog/NN', 'barks/VBZ', './.'], ['a/DT', 'cat/NN', 'sleeps/VBZ', './.']]))
+		model = hmmmodel.HMMModel(aa, bb, cc, vv)
+		cache = DecodeCache(2)
+		sentences = [['the/DT', 'cat/NN', 'barks/VBZ', './.'], ['a/DT', 'dog/NN', 'sleeps/VBZ', './.'], ['the/X', 'cat/Y', 'barks/Z', './.']]
+		expected = program_fast.decode_sentences(model, sentences)
+		# the third sentence has the words of the first one
+		self.assertEqual(expected, program_fast.decode_sentences(model, sentences, cache=cache))
+		self.assertEqual((0, 3), (cache.hits, cache.misses))
+		self.assertEqual(expected, program_fast.decode_sentences(model, sentences, cache=cache))
+		self.assertEqual((3, 3, 2), (cache.hits, cache.misses, len(cache)))
+		# the least recently used sentence is evicted
+		program_fast.decode_sentences(model, [['a', 'dog', 'sleeps', '.'], ['a', 'dog', '.']], cache=cache)
+		self.assertEqual((4, 4, 1), (cache.hits, cache.misses, cache.evictions))
+		self.assertEqual(None, cache.get(model, (False, cache.key(sentences[0]))))
+		# an update changes the model version, the cached results of the old version are not returned
+		version = model.version
+		model.update(program_fast.count_sentences([['the/DT', 'cat/NN', 'barks/VBZ', './.']]))
+		self.assertNotEqual(version, model.version)
+		updated = program_fast.decode_sentences(model, sentences[:1], cache=cache)
+		self.assertEqual((1, 0), (cache.invalidations, cache.hits - 4))
+		self.assertEqual(program_fast.decode_sentences(model, sentences[:1]), updated)
+		self.assertNotEqual(expected[:1], updated)
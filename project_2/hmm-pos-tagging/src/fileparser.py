@@ -1,3 +1,6 @@
+import itertools
+import numpy
+
 resource_path = '../training/'
 test_prefix = ('test', )
 training_prefix = ('train', )
@@ -26,18 +29,56 @@ def map_extract_word(term):
 def map_extract_tag(term):
 	return term.split('/')[1].split('|')[0]
 
-def parse(file):
-	""" parses the file in the 'Penn Treebank annotation style for POS tags' into a list of sequences of word/tag constructs """
-	line_list = file.readlines()
-	line_list = filter(filter_unused_lines, line_list)
-	sentence_list = []
+def extract_words(sentence):
+	""" returns the words of a sentence of word/tag terms (or words), a sentence of word ids (see iter_parse_ids) is returned as it is """
+	if isinstance(sentence, numpy.ndarray):
+		return sentence
+	return map(map_extract_word, sentence)
+
+def iter_sentences(lines):
+	""" lazily parses an iterable of lines in the 'Penn Treebank annotation style for POS tags' into sequences of word/tag constructs """
+	lines = itertools.ifilter(filter_unused_lines, lines)
 	sentence = []
-	for line in line_list:
+	for line in lines:
 		line = filter(filter_unused_strings, line)
 		term_list = line.split()
 		for term in term_list:
 			sentence.append(term)
 			if term.startswith(sentence_separator):
-				sentence_list.append(sentence)
+				yield sentence
 				sentence = []
-	return sentence_list
\ No newline at end of file
+
+def iter_parse(source):
+	""" lazily parses a file handle, a path or an iterable of paths and yields one sentence at a time
+		the sentences are the same as the ones of parse, sentences never span two files
+	"""
+	if hasattr(source, 'read'):
+		for sentence in iter_sentences(source):
+			yield sentence
+		return
+	if isinstance(source, basestring):
+		source = [source]
+	for path in source:
+		file = open(path, 'r')
+		try:
+			for sentence in iter_sentences(file):
+				yield sentence
+		finally:
+			file.close()
+
+def iter_parse_ids(source, words, tags):
+	""" lazily parses like iter_parse and yields every sentence as a pair of int arrays, the ids of its words and of its tags
+		in the symbol tables words and tags (see symbols.SymbolTable), which intern the new words and tags. every term is split once
+	"""
+	for sentence in iter_parse(source):
+		word_ids = numpy.empty(len(sentence), dtype=numpy.int32)
+		tag_ids = numpy.empty(len(sentence), dtype=numpy.int32)
+		for i, term in enumerate(sentence):
+			parts = term.split('/')
+			word_ids[i] = words.intern(parts[0])
+			tag_ids[i] = tags.intern(parts[1].split('|')[0])
+		yield (word_ids, tag_ids)
+
+def parse(file):
+	""" parses the file in the 'Penn Treebank annotation style for POS tags' into a list of sequences of word/tag constructs """
+	return list(iter_sentences(file))
@@ -0,0 +1,549 @@
+import os
+import json
+import tempfile
+import unittest
+import itertools
+import collections
+import struct
+import numpy
+import fileparser
+import logsumexp
+import unknownwords
+
+neg_inf = float('-infinity')
+
+# binary model format (see HMMModel.save): the magic string, the format version and the length of a json header, followed by the
+# header and the arrays. the header holds the scalar fields and the dtype, shape and file offset of every array. the arrays are
+# aligned to ALIGNMENT bytes so that they can be memory-mapped in place, the tag and word tables are stored as newline separated bytes
+MAGIC = 'HMMMODEL'
+VERSION = 2
+ALIGNMENT = 64
+ARRAYS = ('counts', 'transition_counts', 'log_start', 'log_transitions', 'log_end', 'log_emissions', 'in_vocabulary')
+
+# the versions of the models of this process, a model gets a new one whenever it is compiled, loaded or updated (see HMMModel.version)
+_versions = itertools.count(1)
+
+def log_array(values):
+	""" returns the element-wise logarithm of an array of probabilities, zero (or negative) probabilities are mapped to -infinity """
+	values = numpy.asarray(values, dtype=float)
+	result = numpy.empty(values.shape)
+	result.fill(neg_inf)
+	positive = values > 0
+	result[positive] = numpy.log(values[positive])
+	return result
+
+def segments(ptr):
+	""" returns the mask of the nonempty segments of a CSR-style pointer array and the start indices of these segments """
+	nonempty = ptr[1:] > ptr[:-1]
+	return (nonempty, ptr[:-1][nonempty])
+
+def segment_reduce(reduceat, values, segments, empty=neg_inf):
+	""" reduces the segments values[ptr[k]:ptr[k+1]] with a reduceat function (e.g. numpy.maximum.reduceat or logsumexp.reduceat),
+		empty segments are set to empty. segments are the nonempty mask and the start indices returned by segments(ptr). the segment
+		of a start index ends at the next start index, hence only the starts of the nonempty segments are passed to reduceat
+	"""
+	(nonempty, starts) = segments
+	result = numpy.empty(len(nonempty), dtype=values.dtype)
+	result.fill(empty)
+	if len(starts) > 0:
+		result[nonempty] = reduceat(values, starts)
+	return result
+
+class HMMModel(object):
+	""" a first order hidden markov model compiled from the transition-, emission- and prior frequencies used by train
+		tags and words are given dense integer ids and all probabilities are stored as log probabilities in contiguous arrays:
+		  log_start[j]          log P(j | START)
+		  log_transitions[i][j] log P(j | i)
+		  log_end[i]            log P(END | i)
+		  log_emissions[w][j]   log of the laplace smoothed emission frequency of word w in state j (frequency + 1)
+		the last row of log_emissions is reserved for out-of-vocabulary words. the laplace denominator depends on the number
+		of unknown words in the sentence, hence it is kept separately and cached per number of unknown words (see log_denominators)
+		the states are numbered in the order of filter(fileparser.filter_start_end_states, count_map.keys()), i.e. state i is
+		stored in column i + 1 of the trellis tables of program_fast and program_clean
+		the transitions with a probability > 0 are additionally indexed by predecessor and by successor (see _adjacency),
+		so that a recursion step visits only these transitions instead of all N x N pairs (see sum_predecessors, max_predecessors)
+		a model created with from_parameters (e.g. by baumwelch.train) is not smoothed: its log_emissions[w][j] are the log
+		probabilities P(w | j) themselves and the last row is the probability of any out-of-vocabulary word
+		the transition frequencies are kept in transition_counts[i + 1][j + 1] (from state i to state j), row 0 holds the frequencies
+		of the transitions from START and column 0 the ones of the transitions to END, so that newly tagged sentences can be added (see update)
+		with suffix_model the emissions of out-of-vocabulary words are weighted by the tag probabilities of their suffix and word class,
+		which are trained on the rare words of emission_map (see unknownwords.SuffixModel), otherwise unknown_model is None
+		version identifies the probabilities of the model within the process: no two models share a version and update assigns a new one,
+		hence results which were decoded with a model are valid as long as its version is the same (see cache.DecodeCache)
+	"""
+	def __init__(self, transition_map, emission_map, count_map, vocabulary, suffix_model=False):
+		self.states = filter(fileparser.filter_start_end_states, count_map.keys())
+		words = set(vocabulary)
+		for tag in emission_map.keys():
+			words.update(emission_map[tag].keys())
+		self.words = list(words)
+		self._index()
+		# words which are emitted by a state but are not part of the vocabulary are counted as unknown words in the laplace smoothing
+		self.in_vocabulary = numpy.array([word in vocabulary for word in self.words] + [False])
+		self.vocabulary_size = len(vocabulary)
+		self.counts = numpy.array([count_map[s] for s in self.states], dtype=float)
+		# transitions
+		def probability(tag, given):
+			if transition_map.has_key(given) and transition_map[given].has_key(tag):
+				return transition_map[given][tag]/count_map[given]
+			return 0.0
+		self.transition_counts = numpy.zeros((len(self.states) + 1, len(self.states) + 1))
+		for given in transition_map.keys():
+			for tag, frequency in transition_map[given].iteritems():
+				self.transition_counts[self._count_index(given), self._count_index(tag)] = frequency
+		self.log_start = log_array([probability(s, fileparser.START) for s in self.states])
+		self.log_transitions = log_array([[probability(s, s_) for s in self.states] for s_ in self.states])
+		self.log_end = log_array([probability(fileparser.END, s) for s in self.states])
+		self.empty_probability = probability(fileparser.END, fileparser.START)
+		# emissions
+		emission_counts = numpy.zeros((len(self.words) + 1, len(self.states)))
+		emitting = numpy.zeros(len(self.states), dtype=bool)
+		for si, s in enumerate(self.states):
+			if emission_map.has_key(s):
+				emitting[si] = True
+				for word, count in emission_map[s].iteritems():
+					emission_counts[self.word_index[word], si] = count
+		self.log_emissions = numpy.log(emission_counts + 1.0)
+		self.log_emissions[:, ~emitting] = neg_inf
+		self.smoothed = True
+		self.unknown_model = unknownwords.SuffixModel.train(self.states, emission_map) if suffix_model else None
+		self.word_table = None
+		self._adjacency()
+		self._compile_emissions()
+
+	@classmethod
+	def from_parameters(cls, states, words, log_start, log_transitions, log_end, log_emissions):
+		""" creates a model which is not smoothed from its log probabilities, log_emissions[w][j] is log P(words[w] | states[j])
+			and the last row of log_emissions is the log probability of any word which is not in words
+		"""
+		model = cls.__new__(cls)
+		model.states = list(states)
+		model.words = list(words)
+		model.log_start = numpy.asarray(log_start, dtype=float)
+		model.log_transitions = numpy.asarray(log_transitions, dtype=float)
+		model.log_end = numpy.asarray(log_end, dtype=float)
+		model.log_emissions = numpy.asarray(log_emissions, dtype=float)
+		model.in_vocabulary = numpy.array([True]*len(model.words) + [False])
+		model.vocabulary_size = len(model.words)
+		model.counts = numpy.zeros(len(model.states))
+		model.transition_counts = numpy.zeros((len(model.states) + 1, len(model.states) + 1))
+		model.empty_probability = 0.0
+		model.smoothed = False
+		model.unknown_model = None
+		model.word_table = None
+		model._index()
+		model._adjacency()
+		model._compile_emissions()
+		return model
+
+	@classmethod
+	def from_counts(cls, states, words, transition_counts, emission_counts, suffix_model=False):
+		""" compiles a laplace smoothed model from frequencies of tag and word ids (see program_fast.count_ids): the M x M transition_counts
+			(M = N + 1, see above) and the W x N emission_counts of words[w] in states[j]. all words are part of the vocabulary, the ids of the
+			model are the ids of the counts, hence the model decodes id arrays of the same symbol tables (see symbols and emission_lattice).
+			words is kept as word_table, if it is a symbols.SymbolTable it may intern further (unknown) words
+		"""
+		model = cls.__new__(cls)
+		model.states = list(states)
+		model.words = list(words[:len(emission_counts)])
+		model.word_table = words
+		model._index()
+		model.in_vocabulary = numpy.array([True]*len(model.words) + [False])
+		model.vocabulary_size = len(model.words)
+		model.transition_counts = numpy.array(transition_counts, dtype=float)
+		model.counts = model.transition_counts[1:].sum(axis=1)
+		model.log_transitions = numpy.empty((len(model.states), len(model.states)))
+		model.log_end = numpy.empty(len(model.states))
+		model._compile_transitions(numpy.arange(len(model.states)), True)
+		emitting = emission_counts.sum(axis=0) > 0
+		model.log_emissions = numpy.log(numpy.vstack((emission_counts, numpy.zeros(len(model.states)))) + 1.0)
+		model.log_emissions[:, ~emitting] = neg_inf
+		model.smoothed = True
+		model.unknown_model = unknownwords.SuffixModel.from_counts(model.words, emission_counts) if suffix_model else None
+		model._adjacency()
+		model._compile_emissions()
+		return model
+
+	def _index(self):
+		self.state_index = dict((s, si) for si, s in enumerate(self.states))
+		self.word_index = dict((word, wi) for wi, word in enumerate(self.words))
+		self.unknown_id = len(self.words)
+		self._log_denominators = {}
+		self._unknown_columns = {}
+		self.version = next(_versions)
+
+	def _count_index(self, tag):
+		""" the row or column of a tag in transition_counts """
+		if tag in (fileparser.START, fileparser.END):
+			return 0
+		return self.state_index[tag] + 1
+
+	def _adjacency(self):
+		""" builds the CSR-style index of the transitions with a probability > 0, the predecessors of state j are
+			predecessor_ids[predecessor_ptr[j]:predecessor_ptr[j+1]] with the log probabilities predecessor_log of the same range,
+			the successors of state i are successor_ids[successor_ptr[i]:successor_ptr[i+1]] with the log probabilities successor_log.
+			both lists are sorted by state id
+		"""
+		states = numpy.arange(len(self.states) + 1)
+		(source, target) = numpy.nonzero(self.log_transitions > neg_inf) # sorted by source, then target
+		self.successor_ptr = numpy.searchsorted(source, states)
+		self.successor_ids = target
+		self.successor_log = numpy.asarray(self.log_transitions[source, target])
+		self._successor_sources = source
+		order = numpy.lexsort((source, target)) # sorted by target, then source
+		self.predecessor_ptr = numpy.searchsorted(target[order], states)
+		self.predecessor_ids = source[order]
+		self.predecessor_log = self.successor_log[order]
+		self._predecessor_segments = segments(self.predecessor_ptr)
+		self._predecessor_targets = target[order]
+		self._successor_segments = segments(self.successor_ptr)
+
+	def save(self, path):
+		""" writes the model in the binary model format, which can be loaded with HMMModel.load """
+		arrays = dict((name, numpy.ascontiguousarray(getattr(self, name))) for name in ARRAYS)
+		arrays['states'] = numpy.frombuffer('\n'.join(self.states), dtype=numpy.uint8)
+		arrays['words'] = numpy.frombuffer('\n'.join(self.words), dtype=numpy.uint8)
+		if self.unknown_model is not None:
+			arrays['suffix_keys'] = numpy.frombuffer('\n'.join(self.unknown_model.keys), dtype=numpy.uint8)
+			arrays['suffix_log_ratios'] = numpy.ascontiguousarray(self.unknown_model.log_ratios)
+			if self.unknown_model.frequencies is not None:
+				# the training frequencies of the suffix model (see unknownwords.SuffixModel.update), the rare words come first
+				suffix_words = sorted(self.unknown_model.frequencies.keys(), key=lambda word: (not self.unknown_model.rare.has_key(word), word))
+				arrays['suffix_words'] = numpy.frombuffer('\n'.join(suffix_words), dtype=numpy.uint8)
+				arrays['suffix_frequencies'] = numpy.array([self.unknown_model.frequencies[word] for word in suffix_words], dtype=float)
+				arrays['suffix_rare_counts'] = numpy.array([self.unknown_model.rare[word] for word in suffix_words[:len(self.unknown_model.rare)]],
+					dtype=float).reshape(len(self.unknown_model.rare), len(self.states))
+				arrays['suffix_totals'] = numpy.ascontiguousarray(self.unknown_model.totals)
+		header = {'vocabulary_size': self.vocabulary_size, 'empty_probability': self.empty_probability, 'smoothed': self.smoothed,
+			'state_count': len(self.states), 'word_count': len(self.words), 'arrays': {}}
+		if self.unknown_model is not None:
+			header.update({'suffix_length': self.unknown_model.max_length, 'suffix_count': len(self.unknown_model.keys)})
+			if self.unknown_model.frequencies is not None:
+				header.update({'suffix_max_frequency': self.unknown_model.max_frequency, 'suffix_word_count': len(self.unknown_model.frequencies)})
+		# the offsets depend on the header length, hence the header is laid out until its length does not change anymore
+		length = 0
+		while True:
+			offset = len(MAGIC) + 8 + length
+			for name in sorted(arrays.keys()):
+				offset += -offset % ALIGNMENT
+				header['arrays'][name] = (arrays[name].dtype.str, arrays[name].shape, offset)
+				offset += arrays[name].nbytes
+			encoded = json.dumps(header, sort_keys=True)
+			if len(encoded) == length:
+				break
+			length = len(encoded)
+		file = open(path, 'wb')
+		try:
+			file.write(MAGIC + struct.pack('<II', VERSION, length) + encoded)
+			for name in sorted(arrays.keys()):
+				file.write('\0' * (header['arrays'][name][2] - file.tell()))
+				file.write(arrays[name].tostring())
+		finally:
+			file.close()
+
+	@classmethod
+	def load(cls, path):
+		""" loads a model written by save, the arrays are memory-mapped read-only and hence shared by all processes which load the same file """
+		file = open(path, 'rb')
+		try:
+			if file.read(len(MAGIC)) != MAGIC:
+				raise IOError('%s is not a binary hmm model' % (path, ))
+			(version, length) = struct.unpack('<II', file.read(8))
+			if version != VERSION:
+				raise IOError('%s has model format version %d, expected %d' % (path, version, VERSION))
+			header = json.loads(file.read(length))
+		finally:
+			file.close()
+		def array(name):
+			(dtype, shape, offset) = header['arrays'][name]
+			if numpy.prod(shape) == 0:
+				return numpy.zeros(shape, dtype=dtype)
+			return numpy.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+		def table(name, count):
+			return array(name).tostring().split('\n') if count > 0 else []
+		model = cls.__new__(cls)
+		for name in ARRAYS:
+			setattr(model, name, array(name))
+		model.states = table('states', header['state_count'])
+		model.words = table('words', header['word_count'])
+		model.vocabulary_size = header['vocabulary_size']
+		model.empty_probability = header['empty_probability']
+		model.smoothed = header.get('smoothed', True)
+		model.unknown_model = None
+		if header.has_key('suffix_length'):
+			model.unknown_model = unknownwords.SuffixModel(table('suffix_keys', header['suffix_count']), array('suffix_log_ratios'), header['suffix_length'])
+		if header.has_key('suffix_max_frequency'):
+			suffix_words = table('suffix_words', header['suffix_word_count'])
+			rare_counts = array('suffix_rare_counts')
+			model.unknown_model.frequencies = dict(zip(suffix_words, array('suffix_frequencies').tolist()))
+			model.unknown_model.rare = dict((word, numpy.array(counts)) for word, counts in zip(suffix_words, rare_counts))
+			model.unknown_model.totals = numpy.array(array('suffix_totals'))
+			model.unknown_model.max_frequency = header['suffix_max_frequency']
+		model.word_table = None
+		model._index()
+		model._adjacency()
+		model._compile_emissions()
+		return model
+
+	def update(self, tables):
+		""" adds the count tables of newly tagged sentences (see program_fast.count_sentences) to the frequencies of the model and
+			recompiles only what they change: the transition probabilities of the states with new transitions, the emissions of the counted
+			(tag, word) pairs and the cached laplace denominators of the counted states (all of them if the vocabulary grows).
+			the emissions are added to the suffix model as well, which recomputes its ratios (see unknownwords.SuffixModel.update).
+			new tags and words are appended to the states and words. the model is changed in place, hence a tagger which holds it decodes
+			the following sentences with the new frequencies (see server.MicroBatcher, which applies updates between two batches).
+			the result is the model which __init__ compiles from the frequencies of all sentences
+		"""
+		if not self.smoothed:
+			raise ValueError('only a model compiled from frequencies can be updated, not one created with from_parameters')
+		if self.unknown_model is not None and self.unknown_model.frequencies is None:
+			raise ValueError('the suffix model of the model has no training frequencies (it was saved by an older version), it cannot be updated')
+		(transitions, emissions, counts, words) = tables
+		tags = [tag for (given, tag), frequency in transitions] + [tag for tag, frequency in counts] + [tag for (tag, word), frequency in emissions]
+		self._grow(filter(fileparser.filter_start_end_states, tags), list(words) + [word for (tag, word), frequency in emissions])
+		vocabulary_size = self.vocabulary_size
+		for word in words:
+			wi = self.word_index[word]
+			if not self.in_vocabulary[wi]:
+				self.in_vocabulary[wi] = True
+				self.vocabulary_size += 1
+		# transitions, row 0 are the transitions from START
+		changed = numpy.zeros(len(self.states) + 1, dtype=bool)
+		for (given, tag), frequency in transitions:
+			self.transition_counts[self._count_index(given), self._count_index(tag)] += frequency
+			changed[self._count_index(given)] = True
+		counted = numpy.zeros(len(self.states), dtype=bool)
+		for tag, frequency in counts:
+			if self.state_index.has_key(tag):
+				self.counts[self.state_index[tag]] += frequency
+				counted[self.state_index[tag]] = True
+		self._compile_transitions(numpy.nonzero(changed[1:])[0], changed[0])
+		self._adjacency()
+		# emissions, log_emissions holds the log of the frequencies + 1
+		for (tag, word), frequency in emissions:
+			(wi, si) = (self.word_index[word], self.state_index[tag])
+			if self.log_emissions[self.unknown_id, si] == neg_inf: # the first emission of a state, all words get the frequency 0 + 1
+				self.log_emissions[:, si] = 0.0
+			self.log_emissions[wi, si] = numpy.log(numpy.exp(self.log_emissions[wi, si]) + frequency)
+		if self.unknown_model is not None:
+			self.unknown_model.update([(self.state_index[tag], word, frequency) for (tag, word), frequency in emissions])
+		if self.vocabulary_size != vocabulary_size:
+			self._log_denominators = {}
+		for unknown, denominators in self._log_denominators.iteritems():
+			denominators[counted] = numpy.log(self.counts[counted] + (self.vocabulary_size + unknown))
+		self._unknown_columns = {}
+		self._compile_emissions(None if self.vocabulary_size != vocabulary_size else counted)
+		self.version = next(_versions)
+
+	def _compile_transitions(self, rows, start):
+		""" computes the transition and end probabilities of the states rows from transition_counts, and the start probabilities if start is True """
+		self.log_transitions[rows] = log_array(self.transition_counts[rows + 1, 1:] / self.counts[rows, numpy.newaxis])
+		self.log_end[rows] = log_array(self.transition_counts[rows + 1, 0] / self.counts[rows])
+		if start:
+			sentence_count = self.transition_counts[0].sum()
+			self.log_start = log_array(self.transition_counts[0, 1:] / sentence_count)
+			self.empty_probability = self.transition_counts[0, 0] / sentence_count
+
+	def _grow(self, tags, words):
+		""" appends the tags and words which the model does not know yet to its states and words, the arrays of a memory-mapped
+			model (see load) are copied first
+		"""
+		for name in ARRAYS:
+			if not getattr(self, name).flags.writeable:
+				setattr(self, name, numpy.array(getattr(self, name)))
+		new_states = [tag for tag in collections.OrderedDict.fromkeys(tags) if not self.state_index.has_key(tag)]
+		new_words = [word for word in collections.OrderedDict.fromkeys(words) if not self.word_index.has_key(word)]
+		if len(new_states) == 0 and len(new_words) == 0:
+			return
+		(n, w) = (len(new_states), len(new_words))
+		self.states = self.states + new_states
+		self.words = self.words + new_words
+		self.counts = numpy.append(self.counts, numpy.zeros(n))
+		self.transition_counts = numpy.pad(self.transition_counts, ((0, n), (0, n)), 'constant')
+		self.log_start = numpy.append(self.log_start, numpy.repeat(neg_inf, n))
+		self.log_end = numpy.append(self.log_end, numpy.repeat(neg_inf, n))
+		self.log_transitions = numpy.pad(self.log_transitions, ((0, n), (0, n)), 'constant', constant_values=neg_inf)
+		# the rows of the new words are inserted before the row of the unknown words, they have the frequency 0 in every state which emits
+		unknown = self.log_emissions[-1:]
+		self.log_emissions = numpy.pad(numpy.vstack((self.log_emissions[:-1], numpy.repeat(unknown, w, axis=0), unknown)), ((0, 0), (0, n)),
+			'constant', constant_values=neg_inf)
+		self.in_vocabulary = numpy.concatenate((self.in_vocabulary[:-1], numpy.zeros(w, dtype=bool), self.in_vocabulary[-1:]))
+		if self.unknown_model is not None and n > 0:
+			self.unknown_model = self.unknown_model.padded(len(self.states))
+		self._index()
+
+	def log_denominators(self, unknown):
+		""" returns the log of the laplace smoothing denominators of all states for a sentence with the given number of unknown words """
+		if not self._log_denominators.has_key(unknown):
+			self._log_denominators[unknown] = numpy.log(self.counts + (self.vocabulary_size + unknown))
+		return self._log_denominators[unknown]
+
+	def _compile_emissions(self, states=None):
+		""" precomputes emission_columns[w], the log emission probabilities of word w in all states for a sentence without unknown words,
+			i.e. log_emissions minus the laplace denominators of 0 unknown words (log_emissions itself if the model is not smoothed).
+			only the columns of the given states (a boolean mask) are recomputed if states is not None
+		"""
+		if not self.smoothed:
+			self.emission_columns = self.log_emissions
+		elif states is None or len(self.emission_columns) != len(self.log_emissions) or self.emission_columns.shape[1] != len(self.states):
+			self.emission_columns = self.log_emissions - self.log_denominators(0)
+		else:
+			self.emission_columns[:, states] = self.log_emissions[:, states] - self.log_denominators(0)[states]
+
+	def unknown_column(self, unknown, word):
+		""" returns the log emission probabilities of an out-of-vocabulary word in all states for a sentence with the given number of
+			unknown words, weighted by the suffix model if there is one. the column is computed once per number of unknown words and suffix
+		"""
+		key = self.unknown_model.key(word) if self.unknown_model is not None else None
+		if not self._unknown_columns.has_key((unknown, key)):
+			column = self.log_emissions[self.unknown_id] - self.log_denominators(unknown) if self.smoothed else self.log_emissions[self.unknown_id]
+			if self.unknown_model is not None:
+				column = column + self.unknown_model.log_ratio(word)
+			self._unknown_columns[(unknown, key)] = column
+		return self._unknown_columns[(unknown, key)]
+
+	def sum_predecessors(self, current):
+		""" returns log sum_i exp(current[i]) P(j | i) for every state j, only the transitions with a probability > 0 are visited """
+		return segment_reduce(logsumexp.reduceat, current[self.predecessor_ids] + self.predecessor_log, self._predecessor_segments)
+
+	def sum_successors(self, current):
+		""" returns log sum_j P(j | i) exp(current[j]) for every state i, only the transitions with a probability > 0 are visited """
+		return segment_reduce(logsumexp.reduceat, self.successor_log + current[self.successor_ids], self._successor_segments)
+
+	def successor_edges(self, states):
+		""" returns the transitions with a probability > 0 out of the given state ids as two arrays of the same length: the position of
+			the predecessor in states and the index of the transition in successor_ids and successor_log, sorted by predecessor id
+		"""
+		position = numpy.empty(len(self.states), dtype=int)
+		position.fill(-1)
+		position[states] = numpy.arange(len(states))
+		edges = numpy.flatnonzero(position[self._successor_sources] >= 0)
+		return (position[self._successor_sources[edges]], edges)
+
+	def max_predecessors(self, current):
+		""" returns max_i current[i] + log P(j | i) and the maximizing (smallest) predecessor i of every state j,
+			only the transitions with a probability > 0 are visited. the predecessor of a state without a finite score is 0
+		"""
+		scores = current[self.predecessor_ids] + self.predecessor_log
+		best = segment_reduce(numpy.maximum.reduceat, scores, self._predecessor_segments)
+		# the first edge of every segment which reaches the maximum of the segment
+		edges = numpy.where(scores == best[self._predecessor_targets], numpy.arange(len(scores)), len(scores))
+		first = segment_reduce(numpy.minimum.reduceat, edges, self._predecessor_segments, len(scores))
+		predecessors = numpy.zeros(len(best), dtype=int)
+		finite = best > neg_inf
+		predecessors[finite] = self.predecessor_ids[first[finite]]
+		return (best, predecessors)
+
+	def encode(self, sentence):
+		""" maps the words of a sentence to their ids, out-of-vocabulary words are mapped to unknown_id """
+		(get, unknown_id) = (self.word_index.get, self.unknown_id)
+		return numpy.fromiter([get(word, unknown_id) for word in sentence], dtype=int, count=len(sentence))
+
+	def unknown_count(self, sentence, ids=None):
+		""" returns the number of distinct words in the sentence which are not part of the vocabulary """
+		if ids is None:
+			ids = self.encode(sentence)
+		return len(set(word for word, known in zip(sentence, self.in_vocabulary[ids]) if not known))
+
+	def emission_lattice(self, sentence):
+		""" returns the T x N matrix of log emission probabilities of the words of the sentence
+			the sentence is either a list of words or an int array of word ids of word_table (see from_counts),
+			whose first ids are the words of the model, every id beyond them is a different unknown word
+			the rows of a sentence without unknown words are gathered from the precomputed emission_columns, the rows of the
+			out-of-vocabulary words of other sentences are the cached unknown_column of the number of unknown words and the suffix
+		"""
+		ids = numpy.minimum(sentence, self.unknown_id) if isinstance(sentence, numpy.ndarray) else self.encode(sentence)
+		known = self.in_vocabulary[ids].all()
+		if known or not self.smoothed:
+			# the denominators do not depend on the sentence
+			emissions = self.emission_columns[ids]
+			if known or self.unknown_model is None:
+				return emissions
+			unknown_count = 0
+		elif isinstance(sentence, numpy.ndarray):
+			unknown_count = len(numpy.unique(sentence[~self.in_vocabulary[ids]]))
+			emissions = self.log_emissions[ids] - self.log_denominators(unknown_count)
+		else:
+			unknown_count = self.unknown_count(sentence, ids)
+			emissions = self.log_emissions[ids] - self.log_denominators(unknown_count)
+		if self.unknown_model is None:
+			return emissions
+		for t in numpy.flatnonzero(ids == self.unknown_id):
+			emissions[t] = self.unknown_column(unknown_count, self.word_table[sentence[t]] if isinstance(sentence, numpy.ndarray) else sentence[t])
+		return emissions
+
+class TestHMMModel(unittest.TestCase):
+	sentences = [['the/DT', 'dog/NN', 'barks/VBZ', './.'], ['a/DT', 'cat/NN', 'sleeps/VBZ', './.'], ['the/DT', 'old/JJ', 'dog/NN', 'sleeps/VBZ', './.'],
+		['dogs/NNS', 'bark/VBP', './.'], ['the/DT', 'cats/NNS', 'sleep/VBP', 'loudly/RB', './.']]
+	# sentences with unknown words, the unknown words of a sentence change its laplace denominators
+	test_sentences = [['the', 'dog', 'sleeps', '.'], ['a', 'puppy', 'barked', '.'], ['Rex', 'sleeps', '42', 'times', '.']]
+
+	def compile(self, sentence_list, suffix_model=False):
+		import program_fast # program_fast imports this module
+		(aa, bb, cc, vv) = ({}, {}, {}, set([]))
+		program_fast.merge_counts(aa, bb, cc, vv, program_fast.count_sentences(sentence_list))
+		return HMMModel(aa, bb, cc, vv, suffix_model)
+
+	def assertEqualModels(self, expected, model, exact=True):
+		""" compares the probabilities of two models whose states and words may be numbered differently """
+		equal = numpy.array_equal if exact else numpy.allclose
+		self.assertEqual(sorted(expected.states), sorted(model.states))
+		self.assertEqual(sorted(expected.words), sorted(model.words))
+		self.assertEqual(expected.vocabulary_size, model.vocabulary_size)
+		self.assertAlmostEqual(expected.empty_probability, model.empty_probability)
+		states = [model.state_index[s] for s in expected.states]
+		words = [model.word_index[word] for word in expected.words] + [model.unknown_id]
+		self.assertTrue(equal(expected.log_start, model.log_start[states]))
+		self.assertTrue(equal(expected.log_transitions, model.log_transitions[states][:, states]))
+		self.assertTrue(equal(expected.log_end, model.log_end[states]))
+		self.assertTrue(equal(expected.emission_columns, model.emission_columns[words][:, states]))
+		self.assertEqual(expected.unknown_model is None, model.unknown_model is None)
+		if expected.unknown_model is not None:
+			self.assertEqual(sorted(expected.unknown_model.keys), sorted(model.unknown_model.keys))
+			for key, log_ratios in zip(expected.unknown_model.keys, expected.unknown_model.log_ratios):
+				self.assertTrue(equal(log_ratios, model.unknown_model.log_ratios[model.unknown_model.key_index[key]][states]), key)
+		for sentence in self.test_sentences:
+			self.assertTrue(equal(expected.emission_lattice(sentence), model.emission_lattice(sentence)[:, states]))
+
+	def test_save_load(self):
+		for suffix_model in (False, True):
+			model = self.compile(self.sentences, suffix_model)
+			(handle, path) = tempfile.mkstemp()
+			os.close(handle)
+			try:
+				model.save(path)
+				loaded = HMMModel.load(path)
+				self.assertEqual(model.states, loaded.states)
+				self.assertEqual(model.words, loaded.words)
+				for name in ARRAYS:
+					self.assertTrue(numpy.array_equal(getattr(model, name), getattr(loaded, name)), name)
+				self.assertEqualModels(model, loaded)
+				self.assertNotEqual(model.version, loaded.version)
+			finally:
+				os.remove(path)
+
+	def update(self, model, sentence_list):
+		import program_fast
+		version = model.version
+		model.update(program_fast.count_sentences(sentence_list))
+		self.assertNotEqual(version, model.version)
+		return model
+
+	def test_update(self):
+		for suffix_model in (False, True):
+			# the later sentences add new tags and words, and new transitions and emissions of known ones
+			expected = self.compile(self.sentences, suffix_model)
+			self.assertEqualModels(expected, self.update(self.compile(self.sentences[:3], suffix_model), self.sentences[3:]), False)
+			model = self.compile(self.sentences[:2], suffix_model)
+			for sentence in self.sentences[2:]:
+				self.update(model, [sentence])
+			self.assertEqualModels(expected, model, False)
+			# the memory-mapped arrays of a loaded model are copied before they are changed
+			(handle, path) = tempfile.mkstemp()
+			os.close(handle)
+			try:
+				self.compile(self.sentences[:3], suffix_model).save(path)
+				self.assertEqualModels(expected, self.update(HMMModel.load(path), self.sentences[3:]), False)
+				self.assertEqualModels(self.compile(self.sentences[:3], suffix_model), HMMModel.load(path))
+			finally:
+				os.remove(path)
@@ -0,0 +1,133 @@
+""" counters and timers of the stages of the tagging pipeline (parse, train, compile, forward, backward, viterbi, ...)
+	every stage counts its calls, its wall time and the sentences and tokens it processed, hence the summary shows the throughput
+	of every stage. the time of a stage includes the time of the stages which run within it, e.g. the files are parsed lazily,
+	so the parse stage runs within the train and the decode stages. the stages listed in profile are run under cProfile and
+	their statistics are dumped to <profile_prefix>.<stage>.prof (see dump_profiles), profiled stages must not be nested.
+	stages run by worker processes are not recorded, only the time the parent waits for their results (the decode stage)
+"""
+import os
+import sys
+import time
+import atexit
+import cProfile
+import collections
+import contextlib
+
+class StageCounter(object):
+	""" the calls, the seconds, the sentences and the tokens of one stage """
+	def __init__(self):
+		self.calls = 0
+		self.seconds = 0.0
+		self.sentences = 0
+		self.tokens = 0
+
+class Instrumentation(object):
+	""" the counters of the stages in the order in which they ran first, a disabled instrumentation records nothing """
+	def __init__(self, profile=(), profile_prefix='profile', enabled=True):
+		self.stages = collections.OrderedDict()
+		self.profile = set(profile)
+		self.profile_prefix = profile_prefix
+		self.enabled = enabled
+		self.profilers = {}
+		self._profiling = False
+
+	@classmethod
+	def from_environment(cls, environment=os.environ):
+		""" returns the instrumentation requested by the environment variables TAGGER_INSTRUMENT=1 and TAGGER_PROFILE=<stage>,<stage>,...
+			(which implies TAGGER_INSTRUMENT, the statistics are dumped to TAGGER_PROFILE_PREFIX.<stage>.prof), None if neither is set
+		"""
+		profile = [name for name in environment.get('TAGGER_PROFILE', '').split(',') if name]
+		if not profile and environment.get('TAGGER_INSTRUMENT', '0') in ('', '0'):
+			return None
+		return cls(profile, environment.get('TAGGER_PROFILE_PREFIX', 'profile'))
+
+	def counter(self, name):
+		if not self.stages.has_key(name):
+			self.stages[name] = StageCounter()
+		return self.stages[name]
+
+	def count(self, name, sentences=0, tokens=0):
+		""" adds sentences and tokens to a stage without timing it """
+		if self.enabled:
+			counter = self.counter(name)
+			counter.sentences += sentences
+			counter.tokens += tokens
+
+	@contextlib.contextmanager
+	def stage(self, name, sentences=0, tokens=0):
+		""" times the block of a with statement as one call of a stage which processes the given sentences and tokens """
+		if not self.enabled:
+			yield
+			return
+		profiler = None
+		if name in self.profile and not self._profiling:
+			profiler = self.profilers.setdefault(name, cProfile.Profile())
+			self._profiling = True
+			profiler.enable()
+		start = time.time()
+		try:
+			yield
+		finally:
+			elapsed = time.time() - start
+			if profiler is not None:
+				profiler.disable()
+				self._profiling = False
+			counter = self.counter(name)
+			counter.calls += 1
+			counter.seconds += elapsed
+			counter.sentences += sentences
+			counter.tokens += tokens
+
+	def timed(self, name, sentence_iter, length=len):
+		""" yields the items of an iterator of sentences and records the time of every step of the iterator as one call of a stage,
+			length returns the number of tokens of an item. e.g. timed('parse', fileparser.iter_parse(paths)) records the time and the
+			throughput of the parser
+		"""
+		if not self.enabled:
+			for item in sentence_iter:
+				yield item
+			return
+		sentence_iter = iter(sentence_iter)
+		while True:
+			with self.stage(name):
+				item = next(sentence_iter, None)
+			if item is None:
+				return
+			self.count(name, 1, length(item))
+			yield item
+
+	def summary(self):
+		""" returns a list of one dictionary per stage with its counters and throughput """
+		summary = []
+		for name, counter in self.stages.iteritems():
+			summary.append({'stage': name, 'calls': counter.calls, 'seconds': counter.seconds, 'sentences': counter.sentences, 'tokens': counter.tokens,
+				'sentences_per_second': counter.sentences / counter.seconds if counter.seconds > 0 else None,
+				'tokens_per_second': counter.tokens / counter.seconds if counter.seconds > 0 else None})
+		return summary
+
+	def report(self, file=None):
+		""" prints the summary as a table, stages which process no sentences have no throughput """
+		file = file or sys.stdout
+		file.write('stage\tcalls\tseconds\tsentences\ttokens\tsentences/s\ttokens/s\n')
+		for stage in self.summary():
+			file.write('%s\t%d\t%.3f\t%d\t%d\t%s\t%s\n' % (stage['stage'], stage['calls'], stage['seconds'], stage['sentences'], stage['tokens'],
+				'%.0f' % (stage['sentences_per_second'], ) if stage['sentences'] and stage['sentences_per_second'] else '-',
+				'%.0f' % (stage['tokens_per_second'], ) if stage['tokens'] and stage['tokens_per_second'] else '-'))
+
+	def dump_profiles(self):
+		""" dumps the statistics of every profiled stage to <profile_prefix>.<stage>.prof and returns the paths """
+		paths = []
+		for name, profiler in self.profilers.iteritems():
+			paths.append('%s.%s.prof' % (self.profile_prefix, name))
+			profiler.dump_stats(paths[-1])
+		return paths
+
+	def report_at_exit(self, file=None):
+		""" prints the summary and dumps the profiles when the interpreter exits """
+		def report():
+			self.report(file)
+			self.dump_profiles()
+		atexit.register(report)
+
+# the instrumentation of the functions which are not given one, it records nothing
+DISABLED = Instrumentation(enabled=False)
@@ -0,0 +1,45 @@
+""" the log-sum-exp kernels of all algorithms: log(exp(x) + exp(y)) of two log probabilities (add for floats, logaddexp for arrays),
+	log(sum(exp(values))) along an axis of an array (logsumexp) and over consecutive segments of an array (reduceat)
+	the sums are shifted by their largest term, hence they neither overflow nor underflow, and log probabilities of -infinity
+	(probability 0) are neutral: a sum of nothing but -infinity is -infinity
+"""
+import math
+import numpy
+
+neg_inf = float('-infinity')
+
+logaddexp = numpy.logaddexp
+
+def add(x, y):
+	""" returns log(exp(x) + exp(y)) of two float log probabilities """
+	if x == neg_inf:
+		return y
+	if y == neg_inf:
+		return x
+	if x < y:
+		(x, y) = (y, x)
+	return x + math.log1p(math.exp(y - x))
+
+def _shift(peak):
+	""" the largest terms of sums, infinite ones (sums of -infinity only) are replaced by 0 in order not to compute -inf - -inf """
+	return numpy.where(numpy.isfinite(peak), peak, 0.0)
+
+def logsumexp(values, axis=None):
+	""" returns log(sum(exp(values))) along an axis of an array, or of all values as a float if axis is None """
+	values = numpy.asarray(values, dtype=float)
+	if values.size == 0:
+		return numpy.full(numpy.delete(values.shape, axis), neg_inf) if axis is not None else neg_inf
+	shift = _shift(values.max(axis=axis, keepdims=True))
+	with numpy.errstate(divide='ignore'): # log(0) is -infinity
+		result = numpy.log(numpy.exp(values - shift).sum(axis=axis, keepdims=True)) + shift
+	if axis is None:
+		return float(result.ravel()[0])
+	return numpy.squeeze(result, axis=axis)
+
+def reduceat(values, starts):
+	""" returns log(sum(exp(values[starts[k]:starts[k+1]]))) of every segment (the last one ends at the end of values) like numpy.ufunc.reduceat,
+		the first segment has to start at 0 and the segments must not be empty
+	"""
+	shift = _shift(numpy.maximum.reduceat(values, starts))
+	with numpy.errstate(divide='ignore'):
+		return numpy.log(numpy.add.reduceat(numpy.exp(values - numpy.repeat(shift, numpy.diff(numpy.append(starts, len(values))))), starts)) + shift
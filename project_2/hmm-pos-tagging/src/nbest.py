@@ -0,0 +1,128 @@
+""" n-best viterbi decoding by lazy k-best extraction (Huang and Chiang, Better k-best Parsing 2005, algorithm 3)
+	a viterbi pass computes the best score of every state j at every time step t, i.e. of the best path which ends in the node (t, j).
+	the paths which end in a node are then enumerated in the order of their scores on demand: a node keeps the paths found so far and
+	a heap of candidates (i, r), the r-th best path of the node (t-1, i) extended by the transition i -> j. the heap of a node starts
+	with the best path of every predecessor and the successor (i, r+1) of a candidate is only pushed when the next path of the node is
+	asked for, hence extracting the k best paths expands O(T k) candidates and the cost for small k is close to the one of the 1-best search
+"""
+import heapq
+import itertools
+import unittest
+import numpy
+import hmmmodel
+
+neg_inf = float('-infinity')
+END = -1 # the state of the final node (T, END), whose predecessors are the states at T-1 with a transition to END
+
+class LazyKBest(object):
+	""" the paths of the nodes of the T x N emission lattice of a sentence which have been extracted so far
+		paths[(t, j)][r] is the r-th best path which ends in the node (t, j) as (-score, i, r_), the path r_ of the node (t-1, i) extended by j
+	"""
+	def __init__(self, model, emissions):
+		self.model = model
+		self.emissions = emissions
+		self.length = len(emissions)
+		# viterbi pass, best[t][j] is the score of the best path of the node (t, j) (the first one which kth returns)
+		self.best = numpy.empty(emissions.shape)
+		self.best[0] = model.log_start + emissions[0]
+		for t in range(1, self.length):
+			self.best[t] = model.max_predecessors(self.best[t-1])[0] + emissions[t]
+		self.paths = {}
+		self.candidates = {}
+
+	def extend(self, score, t, j, i):
+		""" returns the score of a path of the node (t-1, i) extended by the node (t, j), added up like the scores of heap """
+		if j == END:
+			return score + self.model.log_end[i]
+		return (score + self.model.log_transitions[i, j]) + self.emissions[t, j]
+
+	def heap(self, t, j):
+		""" returns the candidate heap of the node (t, j), which starts with the best path of every predecessor """
+		node = (t, j)
+		if not self.candidates.has_key(node):
+			if j == END:
+				ids = numpy.arange(len(self.model.states))
+				scores = self.best[t-1] + self.model.log_end
+			else:
+				(start, end) = (self.model.predecessor_ptr[j], self.model.predecessor_ptr[j+1])
+				ids = self.model.predecessor_ids[start:end]
+				scores = (self.best[t-1][ids] + self.model.predecessor_log[start:end]) + self.emissions[t, j]
+			finite = scores > neg_inf
+			self.candidates[node] = [(-score, int(i), 0) for score, i in zip(scores[finite], ids[finite])]
+			heapq.heapify(self.candidates[node])
+		return self.candidates[node]
+
+	def kth(self, t, j, k):
+		""" returns the k-th best path (counting from 0) of the node (t, j) as (-score, i, r), None if the node has at most k paths """
+		node = (t, j)
+		if not self.paths.has_key(node):
+			self.paths[node] = [(-self.best[0, j], None, None)] if t == 0 and self.best[0, j] > neg_inf else []
+		paths = self.paths[node]
+		while len(paths) <= k and t > 0:
+			if len(paths) > 0:
+				# the successor of the last path of the node is only needed now
+				(score, i, r) = paths[-1]
+				successor = self.kth(t - 1, i, r + 1)
+				if successor is not None:
+					heapq.heappush(self.heap(t, j), (-self.extend(-successor[0], t, j, i), i, r + 1))
+			heap = self.heap(t, j)
+			if len(heap) == 0:
+				break
+			paths.append(heapq.heappop(heap))
+		return paths[k] if k < len(paths) else None
+
+	def path(self, k):
+		""" returns the log probability and the state ids of the k-th best path of the sentence, None if there are at most k paths """
+		final = self.kth(self.length, END, k)
+		if final is None:
+			return None
+		states = []
+		(t, (score, i, r)) = (self.length, final)
+		while i is not None:
+			t -= 1
+			states.append(i)
+			(_, i, r) = self.kth(t, i, r)
+		states.reverse()
+		return (-final[0], states)
+
+def nbest(model, emissions, k):
+	""" returns the at most k best paths of the T x N emission lattice of a sentence (see hmmmodel.HMMModel.emission_lattice) as a list of
+		(log probability, state ids) pairs, best first. the first path is the one of the viterbi algorithm, ties are broken by the smaller state id
+	"""
+	kbest = LazyKBest(model, emissions)
+	paths = []
+	for r in range(k):
+		path = kbest.path(r)
+		if path is None:
+			break
+		paths.append(path)
+	return paths
+
+class TestNBest(unittest.TestCase):
+	def model(self):
+		""" a random model of 4 states and 3 words, some transitions and emissions have the probability 0 """
+		random = numpy.random.RandomState(1)
+		def normalized(values):
+			with numpy.errstate(divide='ignore'):
+				return numpy.log(values / values.sum(axis=-1)[..., numpy.newaxis])
+		transitions = random.rand(4, 5) * (random.rand(4, 5) > 0.3)
+		start = normalized(random.rand(4))
+		emissions = normalized(random.rand(4, 4) * (random.rand(4, 4) > 0.2)).T
+		return hmmmodel.HMMModel.from_parameters(['A', 'B', 'C', 'D'], ['a', 'b', 'c'], start, normalized(transitions)[:, :4], normalized(transitions)[:, 4], emissions)
+
+	def test_brute_force(self):
+		model = self.model()
+		for sentence in (['a'], ['a', 'b'], ['c', 'c', 'a'], ['b', 'a', 'x', 'c'], ['c', 'b', 'b', 'a']):
+			emissions = model.emission_lattice(sentence)
+			paths = []
+			for states in itertools.product(range(len(model.states)), repeat=len(sentence)):
+				score = (model.log_start[states[0]] + emissions[0, states[0]]) + model.log_end[states[-1]]
+				for t in range(1, len(sentence)):
+					score += model.log_transitions[states[t-1], states[t]] + emissions[t, states[t]]
+				if score > neg_inf:
+					paths.append((score, list(states)))
+			paths.sort(reverse=True)
+			found = nbest(model, emissions, 20)
+			self.assertEqual(min(20, len(paths)), len(found))
+			self.assertTrue(numpy.allclose([score for score, states in paths[:20]], [probability for probability, states in found]))
+			self.assertEqual([states for score, states in paths[:20]], [states for probability, states in found])
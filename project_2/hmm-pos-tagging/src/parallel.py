@@ -0,0 +1,43 @@
+import itertools
+import multiprocessing
+
+# the function and the model of the active pool. they are set before the worker processes are forked,
+# hence every worker shares the (read-only) model pages of the parent instead of receiving a pickled copy per task
+_function = None
+_model = None
+
+def _apply(chunk):
+	return _function(_model, chunk)
+
+def chunks(iterable, size):
+	""" lazily splits an iterable into lists of at most size consecutive items """
+	iterator = iter(iterable)
+	chunk = list(itertools.islice(iterator, size))
+	while chunk:
+		yield chunk
+		chunk = list(itertools.islice(iterator, size))
+
+class WorkerPool(object):
+	""" a pool of worker processes which applies function(model, chunk) to chunks of a list
+		the model is never pickled: the workers are forked after it has been compiled and read it copy-on-write
+	"""
+	def __init__(self, function, model, workers):
+		global _function, _model
+		(_function, _model) = (function, model)
+		self.pool = multiprocessing.Pool(workers)
+
+	def map(self, items, chunksize=16):
+		""" returns the concatenated results of function(model, chunk) over consecutive chunks of items, in the order of the items """
+		return [result for results in self.pool.map(_apply, list(chunks(items, chunksize))) for result in results]
+
+	def imap(self, iterable, chunksize=16):
+		""" like map, but consumes the items lazily and yields the results one at a time """
+		for results in self.pool.imap(_apply, chunks(iterable, chunksize)):
+			for result in results:
+				yield result
+
+	def close(self):
+		global _function, _model
+		self.pool.close()
+		self.pool.join()
+		(_function, _model) = (None, None)
@@ -2,7 +2,9 @@ import os
 import copy
 import util
 import fileparser
-from logprobability import LogProbability
+import hmmmodel
+import numpy
+from logprobability import LogProbability, LogProbVector, LogProbMatrix
 from math import log, exp
 
 EMPTY = (0,0)
@@ -69,99 +71,101 @@ def train(transition_map, emission_map, count_map, vocabulary, sentence_list):
 			previous = tag
 		update_transitions(transition_map, fileparser.END, previous)
 
-def forward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence):
+def arrays(model, sentence):
+	""" returns the start, transition, end and emission probabilities of the compiled model for a sentence (list of words) as log probability arrays """
+	return (LogProbVector(model.log_start, logarithmic=True), LogProbMatrix(model.log_transitions, logarithmic=True),
+		LogProbVector(model.log_end, logarithmic=True), LogProbMatrix(model.emission_lattice(sentence), logarithmic=True))
+
+def forward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model=None):
 	""" this function implements the forward algorithm
 		the implementation follows the book SPEECH and LANGUAGE PROCESSING 2nd edition by Daniel Jurafsky and James H. Martin
 		it initializes a matrix of size N + 2 (where N is the number of states) x T (where T is the sentence length -> # time steps)
 		additionally it performs laplace smoothing on the observation in order to consider out-of-vocabulary terms
+		the probabilities are taken from the compiled model (see hmmmodel.HMMModel), pass a model in order to compile the maps only once for many sentences
+		a row of the matrix is a LogProbVector over the states, hence a time step is one vector-matrix product
 	"""
 	sentence = map(fileparser.map_extract_word, sentence)
-	# count unknown words
-	unknown_words = set([])
-	for word in sentence:
-		if not word in vocabulary:
-			unknown_words.add(word)
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	states = slice(1, len(model.states)+1)
 	# create forward probability matrix
 	N = len(count_map) + 1
 	T = len(sentence)
-	forward = [[LogProbability(0.0)]*N for i in range(T)]
+	forward = LogProbMatrix.zeros(T, N)
 	# check if empty sentence
 	if len(sentence) == 0:
-		return (transition_probability(transition_map, count_map, fileparser.END, fileparser.START), forward)
+		return (LogProbability(model.empty_probability), forward)
+	(start, transitions, end, emissions) = arrays(model, sentence)
 	# initialization step
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		forward[0][si] = transition_probability(transition_map, count_map, s, fileparser.START) * emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s)			
+	forward[0, states] = start * emissions[0]
 	# recursion step
 	for t in range(1, T):
-		for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-			forward[t][si] = sum([forward[t-1][si_] * transition_probability(transition_map, count_map, s, s_) * emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t], s) for si_, s_ in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1)], LogProbability(0.0))
+		forward[t, states] = forward[t-1, states].dot(transitions) * emissions[t]
 	# termination step
-	forward[T-1][N-1] = sum([forward[T-1][si] * transition_probability(transition_map, count_map, fileparser.END, s) for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1)], LogProbability(0.0))
-	return (forward[T-1][N-1], forward)
+	forward[T-1, N-1] = forward[T-1, states].dot(end)
+	return (forward[T-1, N-1], forward)
 
-def backward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence):
+def backward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model=None):
 	sentence = map(fileparser.map_extract_word, sentence)
-	# count unknown words
-	unknown_words = set([])
-	for word in sentence:
-		if not word in vocabulary:
-			unknown_words.add(word)
-	# create forward probability matrix
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	states = slice(1, len(model.states)+1)
+	# create backward probability matrix
 	N = len(count_map) + 1
 	T = len(sentence)
-	backward = [[LogProbability(0.0)]*N for i in range(T)]
+	backward = LogProbMatrix.zeros(T, N)
 	# check if empty sentence
 	if len(sentence) == 0:
-		return (transition_probability(transition_map, count_map, fileparser.END, fileparser.START), backward)
+		return (LogProbability(model.empty_probability), backward)
+	(start, transitions, end, emissions) = arrays(model, sentence)
 	# initialization step
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		backward[T-1][si] = transition_probability(transition_map, count_map, fileparser.END, s)
+	backward[T-1, states] = end
 	# recursion step
 	for t in reversed(range(0, T-1)):
-		for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-			backward[t][si] = sum([backward[t+1][_si] * transition_probability(transition_map, count_map, _s, s) * emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t+1], _s) for _si, _s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1)], LogProbability(0.0))
+		backward[t, states] = transitions.dot(backward[t+1, states] * emissions[t+1])
 	# termination step
-	backward[0][0] = sum([backward[0][si] * transition_probability(transition_map, count_map, s, fileparser.START) * emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s) for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1)], LogProbability(0.0))
-	return (backward[0][0], backward)			
+	backward[0, 0] = (start * emissions[0]).dot(backward[0, states])
+	return (backward[0, 0], backward)			
 
-def viterbi_algorithm(transition_map, emission_map, count_map, vocabulary, sentence):
+def viterbi_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model=None):
 	""" this function implements the viterbi algorithm
 		the implementation follows the book SPEECH and LANGUAGE PROCESSING 2nd edition by Daniel Jurafsky and James H. Martin
 		it initializes a matrix of size N + 2 (where N is the number of states) x T (where T is the sentence length -> # time steps)
 		additionally it does performs laplace smoothing on the observation in order to consider out-of-vocabulary terms
+		the probabilities are taken from the compiled model (see hmmmodel.HMMModel), pass a model in order to compile the maps only once for many sentences
+		a row of the matrix is a LogProbVector over the states, hence a time step is one max-product of a vector and a matrix
 	"""
 	sentence = map(fileparser.map_extract_word, sentence)
-	# count unknown words
-	unknown_words = set([])
-	for word in sentence:
-		if not word in vocabulary:
-			unknown_words.add(word)
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	states = slice(1, len(model.states)+1)
 	# create viterbi probability matrix
 	N = len(count_map) + 1
 	T = len(sentence)
-	viterbi = [[LogProbability(0.0)]*N for i in range(T)]
+	viterbi = LogProbMatrix.zeros(T, N)
 	backpointer = [[EMPTY]*N for i in range(T)]
 	tag_sequence = []
 	# check if empty sentence
 	if len(sentence) == 0:
-		return (transition_probability(transition_map, count_map, fileparser.END, fileparser.START), viterbi)
+		return (LogProbability(model.empty_probability), viterbi)
+	(start, transitions, end, emissions) = arrays(model, sentence)
 	# initialization step
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		viterbi[0][si] = transition_probability(transition_map, count_map, s, fileparser.START) * emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s)
-		backpointer[0][si] = EMPTY
+	viterbi[0, states] = start * emissions[0]
 	# recursion step
 	for t in range(1, T):
-		for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-			(viterbi[t][si], backpointer[t][si]) = max([(viterbi[t-1][si_] * transition_probability(transition_map, count_map, s, s_) * emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t], s), (si_, s_)) for si_, s_ in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1)])
+		(best, best_s_) = viterbi[t-1, states].max_dot(transitions)
+		viterbi[t, states] = best * emissions[t]
+		backpointer[t][states] = [(int(s_)+1, model.states[s_]) for s_ in best_s_]
 	# termination step
-	(viterbi[T-1][N-1], backpointer[T-1][N-1]) = max([(viterbi[T-1][si] * transition_probability(transition_map, count_map, fileparser.END, s), (si, s)) for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1)])
+	(viterbi[T-1, N-1], s) = viterbi[T-1, states].max_dot(end)
+	backpointer[T-1][N-1] = (int(s)+1, model.states[s])
 	# reconstruct path
 	pointer = backpointer[T-1][N-1]
 	while not pointer == EMPTY:
 		tag_sequence.append(pointer[1])
 		pointer = backpointer[T-len(tag_sequence)][pointer[0]]
 	tag_sequence.reverse()
-	return (viterbi[T-1][N-1], viterbi, backpointer, tag_sequence)
+	return (viterbi[T-1, N-1], viterbi, backpointer, tag_sequence)
 
 def initialize_custom_uniform_hmm(num_states):
 	a = {fileparser.START:{}}
@@ -176,14 +180,12 @@ def initialize_custom_uniform_hmm(num_states):
 			a[i][j] = 1.0
 	return (a, b, c)
 
-def forward_backward(transition_map, emission_map, count_map, vocabulary, sentence):
+def forward_backward(transition_map, emission_map, count_map, vocabulary, sentence, model=None):
 	# initialization of A and B done before calling forward_backward
 	# iterate until convergence
-	# count unknown words
-	unknown_words = set([])
-	for word in sentence:
-		if not word in vocabulary:
-			unknown_words.add(word)
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	states = slice(1, len(model.states)+1)
 
 	a = copy.deepcopy(transition_map)
 	for key in a.keys():
@@ -192,19 +194,15 @@ def forward_backward(transition_map, emission_map, count_map, vocabulary, senten
 			
 	b = copy.deepcopy(emission_map)
 	c = copy.deepcopy(count_map)
-	epsilon = [[[LogProbability(0.0)]*(len(count_map)+1) for i in range(len(count_map)+1)] for t in range(len(sentence))]
-	gamma = [[LogProbability(0.0)]*(len(count_map)+1) for t in range(len(sentence))]
-	(fp, forward) = forward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence)
-	(bp, backward) = backward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence)
+	(fp, forward) = forward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model)
+	(bp, backward) = backward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model)
+	if len(sentence) < 2:
+		return (a, b, c)
+	(start, transitions, end, emissions) = arrays(model, map(fileparser.map_extract_word, sentence))
 	# E-step
-	for j in range(1, len(count_map)):
-		gamma[0][j] = (forward[0][j] * backward[0][j]) / fp
-		epsilon[0][0][j] = (forward[0][j] * transition_probability(transition_map, count_map, j, fileparser.START) * emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], j) * backward[1][j]) / fp
-	for t in range(len(epsilon)-1):
-		for j in range(1, len(count_map)):
-			gamma[t][j] = (forward[t][j] * backward[t][j]) / fp
-			for i in range(1, len(count_map)):
-				epsilon[t][i][j] = (forward[t][i] * a[i][j] * emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t+1], j) * backward[t+1][j]) / fp
+	# gamma[t][j]: probability of being in state j at t, epsilon[t][i][j]: probability of being in state i at t and in state j at t+1
+	gamma = [(forward[t, states] * backward[t, states]) / fp for t in range(len(sentence))]
+	epsilon = [(transitions * LogProbMatrix.outer(forward[t, states], emissions[t+1] * backward[t+1, states])) / fp for t in range(len(sentence)-1)]
 #	util.prettyprint_list(gamma)
 #	util.prettyprint_list(epsilon)
 	print len(count_map)
@@ -212,17 +210,18 @@ def forward_backward(transition_map, emission_map, count_map, vocabulary, senten
 	print(b)
 	#M-step
 	#a^
-	for i in range(1, len(count_map)):
-		denominator = sum([sum([epsilon[t][i][j] for j in range(1, len(count_map))], LogProbability(0.0)) for t in range(0, len(epsilon)-1)], LogProbability(0.0))
-		for j in range(1, len(count_map)):
-			a[i][j] = sum([epsilon[t][i][j] for t in range(0, len(epsilon)-1)], LogProbability(0.0)) / denominator
+	numerator = sum(epsilon[1:], epsilon[0])
+	denominator = numerator.sum(axis=1)
+	for i, s in enumerate(model.states):
+		for j, s_ in enumerate(model.states):
+			a.setdefault(s, {})[s_] = numerator[i, j] / denominator[i]
 	# b^
-	for j in range(1, len(count_map)):
+	for s in model.states:
 		for word in sentence:
-			for t in range(1, len(epsilon)-1):
+			for t in range(1, len(sentence)-1):
 				if sentence[t] == word:
-					update_emissions(b, j, word)
-				update_counts(c, j)
+					update_emissions(b, s, word)
+				update_counts(c, s)
 	print(a)
 	print(b)
 	return(a, b, c)
@@ -269,6 +268,7 @@ def run_penn():
 	c_file = open('c.txt', 'w')
 	util.prettywrite_map(cc, c_file)
 	c_file.close()
+	model = hmmmodel.HMMModel(aa, bb, cc, vv)
 	print('training done.')
 	
 	# computing likelihood
@@ -279,8 +279,8 @@ def run_penn():
 			training_file = open(fileparser.resource_path + file, 'r')
 			sentence_list = fileparser.parse(training_file)
 			for sentence in sentence_list:
-				(forward_p, forward_table) = forward_algorithm(aa, bb, cc, vv, sentence)
-				(backward_p, backward_table) = backward_algorithm(aa, bb, cc, vv, sentence)
+				(forward_p, forward_table) = forward_algorithm(aa, bb, cc, vv, sentence, model)
+				(backward_p, backward_table) = backward_algorithm(aa, bb, cc, vv, sentence, model)
 				forward_file.write('%s\n %s\n %s\n\n' % (sentence, forward_p, backward_p))
 	print('likelihood computed.')
 	forward_file.close()
@@ -295,7 +295,7 @@ def run_penn():
 			training_file = open(fileparser.resource_path + file, 'r')
 			sentence_list = fileparser.parse(training_file)
 			for sentence in sentence_list:
-				(p, viterbi_table, viterbi_backpointer, tagger_sequence) = viterbi_algorithm(aa, bb, cc, vv, sentence)
+				(p, viterbi_table, viterbi_backpointer, tagger_sequence) = viterbi_algorithm(aa, bb, cc, vv, sentence, model)
 				human_sequence = map(fileparser.map_extract_tag, sentence)
 				# update tagger accuracy information
 				for i in range(min(len(human_sequence), len(tagger_sequence))): # because of underflow it is possible that the tag sequences are not equal in length...s
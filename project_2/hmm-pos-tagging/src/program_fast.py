@@ -1,7 +1,21 @@
 ﻿import os
 import copy
+import time
+import itertools
+import unittest
+import collections
+import StringIO
 import util
 import fileparser
+import hmmmodel
+import symbols
+import logsumexp
+import batch
+import parallel
+import nbest
+import cache
+import instrumentation
+import numpy
 from math import log, exp
 
 EMPTY = (0,0)
@@ -68,142 +82,217 @@ def train(transition_map, emission_map, count_map, vocabulary, sentence_list):
 			previous = tag
 		update_transitions(transition_map, fileparser.END, previous)
 
-def forward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence):
+def count_sentences(sentence_list):
+	""" counts the transition-, observation- and prior frequencies of a list of sentences into mergeable count tables
+		the tables are lists of (key, frequency) pairs in the order in which train encounters every key for the first time,
+		hence merging the tables of consecutive parts of a corpus in their order (see merge_counts) builds exactly the same maps as train
+	"""
+	transitions = collections.OrderedDict()
+	emissions = collections.OrderedDict()
+	counts = collections.OrderedDict()
+	words = collections.OrderedDict()
+	for sentence in sentence_list:
+		previous = fileparser.START
+		counts[previous] = counts.get(previous, 0.0) + 1.0
+		for term in sentence:
+			word = term.split('/')[0]
+			words[word] = None
+			tag = term.split('/')[1].split('|')[0]
+			transitions[(previous, tag)] = transitions.get((previous, tag), 0.0) + 1.0
+			emissions[(tag, word)] = emissions.get((tag, word), 0.0) + 1.0
+			counts[tag] = counts.get(tag, 0.0) + 1.0
+			previous = tag
+		transitions[(previous, fileparser.END)] = transitions.get((previous, fileparser.END), 0.0) + 1.0
+	return (transitions.items(), emissions.items(), counts.items(), words.keys())
+
+def count_ids(sentence_list, word_count, tag_count):
+	""" counts the transition- and emission frequencies of sentences given as pairs of word and tag id arrays (see fileparser.iter_parse_ids)
+		returns the M x M transition frequencies, M = tag_count + 1 (see hmmmodel.HMMModel.transition_counts), and the
+		word_count x tag_count emission frequencies. the ids of all sentences are counted at once
+	"""
+	(given, tags, word_ids, tag_ids) = ([], [], [], [])
+	for words, sentence_tags in sentence_list:
+		# state ids, 0 is START before and END after the sentence
+		sequence = numpy.concatenate(([0], sentence_tags + 1, [0]))
+		given.append(sequence[:-1])
+		tags.append(sequence[1:])
+		word_ids.append(words)
+		tag_ids.append(sentence_tags)
+	M = tag_count + 1
+	transitions = numpy.bincount(numpy.concatenate(given) * M + numpy.concatenate(tags), minlength=M * M).reshape(M, M)
+	emissions = numpy.bincount(numpy.concatenate(word_ids) * tag_count + numpy.concatenate(tag_ids), minlength=word_count * tag_count)
+	return (transitions.astype(float), emissions.reshape(word_count, tag_count).astype(float))
+
+def count_file(path, sentences_file=None):
+	""" returns the count tables (see count_sentences) of a training file, if sentences_file is given the parsed sentences are written to it
+		like run_penn writes them to sentences.txt (see util.prettywrite_stream)
+	"""
+	sentence_iter = fileparser.iter_parse(path)
+	if sentences_file is not None:
+		sentence_iter = util.prettywrite_stream(sentence_iter, sentences_file)
+	return count_sentences(sentence_iter)
+
+def count_file_text(path):
+	""" returns the count tables of a training file and the text of its parsed sentences (see count_file) """
+	text = StringIO.StringIO()
+	tables = count_file(path, text)
+	return (tables, text.getvalue())
+
+def merge_counts(transition_map, emission_map, count_map, vocabulary, tables):
+	""" adds count tables (see count_sentences) to the transition-, observation- and prior frequencies """
+	(transitions, emissions, counts, words) = tables
+	for (given, tag), frequency in transitions:
+		if not transition_map.has_key(given):
+			transition_map[given] = {}
+		transition_map[given][tag] = transition_map[given].get(tag, 0.0) + frequency
+	for (tag, word), frequency in emissions:
+		if not emission_map.has_key(tag):
+			emission_map[tag] = {}
+		emission_map[tag][word] = emission_map[tag].get(word, 0.0) + frequency
+	for tag, frequency in counts:
+		count_map[tag] = count_map.get(tag, 0.0) + frequency
+	for word in words:
+		vocabulary.add(word)
+
+def train_files(transition_map, emission_map, count_map, vocabulary, path_list, workers=None, sentences_file=None):
+	""" trains on a list of training files, every file is counted in a separate process of a pool of workers (map)
+		and the count tables are merged in the order of the files (reduce). the resulting maps are identical to the ones of
+		training the files one after another
+		if sentences_file is given the parsed sentences of every file are written to it in the order of the files (see count_file),
+		the workers return the text of their file with its count tables, hence no file is parsed twice
+	"""
+	if workers is None:
+		table_list = [count_file(path, sentences_file) for path in path_list]
+	elif sentences_file is None:
+		pool = parallel.WorkerPool(lambda model, paths: map(count_file, paths), None, workers)
+		table_list = pool.map(path_list, 1)
+		pool.close()
+	else:
+		pool = parallel.WorkerPool(lambda model, paths: map(count_file_text, paths), None, workers)
+		table_list = []
+		for tables, text in pool.imap(path_list, 1):
+			sentences_file.write(text)
+			table_list.append(tables)
+		pool.close()
+	for tables in table_list:
+		merge_counts(transition_map, emission_map, count_map, vocabulary, tables)
+
+def update_model(model, transition_map, emission_map, count_map, vocabulary, sentence_list):
+	""" adds newly tagged sentences to the transition-, observation- and prior frequencies and to the model compiled from them
+		(see hmmmodel.HMMModel.update), the model is updated in place instead of being compiled again
+	"""
+	tables = count_sentences(sentence_list)
+	merge_counts(transition_map, emission_map, count_map, vocabulary, tables)
+	model.update(tables)
+
+def forward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model=None):
 	""" this function implements the forward algorithm
 		the implementation follows the book SPEECH and LANGUAGE PROCESSING 2nd edition by Daniel Jurafsky and James H. Martin
 		it initializes a matrix of size N + 2 (where N is the number of states) x T (where T is the sentence length -> # time steps)
 		additionally it performs laplace smoothing on the observation in order to consider out-of-vocabulary terms
+		the probabilities are taken from the compiled model (see hmmmodel.HMMModel) and every time step is one log-sum-exp over the nonzero transitions only (see hmmmodel.HMMModel.sum_predecessors),
+		pass a model in order to compile the maps only once for many sentences
 	"""
 	sentence = map(fileparser.map_extract_word, sentence)
-	# count unknown words
-	unknown_words = set([])
-	for word in sentence:
-		if not word in vocabulary:
-			unknown_words.add(word)
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
 	# create forward probability matrix
-	N = len(count_map) + 1
+	N = len(model.states) + 2
 	T = len(sentence)
 	forward = [[float('-infinity')]*N for i in range(T)]
 	# check if empty sentence
 	if len(sentence) == 0:
-		return (transition_probability(transition_map, count_map, fileparser.END, fileparser.START), forward)
+		return (model.empty_probability, forward)
+	emissions = model.emission_lattice(sentence)
 	# initialization step
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		if (transition_probability(transition_map, count_map, s, fileparser.START) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s) > 0):
-			forward[0][si] = log(transition_probability(transition_map, count_map, s, fileparser.START)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s))			
+	current = model.log_start + emissions[0]
+	forward[0][1:len(model.states)+1] = current.tolist()
 	# recursion step
 	for t in range(1, T):
-		for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-			cell_initialized = False # This flag is needed in order to use log scale probabilities. The cell is initialized to 0.0 which is undefined for log.
-			for si_, s_ in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-				if not cell_initialized:
-					if (forward[t-1][si_] > float('-infinity') and transition_probability(transition_map, count_map, s, s_) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t], s) > 0):
-						forward[t][si] = forward[t-1][si_] + log(transition_probability(transition_map, count_map, s, s_)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t], s))
-						cell_initialized = True
-				else:
-					if (forward[t-1][si_] > float('-infinity') and transition_probability(transition_map, count_map, s, s_) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t], s) > 0):
-						forward[t][si] += log(1 + exp((forward[t-1][si_] + log(transition_probability(transition_map, count_map, s, s_)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t], s))) - forward[t][si]))  
+		current = model.sum_predecessors(current) + emissions[t]
+		forward[t][1:len(model.states)+1] = current.tolist()
 	# termination step
-	cell_initialized = False
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		if not cell_initialized:
-			if (forward[T-1][si] > float('-infinity') and transition_probability(transition_map, count_map, fileparser.END, s) > 0):
-				forward[T-1][N-1] = forward[T-1][si] + log(transition_probability(transition_map, count_map, fileparser.END, s))
-				cell_initialized = True
-		else:
-			if (forward[T-1][si] > float('-infinity') and transition_probability(transition_map, count_map, fileparser.END, s) > 0):
-				forward[T-1][N-1] += log(1 + exp((forward[T-1][si] + log(transition_probability(transition_map, count_map, fileparser.END, s))) - forward[T-1][N-1]))
+	forward[T-1][N-1] = logsumexp.logsumexp(current + model.log_end)
 	return (forward[T-1][N-1], forward)
 
-def backward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence):
+def backward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model=None):
 	sentence = map(fileparser.map_extract_word, sentence)
-	# count unknown words
-	unknown_words = set([])
-	for word in sentence:
-		if not word in vocabulary:
-			unknown_words.add(word)
-	# create forward probability matrix
-	N = len(count_map) + 1
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	# create backward probability matrix
+	N = len(model.states) + 2
 	T = len(sentence)
 	backward = [[float('-infinity')]*N for i in range(T)]
 	# check if empty sentence
 	if len(sentence) == 0:
-		return (transition_probability(transition_map, count_map, fileparser.END, fileparser.START), backward)
+		return (model.empty_probability, backward)
+	emissions = model.emission_lattice(sentence)
 	# initialization step
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		if (transition_probability(transition_map, count_map, fileparser.END, s) > 0):
-			backward[T-1][si] = log(transition_probability(transition_map, count_map, fileparser.END, s))
+	current = model.log_end
+	backward[T-1][1:len(model.states)+1] = current.tolist()
 	# recursion step
 	for t in reversed(range(0, T-1)):
-		for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-			cell_initialized = False # This flag is needed in order to use log scale probabilities. The cell is initialized to 0.0 which is undefined for log.
-			for _si, _s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-				if not cell_initialized:
-					if (backward[t+1][_si] > float('-infinity') and transition_probability(transition_map, count_map, _s, s) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t+1], _s) > 0):
-						backward[t][si] = backward[t+1][_si] + log(transition_probability(transition_map, count_map, _s, s)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t+1], _s))
-						cell_initialized = True
-				else:
-					if (backward[t+1][_si] > float('-infinity') and transition_probability(transition_map, count_map, _s, s) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t+1], _s) > 0):
-						backward[t][si] += log(1 + exp((backward[t+1][_si] + log(transition_probability(transition_map, count_map, _s, s)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t+1], _s))) - backward[t][si]))  
-	
+		current = model.sum_successors(current + emissions[t+1])
+		backward[t][1:len(model.states)+1] = current.tolist()
 	# termination step
-	cell_initialized = False
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		if not cell_initialized:
-			if (backward[0][si] > float('-infinity') and transition_probability(transition_map, count_map, s, fileparser.START) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s) > 0):
-				backward[0][0] = backward[0][si] + log(transition_probability(transition_map, count_map, s, fileparser.START)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s))
-				cell_initialized = True
-		else:
-			if (backward[0][si] > float('-infinity') and transition_probability(transition_map, count_map, s, fileparser.START) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s) > 0):
-				backward[0][0] += log(1 + exp((backward[0][si] + log(transition_probability(transition_map, count_map, s, fileparser.START)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s))) - backward[0][0]))
-	return (backward[0][0], backward)			
+	backward[0][0] = logsumexp.logsumexp(current + model.log_start + emissions[0])
+	return (backward[0][0], backward)
 
-def viterbi_algorithm(transition_map, emission_map, count_map, vocabulary, sentence):
+def viterbi_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model=None, beam=None, threshold=None):
 	""" this function implements the viterbi algorithm
 		the implementation follows the book SPEECH and LANGUAGE PROCESSING 2nd edition by Daniel Jurafsky and James H. Martin
 		it initializes a matrix of size N + 2 (where N is the number of states) x T (where T is the sentence length -> # time steps)
 		additionally it does performs laplace smoothing on the observation in order to consider out-of-vocabulary terms
+		the probabilities are taken from the compiled model (see hmmmodel.HMMModel) and every time step is one maximization over the nonzero transitions only (see hmmmodel.HMMModel.max_predecessors),
+		pass a model in order to compile the maps only once for many sentences
+		if beam and/or threshold are given the search is pruned: at every time step only the beam best states, or the states whose
+		log probability is at most threshold below the best one, are expanded into their successors (see beam_states).
+		the pruned search is faster but may miss the most likely tag sequence, cells of pruned paths are -infinity
 	"""
 	sentence = map(fileparser.map_extract_word, sentence)
-	# count unknown words
-	unknown_words = set([])
-	for word in sentence:
-		if not word in vocabulary:
-			unknown_words.add(word)
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	states = model.states
+	pruned = beam is not None or threshold is not None
 	# create viterbi probability matrix
-	N = len(count_map) + 1
+	N = len(model.states) + 2
 	T = len(sentence)
 	viterbi = [[float('-infinity')]*N for i in range(T)]
 	backpointer = [[EMPTY]*N for i in range(T)]
 	tag_sequence = []
 	# check if empty sentence
 	if len(sentence) == 0:
-		return (transition_probability(transition_map, count_map, fileparser.END, fileparser.START), viterbi)
+		return (model.empty_probability, viterbi)
+	emissions = model.emission_lattice(sentence)
 	# initialization step
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		if (transition_probability(transition_map, count_map, s, fileparser.START) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s) > 0):
-			viterbi[0][si] = log(transition_probability(transition_map, count_map, s, fileparser.START)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], s))
-			backpointer[0][si] = EMPTY
+	current = model.log_start + emissions[0]
+	viterbi[0][1:len(states)+1] = current.tolist()
 	# recursion step
 	for t in range(1, T):
-		for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-			current_max = float('-infinity')
-			for si_, s_ in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-				if (viterbi[t-1][si_] > float('-infinity') and transition_probability(transition_map, count_map, s, s_) > 0 and emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t], s) > 0):
-					current_prob = viterbi[t-1][si_] + log(transition_probability(transition_map, count_map, s, s_)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t], s))
-					if current_prob > current_max:
-						viterbi[t][si] = current_prob
-						backpointer[t][si] = (si_, s_)
-						current_max = current_prob
+		if pruned:
+			# only the observed successors of the states in the beam are expanded (see hmmmodel.HMMModel.successor_edges)
+			active = beam_states(current, beam, threshold)
+			(positions, edges) = model.successor_edges(active)
+			targets = model.successor_ids[edges]
+			# the scores of the expanded transitions are scattered into a beam x N table, the other cells stay -infinity
+			scores = numpy.empty((len(active), len(states)))
+			scores.fill(float('-infinity'))
+			scores[positions, targets] = (current[active][positions] + model.successor_log[edges]) + emissions[t][targets]
+			best = scores.argmax(axis=0)
+			current = scores[best, numpy.arange(len(states))]
+			best = active[best]
+		else:
+			(current, best) = model.max_predecessors(current) # best[j]: the best predecessor at t-1 of state j at t
+			current = current + emissions[t]
+		viterbi[t][1:len(states)+1] = current.tolist()
+		for si in numpy.flatnonzero(current > float('-infinity')):
+			backpointer[t][si+1] = (int(best[si]) + 1, states[best[si]])
 	# termination step
-	current_max = float('-infinity')
-	for si, s in enumerate(filter(fileparser.filter_start_end_states, count_map.keys()), 1):
-		if (viterbi[T-1][si] > float('-infinity') and transition_probability(transition_map, count_map, fileparser.END, s) > 0):
-			current_prob = viterbi[T-1][si] + log(transition_probability(transition_map, count_map, fileparser.END, s))
-			if current_prob > current_max:
-				viterbi[T-1][N-1] = current_prob
-				backpointer[T-1][N-1] = (si, s)
-				current_max = current_prob
+	scores = current + model.log_end
+	best = scores.argmax()
+	if scores[best] > float('-infinity'):
+		viterbi[T-1][N-1] = float(scores[best])
+		backpointer[T-1][N-1] = (int(best) + 1, states[best])
 	# trace back
 	pointer = backpointer[T-1][N-1]
 	while not pointer == EMPTY:
@@ -212,6 +301,127 @@ def viterbi_algorithm(transition_map, emission_map, count_map, vocabulary, sente
 	tag_sequence.reverse()
 	return (viterbi[T-1][N-1], viterbi, backpointer, tag_sequence)
 
+def posterior_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model=None):
+	""" posterior decoding: one forward and one backward pass over the emission lattice give the posterior log probabilities
+		log P(state j at t | sentence) = forward[t][j] + backward[t][j] - log P(sentence) of every state at every time step
+		every word is tagged with its most probable state and the confidence of the tag is the posterior probability of that state.
+		the tags maximize the expected number of correct tags, unlike the ones of viterbi_algorithm they need not form a path of the model
+		returns (forward_p, backward_p, posteriors, tag_sequence, confidences), posteriors is a T x N array over the states of the model,
+		the tag sequence and the confidences are empty if the sentence has no path with a probability > 0
+		the sentence is a list of words or word/tag terms, or an int array of word ids (see hmmmodel.HMMModel.emission_lattice)
+	"""
+	sentence = fileparser.extract_words(sentence)
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	T = len(sentence)
+	if T == 0:
+		return (model.empty_probability, model.empty_probability, numpy.zeros((0, len(model.states))), [], [])
+	emissions = model.emission_lattice(sentence)
+	(forward_p, forward) = forward_lattice(model, emissions)
+	(backward_p, backward) = backward_lattice(model, emissions)
+	posteriors = posterior_lattice(forward_p, forward, backward)
+	if forward_p == float('-infinity'):
+		return (forward_p, backward_p, posteriors, [], [])
+	best = posteriors.argmax(axis=1)
+	confidences = numpy.exp(posteriors[numpy.arange(T), best])
+	return (forward_p, backward_p, posteriors, [model.states[s] for s in best], confidences.tolist())
+
+def forward_lattice(model, emissions):
+	""" runs the forward recursion of forward_algorithm over the T x N emission lattice of a sentence (see hmmmodel.HMMModel.emission_lattice)
+		and returns the log likelihood and the T x N forward table over the states of the model
+	"""
+	T = len(emissions)
+	forward = numpy.empty(emissions.shape)
+	forward[0] = model.log_start + emissions[0]
+	for t in range(1, T):
+		forward[t] = model.sum_predecessors(forward[t-1]) + emissions[t]
+	return (logsumexp.logsumexp(forward[T-1] + model.log_end), forward)
+
+def backward_lattice(model, emissions):
+	""" runs the backward recursion of backward_algorithm over the T x N emission lattice of a sentence
+		and returns the log likelihood and the T x N backward table over the states of the model
+	"""
+	T = len(emissions)
+	backward = numpy.empty(emissions.shape)
+	backward[T-1] = model.log_end
+	for t in reversed(range(0, T-1)):
+		backward[t] = model.sum_successors(backward[t+1] + emissions[t+1])
+	return (logsumexp.logsumexp(backward[0] + model.log_start + emissions[0]), backward)
+
+def viterbi_lattice(model, emissions):
+	""" runs the viterbi recursion of viterbi_algorithm over the T x N emission lattice of a sentence and returns the log probability
+		of the most likely path and its state ids, the path is empty if the sentence has no path with a probability > 0
+	"""
+	T = len(emissions)
+	backpointer = numpy.zeros(emissions.shape, dtype=int)
+	current = model.log_start + emissions[0]
+	for t in range(1, T):
+		(current, backpointer[t]) = model.max_predecessors(current) # backpointer[t][j]: the best predecessor at t-1 of state j at t
+		current = current + emissions[t]
+	scores = current + model.log_end
+	best = scores.argmax()
+	if scores[best] == float('-infinity'):
+		return (float('-infinity'), [])
+	path = [best]
+	for t in reversed(range(1, T)):
+		path.append(backpointer[t][path[-1]])
+	path.reverse()
+	return (float(scores[best]), path)
+
+def posterior_lattice(forward_p, forward, backward):
+	""" returns the T x N posterior log probabilities log P(state j at t | sentence) of the forward and backward tables of a sentence,
+		they are -infinity if the sentence has no path with a probability > 0
+	"""
+	if forward_p == float('-infinity'):
+		return numpy.repeat(float('-infinity'), forward.size).reshape(forward.shape)
+	return (forward + backward) - forward_p
+
+def analyze(model, sentence, instruments=None):
+	""" analyzes a sentence (a list of words or word/tag terms, or an int array of word ids, see hmmmodel.HMMModel.emission_lattice) with one emission lattice, over which the forward, the backward and the
+		viterbi recursion run. returns (forward_p, backward_p, viterbi_p, tag_sequence, posteriors): the values of forward_algorithm,
+		backward_algorithm and viterbi_algorithm and the T x N posterior log probabilities of the states (see posterior_algorithm)
+		the lattice, forward, backward and viterbi stages are recorded by instruments (see instrumentation.Instrumentation)
+	"""
+	instruments = instruments or instrumentation.DISABLED
+	sentence = fileparser.extract_words(sentence)
+	T = len(sentence)
+	if T == 0:
+		return (model.empty_probability, model.empty_probability, model.empty_probability, [], numpy.zeros((0, len(model.states))))
+	with instruments.stage('lattice', 1, T):
+		emissions = model.emission_lattice(sentence)
+	with instruments.stage('forward', 1, T):
+		(forward_p, forward) = forward_lattice(model, emissions)
+	with instruments.stage('backward', 1, T):
+		(backward_p, backward) = backward_lattice(model, emissions)
+	with instruments.stage('viterbi', 1, T):
+		(viterbi_p, path) = viterbi_lattice(model, emissions)
+	return (forward_p, backward_p, viterbi_p, [model.states[s] for s in path], posterior_lattice(forward_p, forward, backward))
+
+def nbest_viterbi_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, k, model=None):
+	""" returns the k most likely tag sequences of a sentence as a list of (log probability, tag_sequence) pairs, the most likely one first
+		the first one is the one of viterbi_algorithm, the others are extracted lazily from the same lattice (see nbest.LazyKBest),
+		there are less than k sequences if the sentence has less than k paths with a probability > 0
+	"""
+	sentence = map(fileparser.map_extract_word, sentence)
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	if len(sentence) == 0:
+		return [(model.empty_probability, [])]
+	return [(float(p), [model.states[s] for s in path]) for p, path in nbest.nbest(model, model.emission_lattice(sentence), k)]
+
+def beam_states(scores, beam=None, threshold=None):
+	""" returns the ids of the states kept by a beam over the log probabilities scores of one time step:
+		the beam best states whose score is at most threshold below the best one (all states if none of them has a finite score)
+	"""
+	keep = numpy.flatnonzero(scores > float('-infinity'))
+	if len(keep) == 0:
+		return numpy.arange(len(scores))
+	if threshold is not None:
+		keep = keep[scores[keep] >= scores[keep].max() - threshold]
+	if beam is not None and len(keep) > beam:
+		keep = keep[numpy.argpartition(-scores[keep], beam - 1)[:beam]]
+	return keep
+
 def initialize_custom_uniform_hmm(num_states):
 	a = {fileparser.START:{}}
 	b = {}
@@ -225,14 +435,12 @@ def initialize_custom_uniform_hmm(num_states):
 			a[i][j] = 1.0
 	return (a, b, c)
 
-def forward_backward(transition_map, emission_map, count_map, vocabulary, sentence):
+def forward_backward(transition_map, emission_map, count_map, vocabulary, sentence, model=None):
 	# initialization of A and B done before calling forward_backward
 	# iterate until convergence
-	# count unknown words
-	unknown_words = set([])
-	for word in sentence:
-		if not word in vocabulary:
-			unknown_words.add(word)
+	if model is None:
+		model = hmmmodel.HMMModel(transition_map, emission_map, count_map, vocabulary)
+	states = model.states
 
 	a = copy.deepcopy(transition_map)
 	for key in a.keys():
@@ -241,52 +449,42 @@ def forward_backward(transition_map, emission_map, count_map, vocabulary, senten
 			
 	b = copy.deepcopy(emission_map)
 	c = copy.deepcopy(count_map)
-	epsilon = [[[float(0)]*(len(count_map)+1) for i in range(len(count_map)+1)] for t in range(len(sentence))]
-	gamma = [[float(0)]*(len(count_map)+1) for t in range(len(sentence))]
-	(fp, forward) = forward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence)
-	(bp, backward) = backward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence)
+	(fp, forward) = forward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model)
+	(bp, backward) = backward_algorithm(transition_map, emission_map, count_map, vocabulary, sentence, model)
+	if len(sentence) < 2:
+		return (a, b, c)
+	forward = numpy.array(forward)[:, 1:len(states)+1]
+	backward = numpy.array(backward)[:, 1:len(states)+1]
+	words = map(fileparser.map_extract_word, sentence)
+	emissions = model.emission_lattice(words)
 	# E-step
-#	for j in range(1, len(count_map)):
-#		gamma[0][j] = (forward[0][j] + backward[0][j]) - fp
-#		epsilon[0][0][j] = (forward[0][j] + log(transition_probability(transition_map, count_map, j, fileparser.START)) + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[0], j)) + backward[1][j]) - fp
-	for t in range(len(epsilon)-1):
-		for j in range(1, len(count_map)):
-			gamma[t][j] = (forward[t][j] + backward[t][j]) - fp
-			for i in range(1, len(count_map)):
-				epsilon[t][i][j] = (forward[t][i] + a[i][j] + log(emission_probability(emission_map, count_map, vocabulary, len(unknown_words), sentence[t+1], j)) + backward[t+1][j]) - fp
-#	util.prettyprint_list(gamma)
-#	util.prettyprint_list(epsilon)
-	print len(count_map)
-	print(a)
-	print(b)
+	# numerator[i][j]: log of the expected number of transitions from state i to state j, i.e. of the sum over t of the probabilities
+	# of being in state i at t and in state j at t+1. it is accumulated one time step at a time, hence only N x N values are kept
+	numerator = numpy.empty((len(states), len(states)))
+	numerator.fill(float('-infinity'))
+	for t in range(len(sentence)-1):
+		numerator = logsumexp.logaddexp(numerator, ((forward[t][:, numpy.newaxis] + model.log_transitions) + (emissions[t+1] + backward[t+1])) - fp)
+	# expected_emissions[j][k]: log of the expected number of times state j emits the k-th distinct word of the sentence,
+	# the sum of the posteriors P(state j at t | sentence) of the time steps t of the word, an N x V accumulator
+	vocabulary_list = list(collections.OrderedDict.fromkeys(words))
+	word_index = dict((word, k) for k, word in enumerate(vocabulary_list))
+	expected_emissions = numpy.empty((len(states), len(vocabulary_list)))
+	expected_emissions.fill(float('-infinity'))
+	for t in range(len(sentence)):
+		k = word_index[words[t]]
+		expected_emissions[:, k] = logsumexp.logaddexp(expected_emissions[:, k], (forward[t] + backward[t]) - fp)
 	#M-step
 	#a^
-	for i in range(1, len(count_map)):
-		for j in range(1, len(count_map)):
-			a[i][j] = epsilon[0][i][j]
-	for i in range(1, len(count_map)):
-		for j in range(1, len(count_map)):
-			for t in range(1, len(epsilon)-1):
-				a[i][j] += log(1.0 + exp(epsilon[t][i][j]- a[i][j]))
-	# calculating denominator
-	for i in range(1, len(count_map)):
-		denominator = epsilon[0][i][1]
-		for j in range(2, len(count_map)):
-			denominator += log(1.0 + exp(epsilon[0][i][j] - denominator))
-		for t in range(1, len(epsilon)-1):
-			for j in range(1, len(count_map)):
-				denominator += log(1.0 + exp(epsilon[t][i][j] - denominator))
-		for j in range(1, len(count_map)):
-			a[i][j] -= denominator
-	# b^
-	for j in range(1, len(count_map)):
-		for word in sentence:
-			for t in range(1, len(epsilon)-1):
-				if sentence[t] == word:
-					update_emissions(b, j, word)
-				update_counts(c, j)
-	print(a)
-	print(b)
+	denominator = logsumexp.logsumexp(numerator, axis=1)
+	with numpy.errstate(invalid='ignore'): # states which are never visited have no transitions to normalize
+		for si, s in enumerate(states):
+			for sj, s_ in enumerate(states):
+				a.setdefault(s, {})[s_] = float(numerator[si][sj] - denominator[si])
+	# b^, the expected emission frequencies and the expected number of visits of every state, like the frequencies of train
+	expected_emissions = numpy.exp(expected_emissions)
+	for si, s in enumerate(states):
+		b[s] = dict((word, float(expected_emissions[si, k])) for k, word in enumerate(vocabulary_list) if expected_emissions[si, k] > 0.0)
+		c[s] = float(expected_emissions[si].sum())
 	return(a, b, c)
 
 def transition_probability(transition_map, count_map, e, e_given):
@@ -311,66 +509,231 @@ def emission_probability(emission_map, count_map, vocabulary, unknown, e, e_give
 	else: # tag is unknown
 		return 0.0
 
-def run_penn():
+def decode_sentences(model, sentence_list, batch_size=None, instruments=None, posterior=False, cache=None):
+	""" returns the tuple (forward_p, backward_p, viterbi_p, tag_sequence) of every sentence, the sentences are lists of word/tag terms (or words)
+		or int arrays of the word ids of the model (see hmmmodel.HMMModel.from_counts)
+		if batch_size is given the sentences are decoded in batches of that size (see batch.decode_batch)
+		every sentence is analyzed with one emission lattice (see analyze), whose stages are recorded by instruments (see instrumentation.Instrumentation)
+		if posterior is True the tags are decoded from the same forward and backward pass (see posterior_algorithm) instead of by a viterbi pass,
+		and the tuples are (forward_p, backward_p, None, tag_sequence, confidences)
+		if a cache is given (see cache.DecodeCache) only the sentences whose words have not been decoded with the same model version are decoded
+	"""
+	instruments = instruments or instrumentation.DISABLED
+	if cache is not None:
+		keys = [(posterior, cache.key(sentence)) for sentence in sentence_list]
+		decoded = [cache.get(model, key) for key in keys]
+		# a sentence which occurs several times among the missing ones is decoded once
+		missing = collections.OrderedDict()
+		for key, result, sentence in zip(keys, decoded, sentence_list):
+			if result is None and not missing.has_key(key):
+				missing[key] = sentence
+		for key, result in zip(missing.keys(), decode_sentences(model, missing.values(), batch_size, instruments, posterior)):
+			missing[key] = result
+			cache.put(model, key, result)
+		return [result if result is not None else missing[key] for key, result in zip(keys, decoded)]
+	if batch_size is not None:
+		return batch.decode_batch(model, [fileparser.extract_words(sentence) for sentence in sentence_list], batch_size, instruments, posterior)
+	decoded = []
+	for sentence in sentence_list:
+		if posterior:
+			with instruments.stage('posterior', 1, len(sentence)):
+				(forward_p, backward_p, posteriors, tagger_sequence, confidences) = posterior_algorithm(aa, bb, cc, vv, sentence, model)
+			decoded.append((forward_p, backward_p, None, tagger_sequence, confidences))
+			continue
+		(forward_p, backward_p, p, tagger_sequence, posteriors) = analyze(model, sentence, instruments)
+		decoded.append((forward_p, backward_p, p, tagger_sequence))
+	return decoded
+
+def decode_stream(model, sentence_iter, batch_size=None, workers=None, chunksize=16, instruments=None, posterior=False, cache=None):
+	""" lazily decodes a stream of sentences and yields the pairs (sentence, (forward_p, backward_p, viterbi_p, tag_sequence)) in order
+		the sentences are decoded in chunks of chunksize sentences (see decode_sentences, also for posterior),
+		if workers is given the chunks are distributed over that many worker processes which share the model read-only (see parallel.WorkerPool),
+		then instruments records the time spent waiting for the workers as the decode stage instead of the stages of decode_sentences
+		and every worker keeps its own copy of the cache
+	"""
+	instruments = instruments or instrumentation.DISABLED
+	if workers is None:
+		for sentence_list in parallel.chunks(sentence_iter, chunksize):
+			for item in zip(sentence_list, decode_sentences(model, sentence_list, batch_size, instruments, posterior, cache)):
+				yield item
+		return
+	pool = parallel.WorkerPool(lambda model, sentence_list: zip(sentence_list, decode_sentences(model, sentence_list, batch_size, None, posterior, cache)), model, workers)
+	try:
+		for item in instruments.timed('decode', pool.imap(sentence_iter, chunksize), lambda (sentence, decoded): len(sentence)):
+			yield item
+	finally:
+		pool.close()
+
+class TestDecodeSentences(unittest.TestCase):
+	def test_word_ids(self):
+		# a model compiled from id counts decodes the id arrays of its symbol tables like the words they stand for
+		(words, tags) = (symbols.SymbolTable(), symbols.SymbolTable())
+		tagged = [['the/DT', 'dog/NN', 'barks/VBZ', './.'], ['a/DT', 'cat/NN', 'sleeps/VBZ', './.'], ['the/DT', 'old/JJ', 'cat/NN', 'barks/VBZ', './.']]
+		sentence_list = [(words.intern_all(map(fileparser.map_extract_word, sentence)), tags.intern_all(map(fileparser.map_extract_tag, sentence))) for sentence in tagged]
+		(transitions, emissions) = count_ids(sentence_list, len(words), len(tags))
+		model = hmmmodel.HMMModel.from_counts(tags, words, transitions, emissions)
+		sentences = [['a', 'old', 'dog', 'sleeps', '.'], ['the', 'puppy', 'barks', '.'], []]
+		ids = [words.intern_all(sentence) for sentence in sentences]
+		for posterior in (False, True):
+			for batch_size in (None, 2):
+				expected = decode_sentences(model, sentences, batch_size, posterior=posterior)
+				decoded = decode_sentences(model, ids, batch_size, posterior=posterior)
+				self.assertEqual([result[3] for result in expected], [result[3] for result in decoded])
+				self.assertTrue(numpy.allclose([result[:2] for result in expected], [result[:2] for result in decoded]))
+				if posterior:
+					self.assertTrue(numpy.allclose(sum([result[4] for result in expected], []), sum([list(result[4]) for result in decoded], [])))
+				self.assertEqual(['DT', 'JJ', 'NN', 'VBZ', '.'], expected[0][3])
+
+class TestForwardBackward(unittest.TestCase):
+	def test_expected_emissions(self):
+		# every time step emits its word once in expectation, spread over the states by their posteriors
+		(aa, bb, cc, vv) = ({}, {}, {}, set([]))
+		merge_counts(aa, bb, cc, vv, count_sentences([['the/DT', 'dog/NN', 'barks/VBZ', './.'], ['a/DT', 'old/JJ', 'cat/NN', 'sleeps/VBZ', './.'],
+			['the/DT', 'dog/NN', 'and/CC', 'the/DT', 'cat/NN', 'sleep/VBP', './.']]))
+		(a, b, c) = forward_backward(aa, bb, cc, vv, ['the/DT', 'old/JJ', 'dog/NN', 'and/CC', 'the/DT', 'cat/NN', 'sleeps/VBZ', './.'])
+		self.assertAlmostEqual(2.0, sum(b[s].get('the', 0.0) for s in b.iterkeys()))
+		# the last word is counted as well
+		self.assertAlmostEqual(1.0, b['.']['.'])
+		self.assertAlmostEqual(8.0, sum(c[s] for s in b.iterkeys()))
+		for s in b.iterkeys():
+			self.assertAlmostEqual(c[s], sum(b[s].values()))
+
+def run_penn(batch_size=None, workers=None, chunksize=16, model_path=None, suffix_model=False, instruments=None, posterior=False, cache_size=None):
+	""" trains the model on the training files and tags the test files, the files are parsed lazily one sentence at a time
+		if batch_size is given the sentences are decoded in batches of that size (see batch.decode_batch)
+		if workers is given the sentences are distributed in chunks of chunksize sentences over that many worker processes,
+		which share the trained model read-only (see parallel.WorkerPool). the output is the same as the one of the serial run
+		the training files are then counted by the workers as well (see train_files), which also return the sentences of sentences.txt
+		if model_path is given the trained model is saved to that file (see hmmmodel.HMMModel.save), and if the file exists already
+		the model is memory-mapped from it instead of training a new one
+		if suffix_model is True the unknown words are tagged with a suffix model trained on the rare training words (see unknownwords.SuffixModel)
+		the parse, train, compile, load, forward, backward and viterbi stages are recorded by instruments (see instrumentation.Instrumentation)
+		if posterior is True the test sentences are tagged by posterior decoding from their forward and backward tables (see posterior_algorithm),
+		viterbi.txt then holds the confidence of every tag instead of the probability of the tag sequence
+		if cache_size is given the results of the last cache_size distinct test sentences are cached, and a duplicate sentence is not decoded again
+		(see cache.DecodeCache)
+	"""
+	instruments = instruments or instrumentation.DISABLED
 	file_list = os.listdir(fileparser.resource_path)
-	# training
-	print('training...')
-	sentences_file = open('sentences.txt', 'w')
-	for file in file_list:
-		if file.startswith(fileparser.training_prefix):
-			training_file = open(fileparser.resource_path + file, 'r')
-			sentence_list = fileparser.parse(training_file)
-			sentences_file.write('%s\n' % (sentence_list, ))
-			train(aa, bb, cc, vv, sentence_list)
-	sentences_file.close()
-	a_file = open('a.txt', 'w')
-	util.prettywrite_nested_map(aa, a_file)
-	a_file.close()
-	b_file = open('b.txt', 'w')
-	util.prettywrite_nested_map(bb, b_file)
-	b_file.close()
-	c_file = open('c.txt', 'w')
-	util.prettywrite_map(cc, c_file)
-	c_file.close()
-	print('training done.')
+	training_paths = [fileparser.resource_path + file for file in file_list if file.startswith(fileparser.training_prefix)]
+	test_paths = [fileparser.resource_path + file for file in file_list if file.startswith(fileparser.test_prefix)]
+	if model_path is not None and os.path.exists(model_path):
+		print('loading model...')
+		with instruments.stage('load'):
+			model = hmmmodel.HMMModel.load(model_path)
+		print('model loaded.')
+	else:
+		# training
+		print('training...')
+		with instruments.stage('train'):
+			sentences_file = open('sentences.txt', 'w')
+			if workers is None:
+				for path in training_paths:
+					train(aa, bb, cc, vv, util.prettywrite_stream(instruments.timed('parse', fileparser.iter_parse(path)), sentences_file))
+			else:
+				train_files(aa, bb, cc, vv, training_paths, workers, sentences_file)
+			sentences_file.close()
+		a_file = open('a.txt', 'w')
+		util.prettywrite_nested_map(aa, a_file)
+		a_file.close()
+		b_file = open('b.txt', 'w')
+		util.prettywrite_nested_map(bb, b_file)
+		b_file.close()
+		c_file = open('c.txt', 'w')
+		util.prettywrite_map(cc, c_file)
+		c_file.close()
+		with instruments.stage('compile'):
+			model = hmmmodel.HMMModel(aa, bb, cc, vv, suffix_model)
+		if model_path is not None:
+			model.save(model_path)
+		print('training done.')
 	
-	# computing likelihood
+	# computing likelihood, most likely tag sequences and accuracy
 	print('computing likelihood...')
-	forward_file = open('forward.txt', 'w')
-	for file in file_list:
-		if file.startswith(fileparser.test_prefix):
-			training_file = open(fileparser.resource_path + file, 'r')
-			sentence_list = fileparser.parse(training_file)
-			for sentence in sentence_list:
-				(forward_p, forward_table) = forward_algorithm(aa, bb, cc, vv, sentence)
-				(backward_p, backward_table) = backward_algorithm(aa, bb, cc, vv, sentence)
-				forward_file.write('%s\n %s\n %s\n\n' % (sentence, forward_p, backward_p))
-	print('likelihood computed.')
-	forward_file.close()
-	
-	# computing most likely tag sequencesanc accuracy
 	print('computing most likely tag sequence and tagger accuracy...')
+	forward_file = open('forward.txt', 'w')
 	viterbi_file = open('viterbi.txt', 'w')
 	match_count = 0.0
 	total_count = 0.0
-	for file in file_list:
-		if file.startswith(fileparser.test_prefix):
-			training_file = open(fileparser.resource_path + file, 'r')
-			sentence_list = fileparser.parse(training_file)
-			for sentence in sentence_list:
-				(p, viterbi_table, viterbi_backpointer, tagger_sequence) = viterbi_algorithm(aa, bb, cc, vv, sentence)
-				human_sequence = map(fileparser.map_extract_tag, sentence)
-				# update tagger accuracy information
-				for i in range(min(len(human_sequence), len(tagger_sequence))): # because of underflow it is possible that the tag sequences are not equal in length...s
-					if tagger_sequence[i] == human_sequence[i]:
-						match_count = match_count + 1.0
-				total_count = total_count + max(len(human_sequence), len(tagger_sequence))
-				viterbi_file.write('%s\n%s\nProbability: %f\n\n' % (human_sequence, tagger_sequence, p))
+	decode_cache = cache.DecodeCache(cache_size) if cache_size is not None else None
+	for sentence, decoded in decode_stream(model, instruments.timed('parse', fileparser.iter_parse(test_paths)), batch_size, workers, chunksize, instruments, posterior, decode_cache):
+		(forward_p, backward_p, p, tagger_sequence) = decoded[:4]
+		forward_file.write('%s\n %s\n %s\n\n' % (sentence, forward_p, backward_p))
+		human_sequence = map(fileparser.map_extract_tag, sentence)
+		# update tagger accuracy information
+		for i in range(min(len(human_sequence), len(tagger_sequence))): # because of underflow it is possible that the tag sequences are not equal in length...s
+			if tagger_sequence[i] == human_sequence[i]:
+				match_count = match_count + 1.0
+		total_count = total_count + max(len(human_sequence), len(tagger_sequence))
+		if posterior:
+			viterbi_file.write('%s\n%s\nConfidences: %s\n\n' % (human_sequence, tagger_sequence, ' '.join('%.4f' % (confidence, ) for confidence in decoded[4])))
+		else:
+			viterbi_file.write('%s\n%s\nProbability: %f\n\n' % (human_sequence, tagger_sequence, p))
+	forward_file.close()
+	print('likelihood computed.')
 	print('most likely tag sequence computed.')
 	print('accuracy of tagger is: %f' % (match_count / total_count, ))
+	if decode_cache is not None and workers is None:
+		print('cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions, %(invalidations)d invalidations' % decode_cache.statistics())
 	viterbi_file.close()
 	return (aa, bb, cc)
 	
+def run_penn_ids(batch_size=64, workers=None, chunksize=16, suffix_model=False, instruments=None):
+	""" trains and tags like run_penn with the words and tags interned to ids when they are parsed (see symbols): the training files are counted
+		as id arrays (see count_ids), the model is compiled from the counts (see hmmmodel.HMMModel.from_counts) and the word id arrays of the
+		test sentences are decoded by decode_stream (batch_size, workers and chunksize as in run_penn). prints the tagger accuracy and the time of every stage
+	"""
+	file_list = os.listdir(fileparser.resource_path)
+	words = symbols.SymbolTable()
+	tags = symbols.SymbolTable()
+	start = time.time()
+	sentence_list = list(fileparser.iter_parse_ids([fileparser.resource_path + file for file in file_list if file.startswith(fileparser.training_prefix)], words, tags))
+	(transitions, emissions) = count_ids(sentence_list, len(words), len(tags))
+	model = hmmmodel.HMMModel.from_counts(tags, words, transitions, emissions, suffix_model)
+	print('training: %d sentences, %d words, %d tags in %.2fs' % (len(sentence_list), len(words), len(tags), time.time() - start))
+	start = time.time()
+	sentence_list = list(fileparser.iter_parse_ids([fileparser.resource_path + file for file in file_list if file.startswith(fileparser.test_prefix)], words, tags))
+	print('parsing the test files: %d sentences in %.2fs' % (len(sentence_list), time.time() - start))
+	start = time.time()
+	match_count = 0.0
+	total_count = 0.0
+	decoded_iter = decode_stream(model, (word_ids for word_ids, tag_ids in sentence_list), batch_size, workers, chunksize, instruments)
+	for (word_ids, tag_ids), (sentence, decoded) in itertools.izip(sentence_list, decoded_iter):
+		human_sequence = tags.decode(tag_ids)
+		tagger_sequence = decoded[3]
+		match_count += sum(1.0 for human_tag, tag in zip(human_sequence, tagger_sequence) if human_tag == tag)
+		total_count += max(len(human_sequence), len(tagger_sequence))
+	print('tagging: %.2fs' % (time.time() - start, ))
+	print('accuracy of tagger is: %f' % (match_count / total_count, ))
+	return model
+
+def benchmark_beam(settings=((None, None), (1, None), (2, None), (4, None), (8, None), (None, 5.0), (None, 10.0)), model_path=None):
+	""" decodes the test files with viterbi_algorithm once per (beam, threshold) setting and prints the tagger accuracy,
+		the share of sentences tagged like the exact search and the speed of every setting. (None, None) is the exact search
+		the model is loaded from model_path if it exists and trained on the training files otherwise
+	"""
+	file_list = os.listdir(fileparser.resource_path)
+	if model_path is not None and os.path.exists(model_path):
+		model = hmmmodel.HMMModel.load(model_path)
+	else:
+		train_files(aa, bb, cc, vv, [fileparser.resource_path + file for file in file_list if file.startswith(fileparser.training_prefix)])
+		model = hmmmodel.HMMModel(aa, bb, cc, vv)
+	sentence_list = list(fileparser.iter_parse([fileparser.resource_path + file for file in file_list if file.startswith(fileparser.test_prefix)]))
+	human_sequences = [map(fileparser.map_extract_tag, sentence) for sentence in sentence_list]
+	token_count = sum(len(sentence) for sentence in sentence_list)
+	exact_sequences = None
+	print('beam\tthreshold\taccuracy\texact\ttokens/s')
+	for beam, threshold in settings:
+		start = time.time()
+		tagger_sequences = [viterbi_algorithm(aa, bb, cc, vv, sentence, model, beam, threshold)[-1] for sentence in sentence_list]
+		elapsed = time.time() - start
+		if exact_sequences is None:
+			exact_sequences = [viterbi_algorithm(aa, bb, cc, vv, sentence, model)[-1] for sentence in sentence_list] if beam is not None or threshold is not None else tagger_sequences
+		match_count = sum(1.0 for human_sequence, tagger_sequence in zip(human_sequences, tagger_sequences) for human_tag, tag in zip(human_sequence, tagger_sequence) if human_tag == tag)
+		total_count = sum(max(len(human_sequence), len(tagger_sequence)) for human_sequence, tagger_sequence in zip(human_sequences, tagger_sequences))
+		exact_count = sum(1.0 for exact_sequence, tagger_sequence in zip(exact_sequences, tagger_sequences) if exact_sequence == tagger_sequence)
+		print('%s\t%s\t%f\t%f\t%.0f' % (beam, threshold, match_count / total_count, exact_count / len(sentence_list), token_count / elapsed))
+
 def run_custom(num_states):
 	# omputing new hmm model
 	print('computing new hmm...')
@@ -382,6 +745,10 @@ def run_custom(num_states):
 	print(viterbi_table)
 	
 if __name__ == '__main__':	
-	run_penn()
+	# TAGGER_INSTRUMENT=1 prints the time of every stage, TAGGER_PROFILE=viterbi profiles a stage (see instrumentation.Instrumentation.from_environment)
+	instruments = instrumentation.Instrumentation.from_environment()
+	if instruments is not None:
+		instruments.report_at_exit()
+	run_penn(instruments=instruments)
 #	run_custom(10)
 
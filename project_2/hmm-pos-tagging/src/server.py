@@ -0,0 +1,277 @@
+""" a long-running tagger process which loads a binary model once (see hmmmodel.HMMModel.save) and serves requests
+
+	the requests are json objects, one per line, with the words of a sentence and an optional id and operation:
+	  {"id": 1, "op": "tag", "words": ["The", "dog", "barks", "."]}
+	  {"id": 2, "op": "likelihood", "words": ["The", "dog", "barks", "."]}
+	  {"id": 3, "op": "update", "words": ["The", "dog", "barks", "."], "tags": ["DT", "NN", "VBZ", "."]}
+	  {"id": 4, "op": "nbest", "words": ["The", "dog", "barks", "."], "k": 5}
+	every request is answered by one json line with the same id, the viterbi tags and log probability (op "tag", the default),
+	the forward log likelihood (op "likelihood"), the number of words added to the model (op "update", a tagged sentence which is
+	added to the frequencies of the model, see hmmmodel.HMMModel.update) or the k most likely tag sequences with their log probabilities
+	(op "nbest", see nbest.py) and the latency of the request in milliseconds.
+	malformed requests and requests which cannot be decoded get an "error", a log probability of a sentence without any path of the model
+	(-infinity, which is not valid json) is null. every request is decoded with the updates of all requests which were submitted before it.
+	requests are read from stdin (answers in request order on stdout) and, with --port, from http POST bodies on localhost.
+	concurrent requests are collected for at most --max-delay seconds and decoded together as one batch (see batch.py)
+"""
+import sys
+import json
+import math
+import time
+import Queue
+import argparse
+import unittest
+import threading
+import BaseHTTPServer
+import SocketServer
+import batch
+import hmmmodel
+import nbest
+import program_fast
+
+OPERATIONS = ('tag', 'likelihood', 'nbest', 'update')
+
+def json_float(value):
+	""" returns a log probability as a float which json can represent, None (null) if it is not finite """
+	value = float(value)
+	return value if not (math.isinf(value) or math.isnan(value)) else None
+
+class Request(object):
+	""" a submitted request, wait blocks until the batcher has answered it """
+	def __init__(self, message):
+		self.message = message
+		self.submitted = time.time()
+		self.response = None
+		self.done = threading.Event()
+
+	def answer(self, response):
+		if self.message.has_key('id'):
+			response['id'] = self.message['id']
+		response['latency_ms'] = (time.time() - self.submitted)*1000.0
+		self.response = response
+		self.done.set()
+
+	def wait(self):
+		self.done.wait()
+		return self.response
+
+class MicroBatcher(object):
+	""" decodes the submitted requests in a background thread, the requests which arrive within max_delay seconds
+		of the first waiting one are decoded together (at most max_batch of them)
+	"""
+	def __init__(self, model, max_batch=64, max_delay=0.005):
+		self.model = model
+		self.max_batch = max_batch
+		self.max_delay = max_delay
+		self.queue = Queue.Queue()
+		thread = threading.Thread(target=self.run)
+		thread.daemon = True
+		thread.start()
+
+	def submit(self, line):
+		""" submits one json request line and returns the Request """
+		try:
+			message = json.loads(line)
+			if not isinstance(message, dict):
+				raise ValueError('a request has to be a json object')
+		except ValueError, error:
+			request = Request({})
+			request.answer({'error': str(error)})
+			return request
+		request = Request(message)
+		if not isinstance(message.get('words'), list) or not all(isinstance(word, basestring) for word in message['words']):
+			request.answer({'error': 'a request needs a list of string "words"'})
+		elif message.get('op', 'tag') not in OPERATIONS:
+			request.answer({'error': 'unknown op %r, expected one of %s' % (message['op'], ', '.join(OPERATIONS))})
+		elif message.get('op') == 'update' and (not isinstance(message.get('tags'), list) or len(message['tags']) != len(message['words'])
+				or not all(isinstance(tag, basestring) for tag in message['tags'])):
+			request.answer({'error': 'an update needs a list of string "tags" with one tag per word'})
+		elif message.get('op') == 'update' and any('/' in term for term in message['words'] + message['tags']):
+			request.answer({'error': 'the words and tags of an update must not contain "/"'})
+		elif message.get('op') == 'nbest' and (not isinstance(message.get('k'), int) or isinstance(message['k'], bool) or message['k'] < 1):
+			request.answer({'error': 'an nbest request needs a positive integer "k"'})
+		else:
+			# the model tables hold utf-8 encoded byte strings
+			request.words = [word.encode('utf-8') if isinstance(word, unicode) else word for word in message['words']]
+			if message.get('op') == 'update':
+				request.tags = [tag.encode('utf-8') if isinstance(tag, unicode) else tag for tag in message['tags']]
+			self.queue.put(request)
+		return request
+
+	def run(self):
+		while True:
+			requests = [self.queue.get()]
+			deadline = time.time() + self.max_delay
+			while len(requests) < self.max_batch:
+				try:
+					requests.append(self.queue.get(timeout=max(deadline - time.time(), 0.0)))
+				except Queue.Empty:
+					break
+			try:
+				self.process(requests)
+			except Exception, error:
+				for request in requests:
+					if not request.done.is_set():
+						request.answer({'error': 'decoding failed: %s' % (error, )})
+
+	def process(self, requests):
+		""" applies the updates among the requests in their order, the requests between two updates are decoded together
+			a request which fails is answered with an error, the other requests of its batch are decoded anyway (see decode_each)
+		"""
+		pending = []
+		for request in requests:
+			if request.message.get('op') != 'update':
+				pending.append(request)
+				continue
+			self.decode_each(pending)
+			pending = []
+			try:
+				# the terms of a tagged sentence are word/tag (see fileparser)
+				self.model.update(program_fast.count_sentences([['%s/%s' % term for term in zip(request.words, request.tags)]]))
+			except Exception, error:
+				request.answer({'error': 'update failed: %s' % (error, )})
+				continue
+			request.answer({'updated': len(request.words)})
+		self.decode_each(pending)
+
+	def decode_each(self, requests):
+		""" decodes the requests together, if that fails the unanswered ones are decoded one at a time so that only the failing ones get an error """
+		if len(requests) == 0:
+			return
+		try:
+			self.decode(requests)
+			return
+		except Exception:
+			pass
+		for request in requests:
+			if request.done.is_set():
+				continue
+			try:
+				self.decode([request])
+			except Exception, error:
+				request.answer({'error': 'decoding failed: %s' % (error, )})
+
+	def decode(self, requests):
+		model = self.model
+		for operation in ('tag', 'likelihood', 'nbest'):
+			group = [request for request in requests if request.message.get('op', 'tag') == operation]
+			for request in [request for request in group if len(request.words) == 0]:
+				empty = json_float(hmmmodel.log_array(model.empty_probability))
+				if operation == 'nbest':
+					request.answer({'nbest': [{'tags': [], 'probability': empty}]})
+				else:
+					request.answer({'tags': [], 'probability': empty} if operation == 'tag' else {'likelihood': empty})
+			group = [request for request in group if len(request.words) > 0]
+			if len(group) == 0:
+				continue
+			if operation == 'nbest':
+				# the k best paths are extracted per sentence from its own lattice
+				for request in group:
+					paths = nbest.nbest(model, model.emission_lattice(request.words), request.message['k'])
+					request.answer({'nbest': [{'tags': [model.states[s] for s in path], 'probability': json_float(probability)} for probability, path in paths]})
+				continue
+			(emissions, lengths) = batch.lattice(model, [request.words for request in group])
+			if operation == 'tag':
+				(probabilities, paths) = batch.viterbi_batch(model, emissions, lengths)
+				for request, probability, path in zip(group, probabilities, paths):
+					request.answer({'tags': [model.states[s] for s in path], 'probability': json_float(probability)})
+			else:
+				(likelihoods, forward) = batch.forward_batch(model, emissions, lengths)
+				for request, likelihood in zip(group, likelihoods):
+					request.answer({'likelihood': json_float(likelihood)})
+
+class TestMicroBatcher(unittest.TestCase):
+	def setUp(self):
+		(aa, bb, cc, vv) = ({}, {}, {}, set([]))
+		program_fast.merge_counts(aa, bb, cc, vv, program_fast.count_sentences([['the/DT', 'dog/NN', 'barks/VBZ', './.'], ['a/DT', 'cat/NN', 'sleeps/VBZ', './.']]))
+		self.batcher = MicroBatcher(hmmmodel.HMMModel(aa, bb, cc, vv, suffix_model=True))
+
+	def request(self, words, op='tag'):
+		request = Request({'op': op, 'words': words})
+		request.words = words
+		return request
+
+	def test_invalid_terms(self):
+		self.assertTrue(self.batcher.submit(json.dumps({'words': [1, 2]})).response.has_key('error'))
+		self.assertTrue(self.batcher.submit(json.dumps({'op': 'update', 'words': ['a'], 'tags': [None]})).response.has_key('error'))
+
+	def test_failing_request_in_batch(self):
+		(good, bad) = (self.request(['the', 'cat', 'barks', '.']), self.request([1, 2]))
+		self.batcher.process([good, bad])
+		self.assertEqual(['DT', 'NN', 'VBZ', '.'], good.response['tags'])
+		self.assertTrue(bad.response.has_key('error'))
+
+	def test_impossible_sentences(self):
+		requests = [self.request([]), self.request(['the', 'dog']), self.request(['the', 'dog'], 'likelihood'), self.request(['the'], 'nbest')]
+		self.batcher.process(requests)
+		for request in requests:
+			json.dumps(request.response, allow_nan=False)
+		self.assertEqual(None, requests[1].response['probability'])
+		self.assertEqual(None, requests[2].response['likelihood'])
+
+def serve_stdin(batcher, input, output):
+	""" answers newline-delimited json requests from input on output in the order of the requests,
+		the requests are submitted as soon as they are read, hence requests which arrive together are decoded together
+	"""
+	pending = Queue.Queue()
+	def write():
+		while True:
+			request = pending.get()
+			if request is None:
+				return
+			output.write(json.dumps(request.wait()) + '\n')
+			output.flush()
+	writer = threading.Thread(target=write)
+	writer.start()
+	for line in iter(input.readline, ''):
+		if line.strip():
+			pending.put(batcher.submit(line))
+	pending.put(None)
+	writer.join()
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	""" answers a POST body of newline-delimited json requests with one json line per request """
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers.getheader('content-length', 0)))
+		requests = [self.server.batcher.submit(line) for line in body.splitlines() if line.strip()]
+		response = ''.join(json.dumps(request.wait()) + '\n' for request in requests)
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/x-ndjson')
+		self.send_header('Content-Length', str(len(response)))
+		self.end_headers()
+		self.wfile.write(response)
+
+	def log_message(self, format, *args):
+		sys.stderr.write('%s - %s\n' % (self.address_string(), format % args))
+
+class HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+	def __init__(self, port, batcher):
+		BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), RequestHandler)
+		self.batcher = batcher
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='serves tagging and likelihood requests with a binary hmm model')
+	parser.add_argument('model', help='model file written by hmmmodel.HMMModel.save (e.g. by program_fast.run_penn(model_path=...))')
+	parser.add_argument('--port', type=int, help='also serve http POST requests on localhost:PORT')
+	parser.add_argument('--no-stdin', action='store_true', help='do not read requests from stdin')
+	parser.add_argument('--max-batch', type=int, default=64, help='maximum number of requests decoded together')
+	parser.add_argument('--max-delay', type=float, default=0.005, help='seconds to wait for further requests of a batch')
+	args = parser.parse_args(argv)
+	batcher = MicroBatcher(hmmmodel.HMMModel.load(args.model), args.max_batch, args.max_delay)
+	http = None
+	if args.port is not None:
+		http = HTTPServer(args.port, batcher)
+		thread = threading.Thread(target=http.serve_forever)
+		thread.daemon = True
+		thread.start()
+		sys.stderr.write('serving http on 127.0.0.1:%d\n' % (args.port, ))
+	if not args.no_stdin:
+		serve_stdin(batcher, sys.stdin, sys.stdout)
+	if http is not None:
+		while thread.is_alive():
+			thread.join(1.0)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
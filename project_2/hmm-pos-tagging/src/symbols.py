@@ -0,0 +1,44 @@
+""" symbol tables which intern the words and tags of a corpus to dense integer ids, in the order in which they are seen first
+	a corpus is parsed into int arrays once (see fileparser.iter_parse_ids), training counts the ids (see program_fast.count_ids)
+	and a model compiled from these counts (see hmmmodel.HMMModel.from_counts) numbers its states and words like the tables,
+	hence the decoders take the id arrays of the parser as they are
+"""
+import numpy
+
+class SymbolTable(object):
+	""" a bidirectional mapping between strings and the ids 0, 1, 2, ... """
+	def __init__(self, symbols=()):
+		self.symbols = []
+		self.index = {}
+		for symbol in symbols:
+			self.intern(symbol)
+
+	def intern(self, symbol):
+		""" returns the id of a symbol, a new symbol gets the next id """
+		id = self.index.get(symbol)
+		if id is None:
+			id = len(self.symbols)
+			self.index[symbol] = id
+			self.symbols.append(symbol)
+		return id
+
+	def intern_all(self, symbols):
+		""" returns the ids of a sequence of symbols as an int array """
+		return numpy.array([self.intern(symbol) for symbol in symbols], dtype=numpy.int32)
+
+	def lookup(self, symbol, default=None):
+		""" returns the id of a symbol without interning it """
+		return self.index.get(symbol, default)
+
+	def decode(self, ids):
+		""" returns the symbols of a sequence of ids """
+		return [self.symbols[id] for id in ids]
+
+	def __getitem__(self, id):
+		return self.symbols[id]
+
+	def __contains__(self, symbol):
+		return symbol in self.index
+
+	def __len__(self):
+		return len(self.symbols)
@@ -0,0 +1,185 @@
+""" a second order (trigram) hidden markov model tagger: the probability of a tag depends on the two previous tags
+	P(w | u, v) is smoothed by deleted interpolation of the trigram, bigram and unigram frequencies (see interpolation_weights),
+	the emissions are the laplace smoothed ones of the first order model (see hmmmodel.HMMModel). the viterbi algorithm runs over
+	the pairs (previous tag, tag) as states, only the pairs which occur in the training sentences are possible, hence a time step
+	expands the active pairs into their N successors instead of all N x N x N triples
+"""
+import os
+import time
+import itertools
+import unittest
+import numpy
+import fileparser
+import hmmmodel
+import program_fast
+
+neg_inf = float('-infinity')
+
+def count_trigrams(states, sentence_list):
+	""" returns the M x M x M frequencies of the tag triples (u, v, w) of the tagged sentences, M = N + 1. index 0 is START (as u and v)
+		and END (as w), tag i of states is index i + 1 like in hmmmodel.HMMModel.transition_counts. the tags of every sentence are
+		padded with two STARTs and one END
+	"""
+	index = dict((s, si + 1) for si, s in enumerate(states))
+	counts = numpy.zeros((len(states) + 1, ) * 3)
+	for sentence in sentence_list:
+		tags = [0, 0] + [index[fileparser.map_extract_tag(term)] for term in sentence] + [0]
+		for u, v, w in zip(tags, tags[1:], tags[2:]):
+			counts[u, v, w] += 1.0
+	return counts
+
+def ratio(numerator, denominator):
+	""" element-wise numerator / denominator, 0 where the denominator is not positive """
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		return numpy.where(denominator > 0, numerator / denominator, 0.0)
+
+def interpolation_weights(counts):
+	""" returns the weights (l1, l2, l3) of the unigram, bigram and trigram estimates found by deleted interpolation (Brants, TnT 2000):
+		every triple adds its frequency to the weight of the estimate which predicts it best once the triple itself is removed from the counts
+	"""
+	bigrams = counts.sum(axis=0)
+	unigrams = bigrams.sum(axis=0)
+	(u, v, w) = numpy.nonzero(counts)
+	frequencies = counts[u, v, w]
+	estimates = numpy.vstack((
+		ratio(unigrams[w] - 1.0, unigrams.sum() - 1.0),
+		ratio(bigrams[v, w] - 1.0, bigrams.sum(axis=1)[v] - 1.0),
+		ratio(frequencies - 1.0, counts.sum(axis=2)[u, v] - 1.0)))
+	weights = numpy.bincount(estimates.argmax(axis=0), weights=frequencies, minlength=3)
+	return weights / weights.sum()
+
+class TrigramModel(object):
+	""" a trigram tagger on top of a first order model (see hmmmodel.HMMModel) whose states and emissions it uses,
+		with the indices of count_trigrams:
+		  log_transitions[u][v][w] log(l1 P(w) + l2 P(w | v) + l3 P(w | u, v)), w = 0 is END
+		  pairs[u][v]              True if the tag pair (u, v) is followed by another tag or END in the training sentences
+	"""
+	def __init__(self, model, counts):
+		self.model = model
+		self.states = model.states
+		self.weights = interpolation_weights(counts)
+		bigrams = counts.sum(axis=0)
+		unigrams = bigrams.sum(axis=0)
+		probabilities = (self.weights[0] * ratio(unigrams, unigrams.sum()) +
+			self.weights[1] * ratio(bigrams, bigrams.sum(axis=1)[:, numpy.newaxis]) +
+			self.weights[2] * ratio(counts, counts.sum(axis=2)[:, :, numpy.newaxis]))
+		self.log_transitions = hmmmodel.log_array(probabilities)
+		self.pairs = counts.sum(axis=2) > 0
+
+def viterbi(model, sentence, beam=None, threshold=None):
+	""" returns the log probability and the most likely tag sequence of a sentence (list of words) under a TrigramModel
+		current[u][v] is the log probability of the best tag sequence up to t whose last two tags are u, v. only the possible pairs
+		(see TrigramModel.pairs) with a finite score are expanded, the pairs are grouped by v so that every successor pair (v, w) is one
+		maximization over the active u. if beam and/or threshold are given only the beam best pairs, or the pairs whose score is
+		at most threshold below the best one, are expanded (see program_fast.beam_states)
+	"""
+	M = len(model.states) + 1
+	T = len(sentence)
+	if T == 0:
+		return (float(model.log_transitions[0, 0, 0]), [])
+	emissions = model.model.emission_lattice(sentence)
+	# initialization step, the pairs (START, v)
+	current = numpy.empty((M, M))
+	current.fill(neg_inf)
+	current[0, 1:] = model.log_transitions[0, 0, 1:] + emissions[0]
+	current[~model.pairs] = neg_inf
+	backpointers = []
+	# recursion step
+	for t in range(1, T):
+		if beam is not None or threshold is not None:
+			active = numpy.sort(program_fast.beam_states(current.ravel(), beam, threshold))
+		else:
+			active = numpy.flatnonzero(current > neg_inf)
+		(u, v) = numpy.divmod(active, M)
+		order = numpy.argsort(v, kind='mergesort')
+		(u, v) = (u[order], v[order])
+		candidates = current[u, v][:, numpy.newaxis] + model.log_transitions[u, v, 1:]
+		starts = numpy.flatnonzero(numpy.r_[True, v[1:] != v[:-1]])
+		best = numpy.maximum.reduceat(candidates, starts, axis=0)
+		# the first (smallest) u of every group which reaches the maximum
+		edges = numpy.where(candidates == numpy.repeat(best, numpy.diff(numpy.append(starts, len(v))), axis=0), numpy.arange(len(v))[:, numpy.newaxis], len(v))
+		first = numpy.minimum.reduceat(edges, starts, axis=0)
+		current = numpy.empty((M, M))
+		current.fill(neg_inf)
+		current[v[starts], 1:] = best + emissions[t]
+		current[~model.pairs] = neg_inf
+		backpointer = numpy.zeros((M, M), dtype=int)
+		backpointer[v[starts], 1:] = u[first]
+		backpointers.append(backpointer)
+	# termination step
+	scores = current + model.log_transitions[:, :, 0]
+	(u, v) = numpy.unravel_index(scores.argmax(), scores.shape)
+	if scores[u, v] == neg_inf:
+		return (neg_inf, [])
+	# trace back
+	path = [v, u] if T > 1 else [v]
+	for backpointer in reversed(backpointers[1:]):
+		path.append(backpointer[path[-1], path[-2]])
+	path.reverse()
+	return (float(scores[u, v]), [model.states[s - 1] for s in path])
+
+class TestTrigram(unittest.TestCase):
+	sentences = [['the/DT', 'dog/NN', 'barks/VBZ', './.'], ['a/DT', 'old/JJ', 'cat/NN', 'sleeps/VBZ', './.'], ['dogs/NNS', 'bark/VBP', './.'],
+		['the/DT', 'cats/NNS', 'sleep/VBP', './.'], ['the/DT', 'dog/NN', 'sleeps/VBZ', './.'], ['cats/NNS', 'sleep/VBP', './.']]
+
+	def model(self):
+		(aa, bb, cc, vv) = ({}, {}, {}, set([]))
+		program_fast.merge_counts(aa, bb, cc, vv, program_fast.count_sentences(self.sentences))
+		model = hmmmodel.HMMModel(aa, bb, cc, vv)
+		return TrigramModel(model, count_trigrams(model.states, self.sentences))
+
+	def test_interpolation_weights(self):
+		weights = self.model().weights
+		self.assertEqual(3, len(weights))
+		self.assertAlmostEqual(1.0, weights.sum())
+		self.assertTrue((weights >= 0.0).all())
+
+	def test_brute_force(self):
+		model = self.model()
+		N = len(model.states)
+		for sentence in (['dog'], ['dogs', 'bark'], ['the', 'cat', 'sleeps'], ['the', 'old', 'dogs', '.'], ['the', 'puppy', 'sleeps', '.']):
+			emissions = model.model.emission_lattice(sentence)
+			best = (neg_inf, [])
+			for states in itertools.product(range(1, N + 1), repeat=len(sentence)):
+				# the tags padded like the ones of count_trigrams, every pair of consecutive tags has to be a possible one
+				tags = (0, 0) + states + (0, )
+				if not all(model.pairs[u, v] for u, v in zip(tags[1:], tags[2:-1])):
+					continue
+				score = sum(model.log_transitions[u, v, w] for u, v, w in zip(tags, tags[1:], tags[2:]))
+				score += sum(emissions[t, s - 1] for t, s in enumerate(states))
+				if score > best[0]:
+					best = (score, [model.states[s - 1] for s in states])
+			(probability, tags) = viterbi(model, sentence)
+			self.assertEqual(best[1], tags)
+			if best[0] > neg_inf:
+				self.assertAlmostEqual(best[0], probability)
+			else:
+				self.assertEqual(neg_inf, probability)
+
+def benchmark(settings=((None, None), (None, 10.0), (16, None)), workers=None):
+	""" trains a first order and a trigram model on the training files, tags the test files with the viterbi algorithm of both
+		and prints the tagger accuracy and the speed of the first order tagger and of the trigram tagger with every (beam, threshold) setting
+	"""
+	file_list = os.listdir(fileparser.resource_path)
+	training_paths = [fileparser.resource_path + file for file in file_list if file.startswith(fileparser.training_prefix)]
+	program_fast.train_files(program_fast.aa, program_fast.bb, program_fast.cc, program_fast.vv, training_paths, workers)
+	model = hmmmodel.HMMModel(program_fast.aa, program_fast.bb, program_fast.cc, program_fast.vv)
+	trigram_model = TrigramModel(model, count_trigrams(model.states, fileparser.iter_parse(training_paths)))
+	print('interpolation weights: %s, possible tag pairs: %d of %d' % (trigram_model.weights, trigram_model.pairs.sum(), trigram_model.pairs.size))
+	sentence_list = list(fileparser.iter_parse([fileparser.resource_path + file for file in file_list if file.startswith(fileparser.test_prefix)]))
+	human_sequences = [map(fileparser.map_extract_tag, sentence) for sentence in sentence_list]
+	word_sequences = [map(fileparser.map_extract_word, sentence) for sentence in sentence_list]
+	token_count = sum(len(sentence) for sentence in sentence_list)
+	taggers = [('bigram', None, None, lambda sentence, words, beam, threshold: program_fast.viterbi_algorithm(None, None, None, None, sentence, model)[-1])]
+	taggers += [('trigram', beam, threshold, lambda sentence, words, beam, threshold: viterbi(trigram_model, words, beam, threshold)[1]) for beam, threshold in settings]
+	print('tagger\tbeam\tthreshold\taccuracy\ttokens/s')
+	for name, beam, threshold, tagger in taggers:
+		start = time.time()
+		tagger_sequences = [tagger(sentence, words, beam, threshold) for sentence, words in zip(sentence_list, word_sequences)]
+		elapsed = time.time() - start
+		match_count = sum(1.0 for human_sequence, tagger_sequence in zip(human_sequences, tagger_sequences) for human_tag, tag in zip(human_sequence, tagger_sequence) if human_tag == tag)
+		total_count = sum(max(len(human_sequence), len(tagger_sequence)) for human_sequence, tagger_sequence in zip(human_sequences, tagger_sequences))
+		print('%s\t%s\t%s\t%f\t%.0f' % (name, beam, threshold, match_count / total_count, token_count / elapsed))
+
+if __name__ == '__main__':
+	benchmark()
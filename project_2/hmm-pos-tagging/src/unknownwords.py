@@ -0,0 +1,239 @@
+""" a suffix based model of the tags of unknown words (Brants, TnT 2000)
+	the tags of the rare words of the training text are counted per word class (see word_class) and suffix of up to max_length characters.
+	P(t | suffix) is smoothed by successive abstraction: the estimate of a suffix is interpolated with the one of the suffix which is one
+	character shorter, weighted by theta, the standard deviation of the tag probabilities P(t). the suffix tries of the word classes are
+	stored flat as one table of keys (word class + suffix) and the log ratios log P(t | suffix) - log P(t) of all keys are computed once
+	when the model is trained. a word is mapped to the key of its longest known suffix once per signature (word class + the last max_length
+	characters), hence tagging an unknown word is a dictionary lookup
+	the model keeps the frequencies it was trained on, so that the emissions of newly tagged sentences can be added (see SuffixModel.update):
+	the frequencies of the keys of the changed words are updated in place. P(t) and theta change with every emission, hence the ratios of all
+	keys, which are therefore computed lazily: the ratios of the key of an unknown word when the word is tagged, the table of all keys
+	(one vectorized step per suffix length) only when it is needed, e.g. to save the model
+"""
+import numpy
+import unittest
+
+neg_inf = float('-infinity')
+
+def word_class(word):
+	""" 'd' for words which contain a digit, 'c' for capitalized words and 'l' for all other words """
+	if any(character.isdigit() for character in word):
+		return 'd'
+	if word[:1].isupper():
+		return 'c'
+	return 'l'
+
+def suffix_keys(word, max_length):
+	""" returns the keys of a word: its word class followed by each of its suffixes of up to max_length characters, the shortest first """
+	prefix = word_class(word)
+	return [prefix + word[len(word) - length:] for length in range(min(max_length, len(word)) + 1)]
+
+class SuffixModel(object):
+	""" the log ratios log P(t | suffix) - log P(t) of the keys (word class + suffix) of the rare training words,
+		log_ratios[k][j] belongs to keys[k] and state j of the model which the suffix model was trained for
+		the training frequencies are the total frequency of every word (frequencies), the tag frequencies of the rare words (rare) and
+		of all words (totals). they are None if the model was created from its ratios only, such a model cannot be updated
+		after an update keys, log_ratios and key_index are stale: a word is looked up in the key frequencies and the ratios of its key
+		are computed when they are needed first (see _probability), the table of all keys is only rebuilt when it is accessed
+	"""
+	def __init__(self, keys, log_ratios, max_length, frequencies=None, rare=None, totals=None, max_frequency=10):
+		self._keys = list(keys)
+		self._log_ratios = numpy.asarray(log_ratios, dtype=float)
+		self._key_index = dict((key, k) for k, key in enumerate(self._keys))
+		self.max_length = max_length
+		self._signatures = {}
+		self.frequencies = frequencies
+		self.rare = rare
+		self.totals = totals
+		self.max_frequency = max_frequency
+		# key -> [tag frequencies, number of rare words], built from rare when it is needed first (see _key_counts)
+		self._counts = None
+		# set by update, the table of the keys does not include the updated frequencies. key -> P(t | key) of the keys computed since
+		self._stale = False
+		self._probabilities = {}
+
+	@property
+	def keys(self):
+		self._refresh()
+		return self._keys
+
+	@property
+	def log_ratios(self):
+		self._refresh()
+		return self._log_ratios
+
+	@property
+	def key_index(self):
+		self._refresh()
+		return self._key_index
+
+	@classmethod
+	def train(cls, states, emission_map, max_frequency=10, max_length=10):
+		""" trains the suffix model on the emission frequencies (tag -> word -> frequency) of the words which occur at most max_frequency times """
+		state_index = dict((s, si) for si, s in enumerate(states))
+		words = sorted(set(word for tag in emission_map.keys() for word in emission_map[tag].iterkeys()))
+		word_index = dict((word, wi) for wi, word in enumerate(words))
+		emission_counts = numpy.zeros((len(words), len(states)))
+		for tag in emission_map.keys():
+			for word, count in emission_map[tag].iteritems():
+				emission_counts[word_index[word], state_index[tag]] = count
+		return cls.from_counts(words, emission_counts, max_frequency, max_length)
+
+	@classmethod
+	def from_counts(cls, words, emission_counts, max_frequency=10, max_length=10):
+		""" trains the suffix model on the W x N emission frequencies of words[w] in state j of the words which occur at most max_frequency times """
+		frequencies = emission_counts.sum(axis=1)
+		rare = dict((words[wi], numpy.array(emission_counts[wi], dtype=float)) for wi in numpy.flatnonzero(frequencies <= max_frequency))
+		model = cls([], numpy.zeros((0, emission_counts.shape[1])), max_length, dict(zip(words, frequencies)), rare,
+			numpy.array(emission_counts.sum(axis=0), dtype=float), max_frequency)
+		model._key_counts()
+		model._stale = True
+		model._refresh()
+		return model
+
+	def _key_counts(self):
+		""" returns the tag frequencies and the number of rare words of every key, key -> [frequencies, words] """
+		if self._counts is None:
+			self._counts = {}
+			for word, counts in self.rare.iteritems():
+				self._count(word, counts, 1)
+		return self._counts
+
+	def _count(self, word, counts, sign):
+		""" adds (sign 1) or removes (sign -1) the tag frequencies of a rare word to or from the frequencies of its keys """
+		for key in suffix_keys(word, self.max_length):
+			if not self._counts.has_key(key):
+				self._counts[key] = [numpy.zeros(len(counts)), 0]
+				self._signatures = {} # the longest known suffix of a word may change
+			entry = self._counts[key]
+			entry[0] += sign * counts
+			entry[1] += sign
+			if entry[1] == 0:
+				del self._counts[key]
+				self._signatures = {}
+
+	def _prior(self):
+		""" returns P(t) and theta, the standard deviation of P(t) """
+		p = self.totals / self.totals.sum()
+		return (p, p.std(ddof=1))
+
+	def _probability(self, key):
+		""" returns P(t | key) of a known key computed from the key frequencies, by successive abstraction from the shorter keys """
+		if not self._probabilities.has_key(key):
+			(p, theta) = self._prior()
+			shorter = self._probability(key[0] + key[2:]) if len(key) > 1 else p
+			counts = self._counts[key][0]
+			self._probabilities[key] = (counts / counts.sum() + theta * shorter) / (1.0 + theta)
+		return self._probabilities[key]
+
+	def _refresh(self):
+		""" rebuilds the table of the keys and their log ratios from the key frequencies if it is stale, the keys of one length at a time """
+		if not self._stale:
+			return
+		counts = self._counts
+		(p, theta) = self._prior()
+		# successive abstraction, the key of the shorter suffix (or of the word class) comes first
+		keys = sorted(counts.keys(), key=len)
+		key_index = dict((key, k) for k, key in enumerate(keys))
+		frequencies = numpy.array([counts[key][0] for key in keys]).reshape(len(keys), len(p))
+		probabilities = numpy.empty(frequencies.shape)
+		lengths = numpy.array([len(key) for key in keys], dtype=int)
+		for length in range(1, lengths.max() + 1 if len(keys) > 0 else 1):
+			(first, last) = numpy.searchsorted(lengths, [length, length + 1])
+			shorter = p if length == 1 else probabilities[[key_index[key[0] + key[2:]] for key in keys[first:last]]]
+			probabilities[first:last] = (frequencies[first:last] / frequencies[first:last].sum(axis=1)[:, numpy.newaxis] + theta * shorter) / (1.0 + theta)
+		self._keys = keys
+		self._key_index = key_index
+		self._log_ratios = self._log_ratio(probabilities, p)
+		self._stale = False
+		self._probabilities = {}
+
+	def _log_ratio(self, probabilities, p):
+		with numpy.errstate(divide='ignore', invalid='ignore'):
+			log_ratios = numpy.log(probabilities) - numpy.log(p)
+		log_ratios[numpy.isnan(log_ratios)] = neg_inf # states which never emit anything
+		return log_ratios
+
+	def update(self, emissions):
+		""" adds emission frequencies, a list of (state id, word, frequency), to the training frequencies,
+			the result is the model which from_counts trains on the frequencies of all emissions. a word which occurs more than
+			max_frequency times is not rare anymore and its frequencies are removed from its keys. only the frequencies of the keys
+			of the updated words change, the ratios are recomputed when they are needed (see _probability and _refresh)
+		"""
+		if self.frequencies is None:
+			raise ValueError('the suffix model has no training frequencies, it cannot be updated')
+		self._key_counts()
+		words = {}
+		for si, word, frequency in emissions:
+			if not words.has_key(word):
+				words[word] = numpy.zeros(len(self.totals))
+			words[word][si] += frequency
+		for word, added in words.iteritems():
+			self.totals += added
+			self.frequencies[word] = self.frequencies.get(word, 0.0) + added.sum()
+			previous = self.rare.pop(word, None)
+			if previous is not None:
+				self._count(word, previous, -1)
+			if self.frequencies[word] <= self.max_frequency:
+				self.rare[word] = added if previous is None else previous + added
+				self._count(word, self.rare[word], 1)
+		# P(t) and theta change with every emission, hence the ratios of all keys
+		self._stale = True
+		self._probabilities = {}
+
+	def _known(self, key):
+		return self._counts.has_key(key) if self._stale else self._key_index.has_key(key)
+
+	def key(self, word):
+		""" returns the key of the longest known suffix of a word, or None if its word class has no rare words """
+		signature = word_class(word) + word[-self.max_length:]
+		if not self._signatures.has_key(signature):
+			self._signatures[signature] = None
+			for length in range(len(signature) - 1, -1, -1):
+				if self._known(signature[0] + signature[len(signature) - length:]):
+					self._signatures[signature] = signature[0] + signature[len(signature) - length:]
+					break
+		return self._signatures[signature]
+
+	def log_ratio(self, word):
+		""" returns log P(t | suffix) - log P(t) of all states for the longest known suffix of a word (0 if there is none) """
+		key = self.key(word)
+		if key is None:
+			return numpy.zeros(len(self.totals) if self._stale else self._log_ratios.shape[1])
+		if self._stale:
+			return self._log_ratio(self._probability(key), self._prior()[0])
+		return self._log_ratios[self._key_index[key]]
+
+	def padded(self, state_count):
+		""" returns the suffix model for a model with state_count states, the ratios and the frequencies of the new states are 0 """
+		if self.frequencies is None:
+			return SuffixModel(self.keys, numpy.pad(self.log_ratios, ((0, 0), (0, state_count - self.log_ratios.shape[1])), 'constant'), self.max_length)
+		n = state_count - len(self.totals)
+		model = SuffixModel([], numpy.zeros((0, state_count)), self.max_length, self.frequencies,
+			dict((word, numpy.append(counts, numpy.zeros(n))) for word, counts in self.rare.iteritems()), numpy.append(self.totals, numpy.zeros(n)), self.max_frequency)
+		model._counts = dict((key, [numpy.append(counts, numpy.zeros(n)), words]) for key, (counts, words) in self._key_counts().iteritems())
+		model._stale = True
+		return model
+
+class TestSuffixModel(unittest.TestCase):
+	words = ['walked', 'talked', 'Walker', 'runs', '1990s', 'cats']
+
+	def assertEqualModels(self, expected, model):
+		self.assertEqual(sorted(expected.keys), sorted(model.keys))
+		for key, log_ratios in zip(expected.keys, expected.log_ratios):
+			self.assertTrue(numpy.allclose(log_ratios, model.log_ratios[model.key_index[key]]), key)
+
+	def test_update(self):
+		counts = numpy.array([[2, 0], [1, 1], [0, 1], [0, 3], [1, 0], [0, 2]], dtype=float)
+		added = numpy.array([[1, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 1]], dtype=float)
+		# 'walked' and 'cats' are not rare anymore after the update
+		model = SuffixModel.from_counts(self.words, counts, max_frequency=2)
+		model.update([(si, self.words[wi], added[wi, si]) for wi, si in zip(*numpy.nonzero(added))] + [(1, 'jumped', 1.0)])
+		expected = SuffixModel.from_counts(self.words + ['jumped'], numpy.vstack([counts + added, [[0, 1]]]), max_frequency=2)
+		# the ratios of single words are computed before the table of all keys is rebuilt
+		for word in ('walked', 'jumped', 'hopped', 'Walks', '1980s', 'x'):
+			self.assertEqual(expected.key(word), model.key(word))
+			self.assertTrue(numpy.allclose(expected.log_ratio(word), model.log_ratio(word)), word)
+		self.assertEqualModels(expected, model)
+		self.assertFalse(model.rare.has_key('walked'))
+		self.assertRaises(ValueError, SuffixModel(model.keys, model.log_ratios, model.max_length).update, [])
@@ -23,3 +23,14 @@ def prettywrite_nested_map(map, file):
 		file.write('  key\tvalue\n')
 		for y in map[x].keys():
 			file.write('  ' + str(y) + '\t' + str(map[x][y]) + '\n')
+
+
+def prettywrite_stream(iterable, file):
+	""" passes the items of an iterable through and writes them to the file in the same format as file.write('%s\n' % (list(iterable), )) """
+	file.write('[')
+	for i, item in enumerate(iterable):
+		if i > 0:
+			file.write(', ')
+		file.write('%r' % (item, ))
+		yield item
+	file.write(']\n')